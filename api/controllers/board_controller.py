@@ -1,20 +1,251 @@
-import json
+import functools
+import hashlib
+import os
+import re
+import threading
+import time
+import zipfile
+from concurrent.futures import as_completed
 from pathlib import Path
+from typing import Iterator
 from django.conf import settings
-from ..storage import JSONTable
+from ..storage import open_table
 from ..exceptions import BadRequest, NotFound, Conflict
-from .utils import now_iso, new_id, ALLOWED_TASK_STATUS
+from ..response_cache import cached
+from ..storage_formats import dumps_json
+from .. import export_jobs, metrics
+from .utils import now_iso, new_id, ALLOWED_TASK_STATUS, ListQuery, rows_by_id, string_api
 
 # Import base interface from project root
 from project_board_base import ProjectBoardBase
 
-USERS = JSONTable('users.json')
-TEAMS = JSONTable('teams.json')
-BOARDS = JSONTable('boards.json')
+USERS = open_table('users')
+TEAMS = open_table('teams')
+BOARDS = open_table('boards')
+
+def _new_task(data: dict, titles: set) -> dict:
+    """Validate an add_task payload against the board's lowercased task ``titles`` and build the task."""
+    title = (data.get('title') or '').strip()
+    desc = (data.get('description') or '').strip()
+    uid = data.get('user_id')
+    if not title:
+        raise BadRequest('title is required')
+    if len(title) > 64:
+        raise BadRequest('title max 64 chars')
+    if len(desc) > 128:
+        raise BadRequest('description max 128 chars')
+    if not uid or not USERS.get_by_id(uid):
+        raise BadRequest('valid user_id is required')
+    if title.lower() in titles:
+        raise Conflict('task title must be unique for the board')
+    return {
+        'id': new_id('task'),
+        'title': title,
+        'description': desc,
+        'user_id': uid,
+        'status': 'OPEN',
+        'creation_time': data.get('creation_time') or now_iso(),
+    }
+
+
+EXPORT_PROGRESS_EVERY = 500
+EXPORT_BUFFER = 64 * 1024
+# Characters of a board or team name kept in export file names
+EXPORT_NAME_MAX = 100
+# board id -> (fingerprint, out_file) of its last export in this process
+_last_export: dict = {}
+_last_export_lock = threading.Lock()
+
+
+def _export_source(bid: str) -> tuple:
+    """Return ``(board, team name, {user id: assignee name})`` for an export.
+
+    Only the board's assignees are looked up, one indexed lookup each.
+    """
+    b = BOARDS.get_by_id(bid)
+    if not b:
+        raise NotFound('board not found')
+    team = TEAMS.get_by_id(b['team_id'])
+    team_name = team['name'] if team else b['team_id']
+    return b, team_name, _assignee_names([b])
+
+
+def _assignee_names(boards: list) -> dict:
+    """Map the assignees of ``boards``' tasks to display names.
+
+    Only the assignees are looked up (see ``rows_by_id``); an assignee
+    without a user row or display name keeps their id.
+    """
+    wanted = {t['user_id'] for b in boards for t in b.get('tasks', [])}
+    names = {uid: uid for uid in wanted}
+    for uid, u in rows_by_id(USERS, wanted).items():
+        if u.get('display_name'):
+            names[uid] = u['display_name']
+    return names
+
+
+def _export_lines(b: dict, team_name: str, assignees: dict, progress=None) -> Iterator[str]:
+    """Yield the lines of a board's text report, without line endings."""
+    yield f"Board: {b['name']}"
+    yield f"Description: {b.get('description', '')}"
+    yield f"Team: {team_name}"
+    yield f"Status: {b.get('status')}"
+    yield f"Created: {b.get('creation_time')}"
+    yield f"Ended: {b.get('end_time')}"
+    yield ""
+    yield "Tasks:"
+    tasks = b.get('tasks', [])
+    if not tasks:
+        yield "  (no tasks)"
+    for i, t in enumerate(tasks, 1):
+        yield f"  {i}. {t['title']} [{t['status']}] — {assignees[t['user_id']]}"
+        if t.get('description'):
+            yield f"     {t['description']}"
+        if progress and i % EXPORT_PROGRESS_EVERY == 0:
+            progress(i, len(tasks))
+
+
+def _safe_name(name: str) -> str:
+    # Names end up in paths and in Content-Disposition headers.
+    return re.sub(r'[^A-Za-z0-9_-]', '_', name)[:EXPORT_NAME_MAX]
+
+
+def _export_file_name(b: dict) -> str:
+    return f"{_safe_name(b['name'])}_{b['id']}.txt"
+
+
+def _export_fingerprint(b: dict, team_name: str, assignees: dict) -> str:
+    """Hash of everything a board's report is rendered from, one task at a time."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(dumps_json([{k: v for k, v in b.items() if k != 'tasks'}, team_name, sorted(assignees.items())]))
+    for t in b.get('tasks', []):
+        h.update(dumps_json(t))
+    return h.hexdigest()
+
+
+def _timed_export(kind: str):
+    """Report the duration of each completed call to ``metrics.export_finished``."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            result = fn(*args, **kwargs)
+            metrics.export_finished(kind, time.perf_counter() - start)
+            return result
+        return wrapper
+    return decorate
+
+
+@_timed_export('board')
+def _export_board(bid: str, progress=None) -> tuple:
+    """Write the text report of board ``bid`` to ``out/``.
+
+    Returns ``(file name, reused)``. When the board, its team name and its
+    assignees' names are unchanged since the last export of the board by
+    this process and the file is still there, it is not written again and
+    ``reused`` is True. ``progress(done, total)`` is called as tasks are
+    rendered.
+
+    Lines are written through a buffered file as they are rendered, to a
+    temporary file that replaces the report once complete.
+    """
+    return _write_export(*_export_source(bid), progress)
+
+
+def _write_export(b: dict, team_name: str, assignees: dict, progress=None) -> tuple:
+    total = len(b.get('tasks', []))
+    out_dir = Path(settings.BASE_DIR) / 'out'
+    fname = _export_file_name(b)
+    fingerprint = _export_fingerprint(b, team_name, assignees)
+    with _last_export_lock:
+        last = _last_export.get(b['id'])
+    if last == (fingerprint, fname) and (out_dir / fname).exists():
+        if progress:
+            progress(total, total)
+        return fname, True
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    tmp = out_dir / f'.{fname}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        with open(tmp, 'w', encoding='utf-8', buffering=EXPORT_BUFFER) as f:
+            for n, line in enumerate(_export_lines(b, team_name, assignees, progress)):
+                if n:
+                    f.write('\n')
+                f.write(line)
+        os.replace(tmp, out_dir / fname)
+    finally:
+        tmp.unlink(missing_ok=True)
+    with _last_export_lock:
+        _last_export[b['id']] = (fingerprint, fname)
+    if progress:
+        progress(total, total)
+    return fname, False
+
+
+@_timed_export('team')
+def _export_team(tid: str, as_zip: bool = False, progress=None) -> dict:
+    """Export every board of team ``tid`` to ``out/``, rendering boards in parallel.
+
+    The team, its boards and their assignees are read once up front; the
+    boards are then rendered on ``export_jobs.render_pool()``, shared by all
+    team exports of the process. Writes one report
+    per board (unchanged boards are reused as in ``_export_board``), or
+    with ``as_zip`` a single ``<team>_<id>.zip`` holding all of them.
+    Returns ``{"out_files": [...], "reused": <boards left unchanged>}``
+    or ``{"out_file": <zip name>, "boards": n}``.
+    """
+    team = TEAMS.get_by_id(tid)
+    if not team:
+        raise NotFound('team not found')
+    boards = BOARDS.find('team', tid)
+    assignees = _assignee_names(boards)
+    total = len(boards)
+    done = 0
+    if progress:
+        progress(done, total)
+    out_dir = Path(settings.BASE_DIR) / 'out'
+    out_dir.mkdir(parents=True, exist_ok=True)
+    pool = export_jobs.render_pool()
+    if not as_zip:
+        futures = [pool.submit(_write_export, b, team['name'], assignees) for b in boards]
+        files = []
+        try:
+            for future in as_completed(futures):
+                files.append(future.result())
+                done += 1
+                if progress:
+                    progress(done, total)
+        finally:
+            # After a failure, leave the shared pool to the other exports.
+            for future in futures:
+                future.cancel()
+        return {'out_files': sorted(f for f, _ in files), 'reused': sum(r for _, r in files)}
+
+    def render(b):
+        text = '\n'.join(_export_lines(b, team['name'], assignees))
+        return _export_file_name(b), text.encode('utf-8')
+
+    fname = f"{_safe_name(team['name'])}_{tid}.zip"
+    tmp = out_dir / f'.{fname}.{os.getpid()}.{threading.get_ident()}.tmp'
+    futures = [pool.submit(render, b) for b in boards]
+    try:
+        with zipfile.ZipFile(tmp, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+            for future in as_completed(futures):
+                name, data = future.result()
+                zf.writestr(name, data)
+                done += 1
+                if progress:
+                    progress(done, total)
+        os.replace(tmp, out_dir / fname)
+    finally:
+        for future in futures:
+            future.cancel()
+        tmp.unlink(missing_ok=True)
+    return {'out_file': fname, 'boards': total}
+
 
 class BoardController(ProjectBoardBase):
-    def create_board(self, request: str):
-        data = json.loads(request or '{}')
+    def create_board_dict(self, data: dict) -> dict:
         name = (data.get('name') or '').strip()
         desc = (data.get('description') or '').strip()
         team_id = data.get('team_id')
@@ -28,141 +259,211 @@ class BoardController(ProjectBoardBase):
             raise BadRequest('team_id is required')
         if not TEAMS.get_by_id(team_id):
             raise BadRequest('team does not exist')
-        # unique per team
-        for b in BOARDS.read():
-            if b['team_id'] == team_id and b['name'].lower() == name.lower():
+        with BOARDS.transaction() as tx:
+            # unique per team
+            if tx.find_one('team_name', (team_id, name.lower())):
                 raise Conflict('board name must be unique for the team')
-        board = {
-            'id': new_id('board'),
-            'name': name,
-            'description': desc,
-            'team_id': team_id,
-            'status': 'OPEN',
-            'creation_time': data.get('creation_time') or now_iso(),
-            'end_time': None,
-            'tasks': [],
-        }
-        BOARDS.upsert(board)
-        return json.dumps({'id': board['id']})
-
-    def close_board(self, request: str) -> str:
-        data = json.loads(request or '{}')
+            board = {
+                'id': new_id('board'),
+                'name': name,
+                'description': desc,
+                'team_id': team_id,
+                'status': 'OPEN',
+                'creation_time': data.get('creation_time') or now_iso(),
+                'end_time': None,
+                'tasks': [],
+            }
+            tx.upsert(board)
+        return {'id': board['id']}
+
+    def close_board_dict(self, data: dict) -> dict:
         bid = data.get('id')
         if not bid:
             raise BadRequest('id is required')
-        b = BOARDS.get_by_id(bid)
-        if not b:
-            raise NotFound('board not found')
-        if any(t.get('status') != 'COMPLETE' for t in b.get('tasks', [])):
-            raise BadRequest('all tasks must be COMPLETE to close the board')
-        b['status'] = 'CLOSED'
-        b['end_time'] = now_iso()
-        BOARDS.upsert(b)
-        return json.dumps({'ok': True})
-
-    def add_task(self, request: str) -> str:
-        data = json.loads(request or '{}')
+        with BOARDS.transaction() as tx:
+            b = tx.get(bid)
+            if not b:
+                raise NotFound('board not found')
+            if any(t.get('status') != 'COMPLETE' for t in b.get('tasks', [])):
+                raise BadRequest('all tasks must be COMPLETE to close the board')
+            b['status'] = 'CLOSED'
+            b['end_time'] = now_iso()
+            tx.upsert(b)
+        return {'ok': True}
+
+    def add_task_dict(self, data: dict) -> dict:
         bid = data.get('board_id')  # include board_id in request to target a board
-        title = (data.get('title') or '').strip()
-        desc = (data.get('description') or '').strip()
-        uid = data.get('user_id')
         if not bid:
             raise BadRequest('board_id is required')
-        b = BOARDS.get_by_id(bid)
-        if not b:
-            raise NotFound('board not found')
-        if b.get('status') != 'OPEN':
-            raise BadRequest('can only add tasks to an OPEN board')
-        if not title:
-            raise BadRequest('title is required')
-        if len(title) > 64:
-            raise BadRequest('title max 64 chars')
-        if len(desc) > 128:
-            raise BadRequest('description max 128 chars')
-        if not uid or not USERS.get_by_id(uid):
-            raise BadRequest('valid user_id is required')
-        for t in b.get('tasks', []):
-            if t['title'].lower() == title.lower():
-                raise Conflict('task title must be unique for the board')
-        task = {
-            'id': new_id('task'),
-            'title': title,
-            'description': desc,
-            'user_id': uid,
-            'status': 'OPEN',
-            'creation_time': data.get('creation_time') or now_iso(),
-        }
-        b['tasks'].append(task)
-        BOARDS.upsert(b)
-        return json.dumps({'id': task['id']})
-
-    def update_task_status(self, request: str):
-        data = json.loads(request or '{}')
+
+        # Submitted rather than run in its own transaction so that bursts of
+        # task writes can share one commit (see STORAGE_GROUP_COMMIT_MS).
+        def add(tx):
+            b = tx.get(bid)
+            if not b:
+                raise NotFound('board not found')
+            if b.get('status') != 'OPEN':
+                raise BadRequest('can only add tasks to an OPEN board')
+            task = _new_task(data, {t['title'].lower() for t in b.get('tasks', [])})
+            b['tasks'].append(task)
+            tx.upsert(b)
+            return task['id']
+
+        return {'id': BOARDS.submit(add)}
+
+    def add_tasks_dict(self, data: dict) -> dict:
+        """Add many tasks to one board in one write.
+
+        Every item is validated like ``add_task``; valid items are added and
+        the rest are skipped. Returns ``{"results": [...]}`` with one
+        ``{"id": ...}`` or ``{"error": ...}`` per item, in request order.
+        """
+        bid = data.get('board_id')
+        items = data.get('tasks')
+        if not bid:
+            raise BadRequest('board_id is required')
+        if not isinstance(items, list):
+            raise BadRequest('tasks must be a list')
+
+        def add_all(tx):
+            b = tx.get(bid)
+            if not b:
+                raise NotFound('board not found')
+            if b.get('status') != 'OPEN':
+                raise BadRequest('can only add tasks to an OPEN board')
+            titles = {t['title'].lower() for t in b.get('tasks', [])}
+            results = []
+            added = False
+            for item in items:
+                try:
+                    if not isinstance(item, dict):
+                        raise BadRequest('each task must be an object')
+                    task = _new_task(item, titles)
+                except (BadRequest, Conflict) as e:
+                    results.append({'error': str(e)})
+                    continue
+                titles.add(task['title'].lower())
+                b['tasks'].append(task)
+                results.append({'id': task['id']})
+                added = True
+            if added:
+                tx.upsert(b)
+            return results
+
+        return {'results': BOARDS.submit(add_all)}
+
+    def update_task_status_dict(self, data: dict) -> dict:
         tid = data.get('id')
         status = data.get('status')
         if not tid or not status:
             raise BadRequest('id and status are required')
         if status not in ALLOWED_TASK_STATUS:
             raise BadRequest('invalid status')
-        boards = BOARDS.read()
-        updated = False
-        for b in boards:
-            for t in b.get('tasks', []):
+
+        def set_status(tx):
+            owner = tx.find_one('task', tid)
+            if not owner:
+                raise NotFound('task not found')
+            b = tx.get(owner['id'])
+            for t in b['tasks']:
                 if t['id'] == tid:
                     t['status'] = status
-                    updated = True
                     break
-            if updated:
-                break
-        if not updated:
-            raise NotFound('task not found')
-        BOARDS.write(boards)
-        return json.dumps({'ok': True})
-
-    def list_boards(self, request: str) -> str:
-        data = json.loads(request or '{}')
+            tx.upsert(b)
+
+        BOARDS.submit(set_status)
+        metrics.task_status_updated(status)
+        return {'ok': True}
+
+    @cached('boards')
+    def list_boards_dict(self, data: dict) -> list | dict:
         team_id = data.get('id')
         if not team_id:
             raise BadRequest('team id is required')
-        out = [
-            {'id': b['id'], 'name': b['name']}
-            for b in BOARDS.read()
-            if b['team_id'] == team_id and b.get('status') == 'OPEN'
-        ]
-        return json.dumps(out)
-
-    def export_board(self, request: str) -> str:
-        data = json.loads(request or '{}')
+        # Optional paging, prefix and field options; see ListQuery.
+        query = ListQuery(data, ('id', 'name'))
+        boards = query.fetch(
+            BOARDS, 'open_name', scope=(team_id,),
+            # The sharded backend answers this from its manifest and only
+            # opens the shards of open boards.
+            everything=lambda: BOARDS.find('open_team', team_id),
+        )
+        out = [{'id': b['id'], 'name': b['name']} for b in boards]
+        return query.result(out)
+
+    def export_board_dict(self, data: dict) -> dict:
+        bid = data.get('id')
+        if not bid:
+            raise BadRequest('id is required')
+        fname, _ = _export_board(bid)
+        return {'out_file': fname}
+
+    def export_team_dict(self, data: dict) -> dict:
+        """Export all boards of team ``id``; ``zip`` puts them in one archive."""
+        tid = data.get('id')
+        if not tid:
+            raise BadRequest('id is required')
+        return _export_team(tid, bool(data.get('zip')))
+
+    def start_team_export_dict(self, data: dict) -> dict:
+        """Queue ``export_team`` as a job; see ``start_export``."""
+        tid = data.get('id')
+        as_zip = bool(data.get('zip'))
+        if not tid:
+            raise BadRequest('id is required')
+        if not TEAMS.get_by_id(tid):
+            raise NotFound('team not found')
+        return export_jobs.submit(
+            f'team:{tid}:{"zip" if as_zip else "files"}',
+            lambda progress: _export_team(tid, as_zip, progress),
+            team_id=tid,
+        )
+
+    def stream_export(self, data: dict) -> tuple:
+        """Render board ``id``'s report for a streaming response, without writing to ``out/``.
+
+        Returns ``(file name, lines)``; the lines are generated as they are
+        sent. The request is validated and the board read before this returns.
+        """
+        bid = data.get('id')
+        if not bid:
+            raise BadRequest('id is required')
+        b, team_name, assignees = _export_source(bid)
+        return _export_file_name(b), _export_lines(b, team_name, assignees)
+
+    def start_export_dict(self, data: dict) -> dict:
+        """Queue an export of board ``id`` and return its job record at once.
+
+        The export runs on the export_jobs pool; poll ``export_status`` with
+        the returned ``id``. A pending job for the same board is returned
+        instead of queueing another one.
+        """
         bid = data.get('id')
         if not bid:
             raise BadRequest('id is required')
-        b = BOARDS.get_by_id(bid)
-        if not b:
+        if not BOARDS.get_by_id(bid):
             raise NotFound('board not found')
-        users = {u['id']: u for u in USERS.read()}
-        team = TEAMS.get_by_id(b['team_id'])
-        # Build text
-        lines = []
-        lines.append(f"Board: {b['name']}")
-        lines.append(f"Description: {b.get('description', '')}")
-        lines.append(f"Team: {team['name'] if team else b['team_id']}")
-        lines.append(f"Status: {b.get('status')}")
-        lines.append(f"Created: {b.get('creation_time')}")
-        lines.append(f"Ended: {b.get('end_time')}")
-        lines.append("")
-        lines.append("Tasks:")
-        tasks = b.get('tasks', [])
-        if not tasks:
-            lines.append("  (no tasks)")
-        else:
-            for i, t in enumerate(tasks, 1):
-                assignee = users.get(t['user_id'], {}).get('display_name') or t['user_id']
-                lines.append(f"  {i}. {t['title']} [{t['status']}] — {assignee}")
-                if t.get('description'):
-                    lines.append(f"     {t['description']}")
-        out_dir = Path(settings.BASE_DIR) / 'out'
-        out_dir.mkdir(parents=True, exist_ok=True)
-        safe_name = b['name'].replace(' ', '_')
-        fname = f"{safe_name}_{b['id']}.txt"
-        (out_dir / fname).write_text('\n'.join(lines), encoding='utf-8')
-        return json.dumps({'out_file': fname})
+
+        def run(progress):
+            fname, reused = _export_board(bid, progress)
+            return {'out_file': fname, 'reused': reused}
+
+        return export_jobs.submit(f'board:{bid}', run, board_id=bid)
+
+    def export_status_dict(self, data: dict) -> dict:
+        job_id = data.get('id')
+        if not job_id:
+            raise BadRequest('id is required')
+        job = export_jobs.get(job_id)
+        if job is None:
+            raise NotFound('export job not found')
+        return job
+
+    # String interface of the base class, for callers outside the views.
+    create_board = string_api(create_board_dict)
+    close_board = string_api(close_board_dict)
+    add_task = string_api(add_task_dict)
+    add_tasks = string_api(add_tasks_dict)
+    update_task_status = string_api(update_task_status_dict)
+    list_boards = string_api(list_boards_dict)
+    export_board = string_api(export_board_dict)
@@ -1,17 +1,28 @@
-import json
-from ..storage import JSONTable
+from typing import Iterator
+from ..storage import open_table
 from ..exceptions import BadRequest, NotFound, Conflict
-from .utils import now_iso, new_id
+from ..response_cache import cached
+from .utils import now_iso, new_id, ListQuery, rows_by_id, string_api
 
-# This will ensure that '.json' exists inside the 'db' directory.
 from team_base import TeamBase
 
-USERS = JSONTable('users.json')
-TEAMS = JSONTable('teams.json')
+USERS = open_table('users')
+TEAMS = open_table('teams')
+
+TEAM_LIST_FIELDS = ('name', 'description', 'creation_time', 'admin')
+
+
+def _team_summary(t: dict) -> dict:
+    return {
+        'name': t['name'],
+        'description': t.get('description', ''),
+        'creation_time': t.get('creation_time'),
+        'admin': t.get('admin')
+    }
+
 
 class TeamController(TeamBase):
-    def create_team(self, request: str) -> str:
-        data = json.loads(request or '{}')
+    def create_team_dict(self, data: dict) -> dict:
         name = (data.get('name') or '').strip()
         desc = (data.get('description') or '').strip()
         admin = data.get('admin')
@@ -25,119 +36,128 @@ class TeamController(TeamBase):
             raise BadRequest('admin user id is required')
         if not USERS.get_by_id(admin):
             raise BadRequest('admin user does not exist')
-        for t in TEAMS.read():
-            if t['name'].lower() == name.lower():
+        with TEAMS.transaction() as tx:
+            if tx.find_one('name', name.lower()):
                 raise Conflict('team name must be unique')
-        team = {
-            'id': new_id('team'),
-            'name': name,
-            'description': desc,
-            'admin': admin,
-            'users': [],
-            'creation_time': now_iso(),
-        }
-        TEAMS.upsert(team)
-        return json.dumps({'id': team['id']})
-
-    def list_teams(self) -> str:
-        return json.dumps([
-            {
-                'name': t['name'],
-                'description': t.get('description', ''),
-                'creation_time': t.get('creation_time'),
-                'admin': t.get('admin')
+            team = {
+                'id': new_id('team'),
+                'name': name,
+                'description': desc,
+                'admin': admin,
+                'users': [],
+                'creation_time': now_iso(),
             }
-            for t in TEAMS.read()
-        ])
+            tx.upsert(team)
+        return {'id': team['id']}
 
-    def describe_team(self, request: str) -> str:
-        data = json.loads(request or '{}')
+    @cached('teams')
+    def list_teams_dict(self, data: dict) -> list | dict:
+        # Optional paging, prefix and field options; see ListQuery.
+        query = ListQuery(data, TEAM_LIST_FIELDS)
+        return query.result([_team_summary(t) for t in query.fetch(TEAMS, 'name')])
+
+    def stream_teams(self, data: dict) -> Iterator[dict]:
+        """Yield the ``list_teams`` items one by one, for streaming responses."""
+        query = ListQuery(data, TEAM_LIST_FIELDS)
+        return (query.pick(_team_summary(t)) for t in query.iterate(TEAMS, 'name'))
+
+    @cached('teams')
+    def describe_team_dict(self, data: dict) -> dict:
         tid = data.get('id')
         if not tid:
             raise BadRequest('id is required')
         t = TEAMS.get_by_id(tid)
         if not t:
             raise NotFound('team not found')
-        return json.dumps({
+        return {
             'name': t['name'],
             'description': t.get('description', ''),
             'creation_time': t.get('creation_time'),
             'admin': t.get('admin')
-        })
+        }
 
-    def update_team(self, request: str) -> str:
-        data = json.loads(request or '{}')
+    def update_team_dict(self, data: dict) -> dict:
         tid = data.get('id')
         if not tid:
             raise BadRequest('id is required')
-        t = TEAMS.get_by_id(tid)
-        if not t:
-            raise NotFound('team not found')
-        payload = data.get('team') or {}
-        name = (payload.get('name') or t['name']).strip()
-        desc = (payload.get('description') or t.get('description', '')).strip()
-        admin = payload.get('admin', t.get('admin'))
-        if len(name) > 64:
-            raise BadRequest('name max 64 chars')
-        if len(desc) > 128:
-            raise BadRequest('description max 128 chars')
-        if admin and not USERS.get_by_id(admin):
-            raise BadRequest('admin user does not exist')
-        for other in TEAMS.read():
-            if other['id'] != tid and other['name'].lower() == name.lower():
+        with TEAMS.transaction() as tx:
+            t = tx.get(tid)
+            if not t:
+                raise NotFound('team not found')
+            payload = data.get('team') or {}
+            name = (payload.get('name') or t['name']).strip()
+            desc = (payload.get('description') or t.get('description', '')).strip()
+            admin = payload.get('admin', t.get('admin'))
+            if len(name) > 64:
+                raise BadRequest('name max 64 chars')
+            if len(desc) > 128:
+                raise BadRequest('description max 128 chars')
+            if admin and not USERS.get_by_id(admin):
+                raise BadRequest('admin user does not exist')
+            if any(other['id'] != tid for other in tx.find('name', name.lower())):
                 raise Conflict('team name must be unique')
-        t.update({'name': name, 'description': desc, 'admin': admin})
-        TEAMS.upsert(t)
-        return json.dumps({'id': tid})
+            t.update({'name': name, 'description': desc, 'admin': admin})
+            tx.upsert(t)
+        return {'id': tid}
 
-    def add_users_to_team(self, request: str):
-        data = json.loads(request or '{}')
+    def add_users_to_team_dict(self, data: dict) -> dict:
         tid = data.get('id')
         users = data.get('users') or []
         if not tid:
             raise BadRequest('id is required')
         if not isinstance(users, list):
             raise BadRequest('users must be a list')
-        t = TEAMS.get_by_id(tid)
-        if not t:
-            raise NotFound('team not found')
-        members = set(t.get('users', []))
-        for uid in users:
-            if not USERS.get_by_id(uid):
-                raise BadRequest(f'user does not exist: {uid}')
-            members.add(uid)
-            if len(members) > 50:
-                raise BadRequest('max 50 users allowed per team')
-        t['users'] = list(members)
-        TEAMS.upsert(t)
-        return json.dumps({'user count': len(t['users'])})
+        with TEAMS.transaction() as tx:
+            t = tx.get(tid)
+            if not t:
+                raise NotFound('team not found')
+            members = set(t.get('users', []))
+            for uid in users:
+                if not USERS.get_by_id(uid):
+                    raise BadRequest(f'user does not exist: {uid}')
+                members.add(uid)
+                if len(members) > 50:
+                    raise BadRequest('max 50 users allowed per team')
+            t['users'] = list(members)
+            tx.upsert(t)
+        return {'user count': len(t['users'])}
 
-    def remove_users_from_team(self, request: str):
-        data = json.loads(request or '{}')
+    def remove_users_from_team_dict(self, data: dict) -> dict:
         tid = data.get('id')
         users = set(data.get('users') or [])
         if not tid:
             raise BadRequest('id is required')
-        t = TEAMS.get_by_id(tid)
-        if not t:
-            raise NotFound('team not found')
-        members = [u for u in t.get('users', []) if u not in users]
-        t['users'] = members
-        TEAMS.upsert(t)
-        return json.dumps({'user count': len(t['users'])})
+        with TEAMS.transaction() as tx:
+            t = tx.get(tid)
+            if not t:
+                raise NotFound('team not found')
+            members = [u for u in t.get('users', []) if u not in users]
+            t['users'] = members
+            tx.upsert(t)
+        return {'user count': len(t['users'])}
 
-    def list_team_users(self, request: str):
-        data = json.loads(request or '{}')
+    @cached('teams', 'users')
+    def list_team_users_dict(self, data: dict) -> list:
         tid = data.get('id')
         if not tid:
             raise BadRequest('id is required')
         t = TEAMS.get_by_id(tid)
         if not t:
             raise NotFound('team not found')
+        # At most 50 members: look them up rather than reading every user.
+        members = rows_by_id(USERS, t.get('users', []))
         out = []
-        user_map = {u['id']: u for u in USERS.read()}
         for uid in t.get('users', []):
-            u = user_map.get(uid)
+            u = members.get(uid)
             if u:
                 out.append({'id': u['id'], 'name': u['name'], 'display_name': u.get('display_name', '')})
-        return json.dumps(out)
+        return out
+
+    # String interface of the base class, for callers outside the views.
+    create_team = string_api(create_team_dict)
+    list_teams = string_api(list_teams_dict)
+    describe_team = string_api(describe_team_dict)
+    update_team = string_api(update_team_dict)
+    add_users_to_team = string_api(add_users_to_team_dict)
+    remove_users_from_team = string_api(remove_users_from_team_dict)
+    list_team_users = string_api(list_team_users_dict)
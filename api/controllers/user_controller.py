@@ -1,118 +1,173 @@
-import json
-from ..storage import JSONTable
+from typing import Iterator
+from ..storage import open_table
 from ..exceptions import BadRequest, NotFound, Conflict
-from .utils import now_iso, new_id
+from ..response_cache import cached
+from .utils import now_iso, new_id, ListQuery, string_api
 
 from user_base import UserBase
 
-# This will ensure that '.json' exists inside the 'db' directory.
-USERS = JSONTable('users.json')
-TEAMS = JSONTable('teams.json')
+USERS = open_table('users')
+TEAMS = open_table('teams')
+
+def _new_user(data: dict) -> dict:
+    """Validate a create_user payload and build the user row (uniqueness is checked by the caller)."""
+    name = (data.get('name') or '').strip()
+    display = (data.get('display_name') or '').strip()
+
+    # Input validation
+    if not name:
+        raise BadRequest('name is required')
+    if len(name) > 64:
+        raise BadRequest('name max 64 chars')
+    if len(display) > 64:
+        raise BadRequest('display_name max 64 chars')
+    return {
+        'id': new_id('usr'),
+        'name': name,
+        'display_name': display,
+        'creation_time': now_iso(),
+        'description': data.get('description') or ''
+    }
+
+
+USER_LIST_FIELDS = ('name', 'display_name', 'creation_time')
+
+
+def _user_summary(u: dict) -> dict:
+    return {
+        'name': u['name'],
+        'display_name': u.get('display_name', ''),
+        'creation_time': u.get('creation_time')
+    }
+
 
 class UserController(UserBase):
-    def create_user(self, request: str) -> str:
-        """Create a new user and return its ID as a JSON string."""
-
-        # Parse request data
-        data = json.loads(request or '{}')
-        name = (data.get('name') or '').strip()
-        display = (data.get('display_name') or '').strip()
-
-        # Input validation
-        if not name:
-            raise BadRequest('name is required')
-        if len(name) > 64:
-            raise BadRequest('name max 64 chars')
-        if len(display) > 64:
-            raise BadRequest('display_name max 64 chars')
-        
-        # Uniqueness
-        for u in USERS.read():
-            if u['name'].lower() == name.lower():
+    def create_user_dict(self, data: dict) -> dict:
+        """Create a new user and return its ID."""
+
+        user = _new_user(data)
+
+        with USERS.transaction() as tx:
+            # Uniqueness
+            if tx.find_one('name', user['name'].lower()):
                 raise Conflict('user name must be unique')
+            tx.upsert(user)
+        return {'id': user['id']}
 
-        # Create user.
-        user = {
-            'id': new_id('usr'),
-            'name': name,
-            'display_name': display,
-            'creation_time': now_iso(),
-            'description': data.get('description') or ''
-        }
-        USERS.upsert(user)
-        return json.dumps({'id': user['id']})
+    def create_users_dict(self, data: dict) -> dict:
+        """Create many users in one write.
 
-    def list_users(self) -> str:
-        """Return all users as a JSON string for the UsersView GET endpoint."""
+        Every item is validated like ``create_user``; valid items are created
+        and the rest are skipped. Returns ``{"results": [...]}`` with one
+        ``{"id": ...}`` or ``{"error": ...}`` per item, in request order.
+        """
+        items = data.get('users')
+        if not isinstance(items, list):
+            raise BadRequest('users must be a list')
 
-        users = USERS.read()
-        result = [
-            {
-                'name': u['name'],
-                'display_name': u.get('display_name', ''),
-                'creation_time': u.get('creation_time')
-            }
-            for u in users
-        ]
-        return json.dumps(result)
+        results = []
+        with USERS.transaction() as tx:
+            seen = set()
+            created = []
+            for item in items:
+                try:
+                    if not isinstance(item, dict):
+                        raise BadRequest('each user must be an object')
+                    user = _new_user(item)
+                    key = user['name'].lower()
+                    # Checked against the table and the users earlier in the batch.
+                    if key in seen or tx.find_one('name', key):
+                        raise Conflict('user name must be unique')
+                except (BadRequest, Conflict) as e:
+                    results.append({'error': str(e)})
+                    continue
+                seen.add(key)
+                created.append(user)
+                results.append({'id': user['id']})
+            for user in created:
+                tx.upsert(user)
+        return {'results': results}
+
+    @cached('users')
+    def list_users_dict(self, data: dict) -> list | dict:
+        """Return users for the UsersView GET endpoint.
 
-    def describe_user(self, request: str) -> str:
-        """Return details of a user as a JSON string based on user ID."""
+        ``data`` may hold paging, prefix and field options; see ``ListQuery``.
+        """
+
+        query = ListQuery(data, USER_LIST_FIELDS)
+        users = query.fetch(USERS, 'name')
+        return query.result([_user_summary(u) for u in users])
+
+    def stream_users(self, data: dict) -> Iterator[dict]:
+        """Yield the ``list_users`` items one by one, for streaming responses.
+
+        Takes the same ``prefix`` and ``fields`` options; the request is
+        validated before this returns.
+        """
+        query = ListQuery(data, USER_LIST_FIELDS)
+        return (query.pick(_user_summary(u)) for u in query.iterate(USERS, 'name'))
+
+    @cached('users')
+    def describe_user_dict(self, data: dict) -> dict:
+        """Return details of a user based on user ID."""
 
-        data = json.loads(request or '{}')
         uid = data.get('id')
         if not uid:
             raise BadRequest('id is required')
         u = USERS.get_by_id(uid)
         if not u:
             raise NotFound('user not found')
-        return json.dumps({
+        return {
             'name': u['name'],
             'description': u.get('description', ''),
             'creation_time': u.get('creation_time')
-        })
+        }
 
-    def update_user(self, request: str) -> str:
-        """Update an existing user's details and return confirmation as JSON."""
+    def update_user_dict(self, data: dict) -> dict:
+        """Update an existing user's details and return confirmation."""
 
-        data = json.loads(request or '{}')
         uid = data.get('id')
         payload = data.get('user') or {}
         if not uid:
             raise BadRequest('id is required')
-        u = USERS.get_by_id(uid)
-        if not u:
-            raise NotFound('user not found')
-        # Name cannot be updated
-        if 'name' in payload and payload['name'] != u['name']:
-            raise BadRequest('user name cannot be updated')
-        display = (payload.get('display_name') or u.get('display_name', '')).strip()
-        if len(u.get('name', '')) > 64:
-            raise BadRequest('name max 64 chars')
-        if len(display) > 128:
-            raise BadRequest('display_name max 128 chars')
-        u['display_name'] = display
-        if 'description' in payload:
-            u['description'] = (payload.get('description') or '').strip()
-        USERS.upsert(u)
-        return json.dumps({'id': uid})
-
-    def get_user_teams(self, request: str) -> str:
-        data = json.loads(request or '{}')
+        with USERS.transaction() as tx:
+            u = tx.get(uid)
+            if not u:
+                raise NotFound('user not found')
+            # Name cannot be updated
+            if 'name' in payload and payload['name'] != u['name']:
+                raise BadRequest('user name cannot be updated')
+            display = (payload.get('display_name') or u.get('display_name', '')).strip()
+            if len(u.get('name', '')) > 64:
+                raise BadRequest('name max 64 chars')
+            if len(display) > 128:
+                raise BadRequest('display_name max 128 chars')
+            u['display_name'] = display
+            if 'description' in payload:
+                u['description'] = (payload.get('description') or '').strip()
+            tx.upsert(u)
+        return {'id': uid}
+
+    @cached('teams')
+    def get_user_teams_dict(self, data: dict) -> list:
         uid = data.get('id')
         if not uid:
             raise BadRequest('id is required')
-        teams = []
-        seen = set()
-        for t in TEAMS.read():
-            members = set(t.get('users', []))
-            if uid == t.get('admin') or uid in members:
-                if t['id'] in seen:
-                    continue
-                seen.add(t['id'])
-                teams.append({
-                    'name': t['name'],
-                    'description': t.get('description', ''),
-                    'creation_time': t.get('creation_time')
-                })
-        return json.dumps(teams)
+        teams = [
+            {
+                'name': t['name'],
+                'description': t.get('description', ''),
+                'creation_time': t.get('creation_time')
+            }
+            for t in TEAMS.find('member', uid)
+        ]
+        return teams
+
+    # String interface of the base class, for callers outside the views.
+    create_user = string_api(create_user_dict)
+    create_users = string_api(create_users_dict)
+    list_users = string_api(list_users_dict)
+    describe_user = string_api(describe_user_dict)
+    update_user = string_api(update_user_dict)
+    get_user_teams = string_api(get_user_teams_dict)
@@ -1,7 +1,12 @@
 from __future__ import annotations
 from datetime import datetime, timezone
+import base64
+import functools
+import json
 import uuid
 
+from ..exceptions import BadRequest
+
 ALLOWED_TASK_STATUS = {"OPEN", "IN_PROGRESS", "COMPLETE"}
 
 def now_iso() -> str:
@@ -10,8 +15,136 @@ def now_iso() -> str:
 def new_id(prefix: str) -> str:
     return f"{prefix}_{uuid.uuid4().hex}"
 
+def string_api(method):
+    """Expose a dict-in/dict-out controller method with the JSON string
+    signature of the ``*_base`` interfaces; the views call the dict method."""
+    @functools.wraps(method)
+    def wrapper(self, request: str = '') -> str:
+        return json.dumps(method(self, json.loads(request or '{}')))
+    return wrapper
+
+def rows_by_id(table, ids) -> dict:
+    """Map each of ``ids`` found in ``table`` to its row.
+
+    Each id is looked up on its own when the table has indexed lookups, and
+    the table is read once otherwise.
+    """
+    ids = set(ids)
+    if table.indexed_lookups:
+        rows = (table.get_by_id(i) for i in ids)
+    else:
+        rows = (r for r in table.iter_rows() if r.get('id') in ids)
+    return {r['id']: r for r in rows if r is not None}
+
 def generate_unique_id(prefix: str, existing_ids: set) -> str:
     while True:
         candidate = f"{prefix}_{uuid.uuid4().hex[:12]}"
         if candidate not in existing_ids:
-            return candidate
\ No newline at end of file
+            return candidate
+
+PAGE_DEFAULT = 100
+PAGE_MAX = 1000
+# Sorts after every character, so ``prefix + _KEY_END`` bounds all names with that prefix.
+_KEY_END = '\U0010ffff'
+
+
+def encode_cursor(key, _id: str) -> str:
+    raw = json.dumps([key, _id], ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """``(key, id)`` from ``encode_cursor``; the key is a str or a tuple of str."""
+    try:
+        key, _id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        raise BadRequest('invalid cursor') from None
+    if isinstance(key, list) and key and all(isinstance(k, str) for k in key):
+        key = tuple(key)
+    # Anything else would fail to compare with the index keys.
+    if not isinstance(key, (str, tuple)) or not isinstance(_id, str):
+        raise BadRequest('invalid cursor')
+    return key, _id
+
+
+class ListQuery:
+    """Pagination, name-prefix filter and field selection for a list endpoint.
+
+    Request keys (all optional):
+      ``limit``   page size, 1..PAGE_MAX
+      ``cursor``  ``next_cursor`` from the previous page
+      ``prefix``  case-insensitive prefix of the name
+      ``fields``  names of the fields to return (list or comma-separated)
+
+    Without ``limit``, ``cursor`` and ``prefix`` the endpoint returns its whole
+    collection in storage order, as before. Otherwise rows come from an index
+    scan in name order; with ``limit`` or ``cursor`` the result is
+    ``{"items": [...], "next_cursor": <str or null>}``.
+    """
+
+    def __init__(self, data: dict, fields: tuple):
+        self.prefix = str(data.get('prefix') or '').lower()
+        cursor = data.get('cursor')
+        self.after = decode_cursor(str(cursor)) if cursor else None
+        limit = data.get('limit')
+        self.paged = limit not in (None, '') or self.after is not None
+        if limit in (None, ''):
+            self.limit = PAGE_DEFAULT if self.paged else None
+        else:
+            try:
+                self.limit = int(limit)
+            except (TypeError, ValueError):
+                raise BadRequest('limit must be an integer') from None
+            if not 1 <= self.limit <= PAGE_MAX:
+                raise BadRequest(f'limit must be between 1 and {PAGE_MAX}')
+        requested = data.get('fields')
+        if isinstance(requested, str):
+            requested = [f.strip() for f in requested.split(',') if f.strip()]
+        if requested:
+            unknown = [f for f in requested if f not in fields]
+            if unknown:
+                raise BadRequest(f"unknown fields: {', '.join(map(str, unknown))}")
+        self.fields = tuple(requested) if requested else fields
+        self.next_cursor = None
+
+    def fetch(self, table, index: str, scope: tuple = (), everything=None) -> list:
+        """Rows of the requested page, read through ``table.scan(index)``.
+
+        ``scope`` is the leading part of a compound index key (e.g. the team
+        id); ``everything`` returns the unfiltered collection.
+        """
+        if not (self.paged or self.prefix):
+            return everything() if everything else table.read()
+        if self.after is not None:
+            # Keys are a str, or (*scope, str) for a scoped listing; a cursor
+            # of another shape comes from another listing, or was edited.
+            key = self.after[0]
+            if isinstance(key, tuple) != bool(scope) or (scope and len(key) != len(scope) + 1):
+                raise BadRequest('invalid cursor')
+        start, stop = self.prefix, self.prefix + _KEY_END
+        if scope:
+            start, stop = (*scope, start), (*scope, stop)
+        limit = self.limit + 1 if self.limit is not None else None
+        entries = table.scan(index, start, stop, after=self.after, limit=limit)
+        if self.limit is not None and len(entries) > self.limit:
+            entries = entries[:self.limit]
+            key, row = entries[-1]
+            self.next_cursor = encode_cursor(key, row['id'])
+        return [row for _, row in entries]
+
+    def iterate(self, table, index: str, scope: tuple = ()):
+        """Like ``fetch`` for streaming responses: all matching rows, lazily where possible."""
+        if self.paged:
+            raise BadRequest('limit and cursor cannot be combined with stream')
+        if self.prefix:
+            return iter(self.fetch(table, index, scope))
+        return table.iter_rows()
+
+    def pick(self, item: dict) -> dict:
+        return {f: item[f] for f in self.fields}
+
+    def result(self, items: list):
+        items = [self.pick(item) for item in items]
+        if self.paged:
+            return {'items': items, 'next_cursor': self.next_cursor}
+        return items
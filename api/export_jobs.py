@@ -0,0 +1,109 @@
+"""Background jobs for board exports.
+
+``submit(key, fn)`` runs ``fn(progress)`` on a bounded thread pool
+(``settings.EXPORT_WORKERS`` threads) and returns the job's id at once;
+``get(job_id)`` reports its state. ``fn`` calls ``progress(done, total)`` as
+it goes and returns a dict that becomes the job's result.
+
+``render_pool()`` is a second pool of the same size that team exports
+share for rendering their boards, so concurrent team exports, queued or
+run inline, never render more than ``EXPORT_WORKERS`` boards at a time.
+It is separate from the job pool because job threads wait on it.
+
+Jobs are coalesced by ``key``: while a job for a key is queued or running,
+submitting the same key returns that job instead of starting another one.
+
+Job records live in the memory of the worker process that accepted the
+request, and the most recent ``settings.EXPORT_JOBS_KEEP`` are kept. With
+several worker processes a status request must reach the same worker
+(sticky sessions), or it reports the job as unknown.
+"""
+from __future__ import annotations
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict
+
+from django.conf import settings
+
+from .controllers.utils import new_id, now_iso
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+_lock = threading.Lock()
+_jobs: 'OrderedDict[str, dict]' = OrderedDict()
+_active: Dict[str, str] = {}  # key -> id of its queued or running job
+_executor: ThreadPoolExecutor | None = None
+_render_executor: ThreadPoolExecutor | None = None
+
+
+def _pool() -> ThreadPoolExecutor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'EXPORT_WORKERS', 2), thread_name_prefix='export'
+            )
+        return _executor
+
+
+def render_pool() -> ThreadPoolExecutor:
+    global _render_executor
+    with _lock:
+        if _render_executor is None:
+            _render_executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'EXPORT_WORKERS', 2), thread_name_prefix='export-render'
+            )
+        return _render_executor
+
+
+def _update(job_id: str, **fields) -> None:
+    with _lock:
+        _jobs[job_id].update(fields)
+
+
+def _run(job_id: str, key: str, fn: Callable[[Callable[[int, int], None]], dict]) -> None:
+    def progress(done: int, total: int) -> None:
+        _update(job_id, progress={'done': done, 'total': total})
+
+    _update(job_id, status=RUNNING, started=now_iso())
+    try:
+        result = fn(progress)
+    except Exception as exc:
+        logger.exception('export job %s failed', job_id)
+        _update(job_id, status=FAILED, error=str(exc) or type(exc).__name__, finished=now_iso())
+    else:
+        _update(job_id, status=DONE, finished=now_iso(), **result)
+    finally:
+        with _lock:
+            _active.pop(key, None)
+
+
+def submit(key: str, fn: Callable[[Callable[[int, int], None]], dict], **info) -> dict:
+    """Queue ``fn`` unless a job for ``key`` is pending; return a copy of the job record."""
+    with _lock:
+        pending = _active.get(key)
+        if pending is not None:
+            return dict(_jobs[pending])
+        job = {'id': new_id('job'), 'status': QUEUED, 'created': now_iso(),
+               'progress': {'done': 0, 'total': None}, **info}
+        _jobs[job['id']] = job
+        _active[key] = job['id']
+        keep = getattr(settings, 'EXPORT_JOBS_KEEP', 1000)
+        for old_id in list(_jobs):
+            if len(_jobs) <= keep:
+                break
+            if _jobs[old_id]['status'] in (DONE, FAILED):
+                del _jobs[old_id]
+        snapshot = dict(job)
+    _pool().submit(_run, job['id'], key, fn)
+    return snapshot
+
+
+def get(job_id: str) -> dict | None:
+    with _lock:
+        job = _jobs.get(job_id)
+        return dict(job) if job is not None else None
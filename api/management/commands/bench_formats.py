@@ -0,0 +1,81 @@
+"""Compare file size and full-table read/write time of the storage formats.
+
+    python manage.py bench_formats --rows 10000 100000 1000000
+
+Rows are shaped like ``users.json`` entries. ``write`` is encoding plus the
+atomic replace, ``read`` is reading the file plus decoding. When orjson is
+installed the compact format is also measured with the standard library
+alone, to separate the effect of the layout from the effect of the encoder.
+"""
+import json
+import tempfile
+import time
+from pathlib import Path
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand
+
+from api.storage import _replace_file
+from api.storage_formats import FORMATS, Format, get_format, orjson
+
+
+def _rows(n: int) -> list:
+    return [
+        {'id': f'usr_{i:032x}', 'name': f'user{i}', 'display_name': f'User {i}',
+         'creation_time': '2025-01-01T00:00:00+00:00', 'description': f'Member number {i}'}
+        for i in range(n)
+    ]
+
+
+def _formats(names) -> list:
+    out = []
+    for name in names:
+        try:
+            fmt = get_format(name)
+        except ImproperlyConfigured as exc:
+            out.append((name, exc))
+            continue
+        out.append((f'{name} (orjson)' if name == 'json' and orjson else name, fmt))
+        if name == 'json' and orjson:
+            out.append(('json (stdlib)', Format(
+                'json', '.json',
+                lambda v: json.dumps(v, ensure_ascii=False, separators=(',', ':')).encode('utf-8'),
+                json.loads,
+            )))
+    return out
+
+
+def _best(fn, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+class Command(BaseCommand):
+    help = 'Benchmark on-disk size and read/write time of each STORAGE_FORMAT.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+        parser.add_argument('--formats', nargs='+', choices=FORMATS, default=list(FORMATS))
+        parser.add_argument('--repeat', type=int, default=3, help='best of N runs')
+
+    def handle(self, *args, **opts):
+        formats = _formats(opts['formats'])
+        self.stdout.write(f"{'rows':>9} {'format':<16} {'size MB':>9} {'write ms':>9} {'read ms':>9}")
+        with tempfile.TemporaryDirectory() as tmp:
+            for n in opts['rows']:
+                rows = _rows(n)
+                for label, fmt in formats:
+                    if isinstance(fmt, Exception):
+                        self.stdout.write(f'{n:>9} {label:<16} skipped: {fmt}')
+                        continue
+                    path = Path(tmp) / f'bench{fmt.suffix}'
+                    write = _best(lambda: _replace_file(path, fmt.dumps(rows)), opts['repeat'])
+                    read = _best(lambda: fmt.loads(path.read_bytes()), opts['repeat'])
+                    size = path.stat().st_size / 1e6
+                    self.stdout.write(
+                        f'{n:>9} {label:<16} {size:>9.2f} {write * 1000:>9.1f} {read * 1000:>9.1f}'
+                    )
@@ -0,0 +1,73 @@
+"""Measure JSONTable read throughput as the number of reader processes grows.
+
+    python manage.py bench_reads --rows 5000 --workers 1 2 4 8
+
+Each worker process reads a scratch table in a loop. ``lock-free`` is the
+current read path; ``exclusive`` wraps every read in the table's file lock,
+which is how reads behaved before writes became atomic renames.
+"""
+import multiprocessing
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from api.storage import JSONTable
+
+TABLE = 'bench_reads.json'
+
+
+def _reader(exclusive: bool, start: float, seconds: float, counter) -> None:
+    table = JSONTable(TABLE, cache=False)
+    n = 0
+    # All workers measure the same wall-clock window.
+    time.sleep(max(0.0, start - time.time()))
+    deadline = start + seconds
+    while time.time() < deadline:
+        if exclusive:
+            with table.lock:
+                table.read()
+        else:
+            table.read()
+        n += 1
+    with counter.get_lock():
+        counter.value += n
+
+
+class Command(BaseCommand):
+    help = 'Benchmark JSONTable read throughput for 1..N concurrent reader processes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=5000)
+        parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+        parser.add_argument('--seconds', type=float, default=2.0)
+
+    def handle(self, *args, **opts):
+        table = JSONTable(TABLE, cache=False)
+        table.write([
+            {'id': f'usr_{i:032x}', 'name': f'user{i}', 'display_name': f'User {i}',
+             'creation_time': '2025-01-01T00:00:00+00:00', 'description': ''}
+            for i in range(opts['rows'])
+        ])
+        ctx = multiprocessing.get_context('fork')
+        self.stdout.write(f"{'mode':<10} {'workers':>7} {'reads/s':>10} {'speedup':>8}")
+        try:
+            for mode in ('exclusive', 'lock-free'):
+                base = None
+                for workers in opts['workers']:
+                    counter = ctx.Value('q', 0)
+                    start = time.time() + 0.5
+                    procs = [
+                        ctx.Process(target=_reader, args=(mode == 'exclusive', start, opts['seconds'], counter))
+                        for _ in range(workers)
+                    ]
+                    for p in procs:
+                        p.start()
+                    for p in procs:
+                        p.join()
+                    rate = counter.value / opts['seconds']
+                    base = base or rate
+                    self.stdout.write(f'{mode:<10} {workers:>7} {rate:>10.0f} {rate / base:>7.2f}x')
+        finally:
+            for path in (table.path, Path(table.lock.lock_file)):
+                path.unlink(missing_ok=True)
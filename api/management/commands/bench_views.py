@@ -0,0 +1,91 @@
+"""Measure per-request CPU of the view -> controller -> renderer path.
+
+    python manage.py bench_views --users 1000
+
+``string`` is the old path: the view JSON-encodes the request for the
+``*_base`` string method, which decodes it, encodes its result, and ``_ok``
+decodes that again before DRF renders it. ``dict`` is the current path: the
+view calls the ``*_dict`` method and DRF renders its result. Storage reads
+are cached and identical in both, so the difference is codec overhead.
+
+The controllers are pointed at scratch tables under ``db/bench_views/`` for
+the duration of the run.
+"""
+import json
+import shutil
+import time
+from contextlib import contextmanager
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from api.controllers import team_controller, user_controller
+from api.controllers.team_controller import TeamController
+from api.controllers.user_controller import UserController
+from api.storage import DB_DIR, INDEXES, JSONTable
+
+SCRATCH = 'bench_views'
+
+
+@contextmanager
+def _scratch_tables():
+    users = JSONTable(f'{SCRATCH}/users.json', indexes=INDEXES['users'])
+    teams = JSONTable(f'{SCRATCH}/teams.json', indexes=INDEXES['teams'])
+    saved = [(m, m.USERS, m.TEAMS) for m in (user_controller, team_controller)]
+    for m, _, _ in saved:
+        m.USERS, m.TEAMS = users, teams
+    try:
+        yield users, teams
+    finally:
+        for m, u, t in saved:
+            m.USERS, m.TEAMS = u, t
+        shutil.rmtree(DB_DIR / SCRATCH, ignore_errors=True)
+
+
+class Command(BaseCommand):
+    help = 'Compare per-request CPU time of the string and dict controller paths.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help='rows in the scratch users table')
+        parser.add_argument('--seconds', type=float, default=1.0, help='CPU time per measurement')
+
+    def handle(self, *args, **opts):
+        (DB_DIR / SCRATCH).mkdir(parents=True, exist_ok=True)
+        with _scratch_tables() as (users, teams):
+            U, T = UserController(), TeamController()
+            users.write([
+                {'id': f'usr_{i:032x}', 'name': f'user{i}', 'display_name': f'User {i}',
+                 'creation_time': '2025-01-01T00:00:00+00:00', 'description': ''}
+                for i in range(opts['users'])
+            ])
+            uid = users.read()[0]['id']
+            team = T.create_team_dict({'name': 'bench', 'description': '', 'admin': uid})['id']
+            T.add_users_to_team_dict({'id': team, 'users': [u['id'] for u in users.read()[:50]]})
+            cases = [
+                ('describe_user', U, {'id': uid}),
+                ('get_user_teams', U, {'id': uid}),
+                ('list_team_users', T, {'id': team}),
+                ('list_users?limit=50', U, {'limit': 50}),
+                (f"list_users ({opts['users']})", U, {}),
+            ]
+            render = JSONRenderer().render
+            self.stdout.write(f"{'endpoint':<22} {'string us':>10} {'dict us':>10} {'saved':>7}")
+            for label, controller, body in cases:
+                name = label.split('?')[0].split(' ')[0]
+                string_fn = getattr(controller, name)
+                dict_fn = getattr(controller, f'{name}_dict')
+                old = self._measure(lambda: render(json.loads(string_fn(json.dumps(body)))), opts['seconds'])
+                new = self._measure(lambda: render(dict_fn(body)), opts['seconds'])
+                self.stdout.write(f'{label:<22} {old:>10.1f} {new:>10.1f} {1 - new / old:>6.0%}')
+
+    @staticmethod
+    def _measure(fn, seconds: float) -> float:
+        """Mean CPU microseconds per call over roughly ``seconds`` of CPU time."""
+        fn()
+        n, start = 0, time.process_time()
+        while True:
+            fn()
+            n += 1
+            elapsed = time.process_time() - start
+            if elapsed >= seconds:
+                return elapsed / n * 1e6
@@ -0,0 +1,53 @@
+"""Rewrite every table file under ``db/`` in another ``STORAGE_FORMAT``.
+
+    python manage.py convert_storage              # to settings.STORAGE_FORMAT
+    python manage.py convert_storage --to msgpack
+
+Pending write-ahead log entries are folded into the converted file. Run it
+with the application stopped: a worker still using the old format would not
+see the converted files.
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from filelock import FileLock
+
+from api.storage import DB_DIR, FileEngine, table_path
+from api.storage_formats import FORMATS, get_format
+from api.storage_wal import LogEngine
+
+SOURCE_FORMATS = {'.json': 'json', '.msgpack': 'msgpack'}
+
+
+class Command(BaseCommand):
+    help = 'Convert the JSON storage files under db/ to another on-disk format.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--to', choices=FORMATS, default=None,
+                            help='target format (default: settings.STORAGE_FORMAT)')
+
+    def handle(self, *args, **opts):
+        target = get_format(opts['to'] or getattr(settings, 'STORAGE_FORMAT', 'json'))
+        sources = sorted(
+            p for p in DB_DIR.rglob('*')
+            if p.is_file() and p.suffix in SOURCE_FORMATS and not p.name.startswith('.')
+        )
+        for src in sources:
+            name = src.relative_to(DB_DIR).with_suffix('.json').as_posix()
+            dst = table_path(name, target)
+            if dst != src and dst.exists():
+                self.stderr.write(f'{src.name}: skipped, {dst.name} already exists')
+                continue
+            log = src.with_name(src.name + '.log')
+            fmt = get_format(SOURCE_FORMATS[src.suffix])
+            before = src.stat().st_size
+            with FileLock(str(DB_DIR / name) + '.lock'):
+                rows = (LogEngine if log.exists() else FileEngine)(src, fmt).load()
+                FileEngine(dst, target).save(rows)
+                # The new file holds everything, so the old file and log can go.
+                if dst != src:
+                    src.unlink()
+                log.unlink(missing_ok=True)
+            self.stdout.write(
+                f'{src.relative_to(DB_DIR)} -> {dst.relative_to(DB_DIR)}: '
+                f'{len(rows)} rows, {before} -> {dst.stat().st_size} bytes'
+            )
@@ -0,0 +1,166 @@
+"""Measure throughput and latency of a running server under concurrent clients.
+
+    # WSGI, DRF views
+    gunicorn -w 1 --threads 8 factwise_python_project.wsgi
+    # ASGI, async views (API_ASYNC_VIEWS = True)
+    uvicorn factwise_python_project.asgi:application
+
+    python manage.py loadtest --url http://127.0.0.1:8000 --concurrency 200 --slow 1000
+
+Seeds a team with a board through the API, then runs ``--concurrency``
+keep-alive clients for ``--duration`` seconds. Each request is a GET of a
+user, the team's users or the team's boards, or with probability
+``--writes`` a task status update. ``--slow`` further clients open a
+connection and send their request one byte per second, like clients on a
+bad network; they count towards neither throughput nor latency, but a
+server that spends a thread on each of them has fewer left for the rest.
+
+Uses only asyncio streams, so it runs anywhere the project does.
+"""
+import asyncio
+import json
+import random
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class _Connection:
+    def __init__(self, host: str, port: int):
+        self.host, self.port = host, port
+        self.reader = self.writer = None
+
+    async def request(self, method: str, path: str, body=None) -> tuple:
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        data = json.dumps(body).encode() if body is not None else b''
+        head = (
+            f'{method} {path} HTTP/1.1\r\nHost: {self.host}\r\n'
+            f'Content-Type: application/json\r\nContent-Length: {len(data)}\r\n\r\n'
+        )
+        self.writer.write(head.encode() + data)
+        await self.writer.drain()
+        status = int((await self.reader.readline()).split()[1])
+        length, close = 0, False
+        while (line := await self.reader.readline()) not in (b'\r\n', b''):
+            name, _, value = line.decode('latin-1').partition(':')
+            if name.lower() == 'content-length':
+                length = int(value)
+            elif name.lower() == 'connection' and value.strip().lower() == 'close':
+                close = True
+        payload = await self.reader.readexactly(length)
+        if close:
+            self.close()
+        return status, payload
+
+    def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+class Command(BaseCommand):
+    help = 'Load-test a running API server (WSGI or ASGI) and report requests/s and latency.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000')
+        parser.add_argument('--concurrency', type=int, default=100)
+        parser.add_argument('--duration', type=float, default=10.0, help='seconds')
+        parser.add_argument('--writes', type=float, default=0.1, help='fraction of requests that write')
+        parser.add_argument('--slow', type=int, default=0, help='additional slow clients')
+
+    def handle(self, *args, **opts):
+        url = urlsplit(opts['url'])
+        if url.scheme != 'http' or not url.hostname:
+            raise CommandError('--url must be http://host[:port]')
+        asyncio.run(self._run(url.hostname, url.port or 80, opts))
+
+    async def _seed(self, conn: _Connection) -> dict:
+        async def call(method, path, body=None):
+            status, payload = await conn.request(method, '/api/' + path, body)
+            if status >= 400:
+                raise CommandError(f'{method} /api/{path}: {status} {payload[:200]!r}')
+            return json.loads(payload)
+
+        tag = random.getrandbits(32)
+        users = (await call('POST', 'users/bulk/', {'users': [
+            {'name': f'load{tag}_{i}', 'display_name': f'Load {i}'} for i in range(20)
+        ]}))['results']
+        user_ids = [u['id'] for u in users]
+        team = (await call('POST', 'teams/', {'name': f'load{tag}', 'admin': user_ids[0]}))['id']
+        await call('POST', f'teams/{team}/users/add/', {'users': user_ids[1:]})
+        board = (await call('POST', 'boards/', {'name': f'load{tag}', 'team_id': team}))['id']
+        tasks = (await call('POST', f'boards/{board}/tasks/bulk/', {'tasks': [
+            {'title': f'task {i}', 'user_id': user_ids[i % len(user_ids)]} for i in range(50)
+        ]}))['results']
+        return {'users': user_ids, 'team': team, 'tasks': [t['id'] for t in tasks]}
+
+    async def _run(self, host: str, port: int, opts: dict):
+        seed_conn = _Connection(host, port)
+        try:
+            data = await self._seed(seed_conn)
+        except OSError as exc:
+            raise CommandError(f'cannot reach {host}:{port}: {exc}')
+        finally:
+            seed_conn.close()
+        reads = [f"/api/users/{u}/" for u in data['users']] + [
+            f"/api/teams/{data['team']}/users/", f"/api/teams/{data['team']}/boards/",
+        ]
+        statuses = ('OPEN', 'IN_PROGRESS', 'COMPLETE')
+        latencies, errors = [], 0
+        deadline = time.perf_counter() + opts['duration']
+
+        async def client():
+            nonlocal errors
+            conn = _Connection(host, port)
+            while time.perf_counter() < deadline:
+                if random.random() < opts['writes']:
+                    req = ('PATCH', f"/api/tasks/{random.choice(data['tasks'])}/status/",
+                           {'status': random.choice(statuses)})
+                else:
+                    req = ('GET', random.choice(reads), None)
+                start = time.perf_counter()
+                try:
+                    status, _ = await conn.request(*req)
+                except (OSError, asyncio.IncompleteReadError, ValueError, IndexError):
+                    conn.close()
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - start)
+                if status >= 400:
+                    errors += 1
+            conn.close()
+
+        async def slow_client():
+            try:
+                reader, writer = await asyncio.open_connection(host, port)
+            except OSError:
+                return
+            head = f"GET /api/users/{data['users'][0]}/ HTTP/1.1\r\nHost: {host}\r\n\r\n".encode()
+            try:
+                for i in range(len(head)):
+                    if time.perf_counter() >= deadline:
+                        break
+                    writer.write(head[i:i + 1])
+                    await writer.drain()
+                    await asyncio.sleep(1)
+            except OSError:
+                pass
+            writer.close()
+
+        started = time.perf_counter()
+        await asyncio.gather(
+            *(client() for _ in range(opts['concurrency'])),
+            *(slow_client() for _ in range(opts['slow'])),
+        )
+        elapsed = time.perf_counter() - started
+        latencies.sort()
+
+        def pct(p):
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000 if latencies else 0.0
+
+        self.stdout.write(
+            f"{len(latencies) / elapsed:8.0f} req/s  p50 {pct(0.5):7.1f} ms  p99 {pct(0.99):7.1f} ms  "
+            f"errors {errors}  ({opts['concurrency']} clients, {opts['slow']} slow, {elapsed:.1f} s)"
+        )
@@ -0,0 +1,318 @@
+"""In-process metrics: table lock waits and storage I/O, per request and per table.
+
+``TableLock`` (see ``storage``) reports each outermost acquisition with
+``lock_acquired``. The totals per table are kept for the life of the
+process; the wait is also added to the current request, which
+``RequestMetricsMiddleware`` opens and closes, and each request's total
+lock wait goes into a histogram. ``snapshot()`` returns all of it.
+
+The storage engines also report bytes and time spent reading, decoding,
+encoding and writing table files (``storage_read`` / ``storage_write``);
+those are only kept per request, for ``profiling``.
+
+The middleware also counts each request by route and status and times it,
+``JSONTable`` counts the reads and writes of its files, and
+``BoardController`` reports export durations and task status updates.
+``render()`` returns all of that, plus each open table's ``stats()``, in the
+Prometheus text format for ``/metrics``; it reads no table files.
+
+Everything is per worker process and costs a dict update under a lock.
+"""
+from __future__ import annotations
+import bisect
+import contextvars
+import threading
+import time
+from typing import Dict, List, Sequence
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+# Upper bounds in seconds; the last bucket is unbounded.
+LOCK_WAIT_BUCKETS = (0.0001, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+EXPORT_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Histogram:
+    """Counts of observations per bucket, plus their count and sum (thread-safe)."""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += value
+
+    def snapshot(self) -> dict:
+        """``{'buckets': [[le, cumulative count], ...], 'count': n, 'sum': s}``."""
+        with self._lock:
+            counts, total = list(self._counts), self._sum
+        cumulative, out = 0, []
+        for le, n in zip(self.buckets + ('+Inf',), counts):
+            cumulative += n
+            out.append([le, cumulative])
+        return {'buckets': out, 'count': cumulative, 'sum': total}
+
+
+_lock = threading.Lock()
+# table name -> {'acquisitions', 'contended', 'wait_seconds', 'max_wait_seconds'}
+_locks: Dict[str, dict] = {}
+_request_lock_wait = Histogram(LOCK_WAIT_BUCKETS)
+# Lock wait (seconds) of the request being handled, when there is one.
+_request: contextvars.ContextVar[dict | None] = contextvars.ContextVar('request_metrics', default=None)
+# (method, route) -> {'statuses': {status: count}, 'latency': Histogram}
+_routes: Dict[tuple, dict] = {}
+# table name -> {'reads': file loads, 'writes': file writes}
+_table_io: Dict[str, dict] = {}
+# export kind ('board', 'team') -> Histogram of durations
+_exports: Dict[str, Histogram] = {}
+# new task status -> count
+_task_status: Dict[str, int] = {}
+
+
+def lock_acquired(table: str, wait: float, contended: bool) -> None:
+    """Record that ``table``'s lock was taken after ``wait`` seconds."""
+    with _lock:
+        stats = _locks.get(table)
+        if stats is None:
+            stats = _locks[table] = {
+                'acquisitions': 0, 'contended': 0, 'wait_seconds': 0.0, 'max_wait_seconds': 0.0,
+            }
+        stats['acquisitions'] += 1
+        stats['contended'] += contended
+        stats['wait_seconds'] += wait
+        if wait > stats['max_wait_seconds']:
+            stats['max_wait_seconds'] = wait
+    add('lock_wait', wait)
+
+
+def storage_read(nbytes: int, io: float, parse: float) -> None:
+    """Record a table file read: bytes, seconds reading and seconds decoding."""
+    current = _request.get()
+    if current is not None:
+        current['read_bytes'] += nbytes
+        current['read'] += io
+        current['parse'] += parse
+
+
+def storage_write(nbytes: int, serialize: float, io: float) -> None:
+    """Record a table file write: bytes, seconds encoding and seconds writing."""
+    current = _request.get()
+    if current is not None:
+        current['write_bytes'] += nbytes
+        current['serialize'] += serialize
+        current['write'] += io
+
+
+def _count_table_io(table: str, kind: str) -> None:
+    with _lock:
+        stats = _table_io.get(table)
+        if stats is None:
+            stats = _table_io[table] = {'reads': 0, 'writes': 0}
+        stats[kind] += 1
+
+
+def table_read(table: str) -> None:
+    """Record that ``table``'s file was loaded."""
+    _count_table_io(table, 'reads')
+
+
+def table_written(table: str) -> None:
+    """Record that ``table``'s file was written."""
+    _count_table_io(table, 'writes')
+
+
+def export_finished(kind: str, seconds: float) -> None:
+    """Record an export (``'board'`` or ``'team'``) that took ``seconds``."""
+    with _lock:
+        histogram = _exports.get(kind)
+        if histogram is None:
+            histogram = _exports[kind] = Histogram(EXPORT_BUCKETS)
+    histogram.observe(seconds)
+
+
+def task_status_updated(status: str) -> None:
+    with _lock:
+        _task_status[status] = _task_status.get(status, 0) + 1
+
+
+def request_finished(method: str, route: str, status: int, seconds: float) -> None:
+    """Record a request to ``route`` (URL pattern) answered with ``status`` after ``seconds``."""
+    with _lock:
+        stats = _routes.get((method, route))
+        if stats is None:
+            stats = _routes[(method, route)] = {'statuses': {}, 'latency': Histogram(REQUEST_BUCKETS)}
+        stats['statuses'][status] = stats['statuses'].get(status, 0) + 1
+    stats['latency'].observe(seconds)
+
+
+def add(name: str, value: float) -> None:
+    """Add ``value`` to total ``name`` of the current request, if there is one."""
+    current = _request.get()
+    if current is not None:
+        current[name] = current.get(name, 0) + value
+
+
+def current() -> dict | None:
+    """Totals of the request being handled so far (None outside a request)."""
+    return _request.get()
+
+
+def begin_request() -> contextvars.Token:
+    return _request.set({
+        'lock_wait': 0.0, 'read': 0.0, 'read_bytes': 0, 'parse': 0.0,
+        'serialize': 0.0, 'write': 0.0, 'write_bytes': 0,
+    })
+
+
+def end_request(token: contextvars.Token) -> dict:
+    """Close the request opened by ``token``; return its totals."""
+    current = _request.get()
+    _request.reset(token)
+    _request_lock_wait.observe(current['lock_wait'])
+    return current
+
+
+def snapshot() -> dict:
+    with _lock:
+        tables = {name: dict(stats) for name, stats in _locks.items()}
+    return {'locks': tables, 'request_lock_wait_seconds': _request_lock_wait.snapshot()}
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels: dict) -> str:
+    return ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+
+
+class _Exposition:
+    """Lines of the Prometheus text format, one family at a time."""
+
+    def __init__(self):
+        self.lines: List[str] = []
+
+    def family(self, name: str, kind: str, help_text: str) -> None:
+        self.lines.append(f'# HELP {name} {help_text}')
+        self.lines.append(f'# TYPE {name} {kind}')
+
+    def sample(self, name: str, labels: dict, value) -> None:
+        self.lines.append(f'{name}{{{_labels(labels)}}} {value}' if labels else f'{name} {value}')
+
+    def histogram(self, name: str, labels: dict, snap: dict) -> None:
+        # Label text is built once per series, not once per bucket.
+        text = _labels(labels)
+        prefix = f'{name}_bucket{{{text},le=' if text else f'{name}_bucket{{le='
+        self.lines.extend(f'{prefix}"{le}"}} {count}' for le, count in snap['buckets'])
+        self.sample(f'{name}_sum', labels, snap['sum'])
+        self.sample(f'{name}_count', labels, snap['count'])
+
+
+def render() -> str:
+    """All metrics of this process in the Prometheus text exposition format."""
+    from .storage import table_stats  # storage reports to this module
+
+    tables = table_stats()
+    with _lock:
+        routes = {key: (dict(stats['statuses']), stats['latency']) for key, stats in _routes.items()}
+        table_io = {name: dict(stats) for name, stats in _table_io.items()}
+        locks = {name: dict(stats) for name, stats in _locks.items()}
+        exports = dict(_exports)
+        task_status = dict(_task_status)
+
+    out = _Exposition()
+    out.family('factwise_http_requests_total', 'counter', 'Requests answered, by route and status.')
+    for (method, route), (statuses, _) in sorted(routes.items()):
+        for code, n in sorted(statuses.items()):
+            out.sample('factwise_http_requests_total', {'method': method, 'route': route, 'status': code}, n)
+    out.family('factwise_http_request_duration_seconds', 'histogram',
+               'Time to produce a response (streamed bodies excluded), by route.')
+    for (method, route), (_, latency) in sorted(routes.items()):
+        out.histogram('factwise_http_request_duration_seconds', {'method': method, 'route': route},
+                      latency.snapshot())
+    out.family('factwise_request_lock_wait_seconds', 'histogram', 'Total table lock wait per request.')
+    out.histogram('factwise_request_lock_wait_seconds', {}, _request_lock_wait.snapshot())
+
+    names = sorted(set(tables) | set(table_io) | set(locks))
+    for metric, key, help_text in (
+        ('factwise_table_rows', 'rows', 'Rows at the last load or write of the table by this process.'),
+        ('factwise_table_size_bytes', 'bytes', 'Size of the table files.'),
+    ):
+        out.family(metric, 'gauge', help_text)
+        for name in names:
+            value = tables.get(name, {}).get(key)
+            if value is not None:
+                out.sample(metric, {'table': name}, value)
+    for metric, key, help_text in (
+        ('factwise_table_file_reads_total', 'reads', 'Loads of the table files (cache misses in cached mode).'),
+        ('factwise_table_file_writes_total', 'writes', 'Writes of the table files.'),
+    ):
+        out.family(metric, 'counter', help_text)
+        for name in names:
+            out.sample(metric, {'table': name}, table_io.get(name, {}).get(key, 0))
+    for metric, kind, key, help_text in (
+        ('factwise_table_lock_acquisitions_total', 'counter', 'acquisitions', 'Table lock acquisitions.'),
+        ('factwise_table_lock_contended_total', 'counter', 'contended',
+         'Table lock acquisitions that had to wait.'),
+        ('factwise_table_lock_wait_seconds_total', 'counter', 'wait_seconds', 'Time spent waiting for the table lock.'),
+        ('factwise_table_lock_wait_seconds_max', 'gauge', 'max_wait_seconds', 'Longest wait for the table lock.'),
+    ):
+        out.family(metric, kind, help_text)
+        for name in names:
+            out.sample(metric, {'table': name}, locks.get(name, {}).get(key, 0))
+
+    out.family('factwise_export_duration_seconds', 'histogram', 'Duration of completed exports, by kind.')
+    for kind, histogram in sorted(exports.items()):
+        out.histogram('factwise_export_duration_seconds', {'kind': kind}, histogram.snapshot())
+    out.family('factwise_task_status_updates_total', 'counter', 'Task status updates, by new status.')
+    for status, n in sorted(task_status.items()):
+        out.sample('factwise_task_status_updates_total', {'status': status}, n)
+    return '\n'.join(out.lines) + '\n'
+
+
+def _route(request) -> str:
+    # The URL pattern, not the path, so ids do not create a series each.
+    match = request.resolver_match
+    return match.route if match is not None else '<unmatched>'
+
+
+class RequestMetricsMiddleware:
+    """Scope lock-wait accounting to each request and count it by route (sync and async)."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = begin_request()
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            end_request(token)
+        request_finished(request.method, _route(request), response.status_code, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        token = begin_request()
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            end_request(token)
+        request_finished(request.method, _route(request), response.status_code, time.perf_counter() - start)
+        return response
@@ -0,0 +1,192 @@
+"""Per-request timing breakdown (``settings.PROFILE_REQUESTS``).
+
+``ProfilingMiddleware`` adds a ``Server-Timing`` header to every response
+and logs one structured line per request to the ``api.profiling`` logger:
+
+``total``      time spent below this middleware
+``render``     encoding a DRF response, once the view has returned
+``lock``       waiting for table locks
+``read``       reading table files (``desc`` carries the bytes read)
+``parse``      decoding them
+``serialize``  encoding table files
+``write``      writing them (``desc`` carries the bytes written)
+``app``        the rest: controller logic, middleware, the view itself
+
+The storage figures come from ``metrics``, so the middleware must come
+after ``RequestMetricsMiddleware``. Under ASGI with the async views, storage
+work runs on pool threads and overlaps the other requests of the event loop;
+the figures are still per request.
+
+With ``PROFILE_SLOW_MS`` set, each request runs under a profiler
+(``PROFILER``: ``'cprofile'``, or ``'pyinstrument'`` if installed) and
+requests slower than that are written to ``PROFILE_DIR``. Profiling slows
+every request down, and only covers the thread that handles the request.
+The middleware is off, and costs nothing, unless ``PROFILE_REQUESTS`` is
+True.
+"""
+from __future__ import annotations
+import cProfile
+import json
+import logging
+import time
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class _CProfile:
+    suffix = '.prof'
+
+    def __init__(self):
+        self._profile = cProfile.Profile()
+
+    def start(self) -> bool:
+        try:
+            self._profile.enable()
+        except ValueError:  # another profiler is active in this thread
+            return False
+        return True
+
+    def stop(self) -> None:
+        self._profile.disable()
+
+    def save(self, path: Path) -> None:
+        self._profile.dump_stats(path)
+
+
+class _Pyinstrument:
+    suffix = '.html'
+
+    def __init__(self):
+        from pyinstrument import Profiler
+        self._profiler = Profiler(async_mode='enabled')
+
+    def start(self) -> bool:
+        try:
+            self._profiler.start()
+        except RuntimeError:
+            return False
+        return True
+
+    def stop(self) -> None:
+        self._profiler.stop()
+
+    def save(self, path: Path) -> None:
+        path.write_text(self._profiler.output_html(), encoding='utf-8')
+
+
+def _profiler_class():
+    name = getattr(settings, 'PROFILER', 'cprofile')
+    if name == 'cprofile':
+        return _CProfile
+    if name == 'pyinstrument':
+        try:
+            import pyinstrument  # noqa: F401
+        except ImportError as exc:
+            raise ImproperlyConfigured(
+                "PROFILER = 'pyinstrument' requires the pyinstrument package (pip install pyinstrument)"
+            ) from exc
+        return _Pyinstrument
+    raise ImproperlyConfigured(f"Unknown PROFILER {name!r}; expected 'cprofile' or 'pyinstrument'")
+
+
+def _server_timing(timings: dict) -> str:
+    parts = []
+    for name, seconds, desc in (
+        ('total', timings['total'], None),
+        ('app', timings['app'], None),
+        ('render', timings['render'], None),
+        ('lock', timings['lock_wait'], None),
+        ('read', timings['read'], f"{timings['read_bytes']} B"),
+        ('parse', timings['parse'], None),
+        ('serialize', timings['serialize'], None),
+        ('write', timings['write'], f"{timings['write_bytes']} B"),
+    ):
+        part = f'{name};dur={seconds * 1000:.2f}'
+        if desc:
+            part += f';desc="{desc}"'
+        parts.append(part)
+    return ', '.join(parts)
+
+
+class ProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILE_REQUESTS', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        slow_ms = getattr(settings, 'PROFILE_SLOW_MS', None)
+        self.slow = slow_ms / 1000 if slow_ms is not None else None
+        self.profiler = _profiler_class() if self.slow is not None else None
+        self.profile_dir = Path(getattr(settings, 'PROFILE_DIR', Path(settings.BASE_DIR) / 'profiles'))
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        start, profiler = self._begin(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            if profiler:
+                profiler.stop()
+        return self._finish(request, response, start, profiler)
+
+    async def __acall__(self, request):
+        start, profiler = self._begin(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            if profiler:
+                profiler.stop()
+        return self._finish(request, response, start, profiler)
+
+    def process_template_response(self, request, response):
+        # Called just before a DRF response is rendered.
+        request._profiling_render_start = time.perf_counter()
+        return response
+
+    def _begin(self, request) -> tuple:
+        profiler = None
+        if self.profiler is not None:
+            profiler = self.profiler()
+            if not profiler.start():
+                profiler = None
+        return time.perf_counter(), profiler
+
+    def _finish(self, request, response, start, profiler):
+        end = time.perf_counter()
+        render_start = getattr(request, '_profiling_render_start', None)
+        timings = dict(metrics.current() or {})
+        timings['total'] = end - start
+        timings['render'] = end - render_start if render_start else 0.0
+        timings['app'] = max(0.0, timings['total'] - timings['render'] - sum(
+            timings.get(k, 0.0) for k in ('lock_wait', 'read', 'parse', 'serialize', 'write')
+        ))
+        for key in ('lock_wait', 'read', 'parse', 'serialize', 'write'):
+            timings.setdefault(key, 0.0)
+        timings.setdefault('read_bytes', 0)
+        timings.setdefault('write_bytes', 0)
+        response['Server-Timing'] = _server_timing(timings)
+        record = {
+            'method': request.method, 'path': request.path, 'status': response.status_code,
+            **{f'{k}_ms' if isinstance(v, float) else k: round(v * 1000, 3) if isinstance(v, float) else v
+               for k, v in timings.items()},
+        }
+        if profiler is not None and timings['total'] >= self.slow:
+            self.profile_dir.mkdir(parents=True, exist_ok=True)
+            name = f"{time.strftime('%Y%m%d-%H%M%S')}-{request.method}-{request.path.strip('/').replace('/', '_')}"
+            path = self.profile_dir / f'{name}-{int(timings["total"] * 1000)}ms{profiler.suffix}'
+            profiler.save(path)
+            record['profile'] = str(path)
+        logger.info(json.dumps(record))
+        return response
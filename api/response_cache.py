@@ -0,0 +1,111 @@
+"""Cache of describe/list controller results (``settings.RESPONSE_CACHE``).
+
+``@cached('teams', 'users')`` on a controller ``*_dict`` method stores its
+result in the Django cache named by ``settings.RESPONSE_CACHE`` (None turns
+caching off). The key covers the method, its arguments and a generation
+number for each listed table. Every committed write to one of those tables
+bumps its generation through a storage ``on_write`` hook, so later lookups
+miss and entries computed from the old data are never served again; they
+simply expire (``settings.RESPONSE_CACHE_TTL``) or are culled by the
+backend's size limit.
+
+Generations live in the cache itself. With several worker processes the
+cache must therefore be shared by all of them (the file-based
+``'responses'`` alias, Redis, ...); a per-process ``LocMemCache`` only sees
+the writes of its own process.
+
+Hit/miss counters are per process; see ``stats()``.
+"""
+from __future__ import annotations
+import functools
+import hashlib
+import json
+import threading
+import time
+from typing import Callable, Dict
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .storage import on_write
+
+_MISSING = object()
+_counters: Dict[str, int] = {'hits': 0, 'misses': 0, 'invalidations': 0}
+_counters_lock = threading.Lock()
+_watched: set = set()
+
+
+def _count(name: str) -> None:
+    with _counters_lock:
+        _counters[name] += 1
+
+
+def _cache():
+    alias = getattr(settings, 'RESPONSE_CACHE', None)
+    return caches[alias] if alias else None
+
+
+def _generation_key(table: str) -> str:
+    return f'responses:gen:{table}'
+
+
+def _fresh_generation() -> int:
+    # Never an old value: a generation evicted from the cache must not
+    # restart at a number that old entries were stored under.
+    return time.time_ns()
+
+
+def _generations(cache, tables: tuple) -> tuple:
+    keys = [_generation_key(t) for t in tables]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            cache.add(key, _fresh_generation(), None)
+            found[key] = cache.get(key)
+    return tuple(found[key] for key in keys)
+
+
+def _invalidate(table: str) -> None:
+    cache = _cache()
+    if cache is None:
+        return
+    key = _generation_key(table)
+    try:
+        cache.incr(key)
+    except ValueError:  # not set yet, or evicted
+        cache.set(key, _fresh_generation(), None)
+    _count('invalidations')
+
+
+def cached(*tables: str) -> Callable:
+    """Cache a controller ``*_dict`` method until one of ``tables`` is written."""
+    for table in tables:
+        if table not in _watched:
+            _watched.add(table)
+            on_write(table, _invalidate)
+
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, data: dict):
+            cache = _cache()
+            if cache is None:
+                return method(self, data)
+            generations = _generations(cache, tables)
+            raw = json.dumps([method.__qualname__, data, generations], sort_keys=True, default=str)
+            key = 'responses:' + hashlib.blake2b(raw.encode(), digest_size=20).hexdigest()
+            result = cache.get(key, _MISSING)
+            if result is not _MISSING:
+                _count('hits')
+                return result
+            _count('misses')
+            result = method(self, data)
+            cache.set(key, result, getattr(settings, 'RESPONSE_CACHE_TTL', 300))
+            return result
+        return wrapper
+    return decorate
+
+
+def stats() -> dict:
+    with _counters_lock:
+        counters = dict(_counters)
+    return {'cache': getattr(settings, 'RESPONSE_CACHE', None), **counters}
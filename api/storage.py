@@ -1,46 +1,889 @@
 from __future__ import annotations
-import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+from contextlib import contextmanager
 from pathlib import Path
-from typing import List
+from typing import Any, Callable, ContextManager, Dict, Hashable, Iterator, List, NamedTuple, TypeVar
 from django.conf import settings
-from filelock import FileLock
+from filelock import FileLock, Timeout
+
+from . import metrics
+from .storage_formats import Format, get_format
 
 DB_DIR = Path(settings.BASE_DIR) / 'db'
-DB_DIR.mkdir(parents=True, exist_ok=True)
 
-class JSONTable:
-    def __init__(self, filename: str):
-        self.path = DB_DIR / filename
-        self.lock = FileLock(str(self.path) + '.lock')
+T = TypeVar('T')
+
+logger = logging.getLogger(__name__)
+
+# table name -> callbacks run after every committed write to it in this process
+_write_listeners: Dict[str, List[Callable[[str], None]]] = {}
+
+
+def on_write(name: str, fn: Callable[[str], None]) -> None:
+    """Call ``fn(name)`` after each committed write to table ``name`` (e.g. ``'users'``).
+
+    Only writes made by this process are reported, whichever table object
+    made them. A failing callback is logged; the write stands.
+    """
+    _write_listeners.setdefault(name, []).append(fn)
+
+
+def _notify_write(name: str) -> None:
+    for fn in _write_listeners.get(name, ()):
+        try:
+            fn(name)
+        except Exception:
+            logger.exception('write listener for %s failed', name)
+
+
+def _clone(value):
+    """Copy a JSON value; much cheaper than copy.deepcopy for plain dicts/lists."""
+    if isinstance(value, dict):
+        return {k: _clone(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_clone(v) for v in value]
+    return value
+
+
+def _index_keys(key_fn: Callable[[dict], Any], row: dict) -> tuple:
+    key = key_fn(row)
+    if key is None:
+        return ()
+    if isinstance(key, list):
+        return tuple(key)
+    return (key,)
+
+
+def _sorted_view(key_fn: Callable[[dict], Any], rows: List[dict]) -> List[tuple]:
+    return sorted((key, r.get('id')) for r in rows for key in _index_keys(key_fn, r))
+
+
+def _slice_view(view: List[tuple], start, stop, after: tuple | None, limit: int | None) -> List[tuple]:
+    lo = 0 if start is None else bisect_left(view, (start,))
+    if after is not None:
+        lo = max(lo, bisect_right(view, tuple(after)))
+    hi = len(view) if stop is None else max(lo, bisect_left(view, (stop,)))
+    if limit is not None:
+        hi = min(hi, lo + limit)
+    return view[lo:hi]
+
+
+def _stat_signature(path: Path) -> tuple | None:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+def _fsync_dir(path: Path) -> None:
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _replace_file(path: Path, data: bytes, *, fsync: bool = False) -> None:
+    """Write ``data`` to a temporary file and rename it over ``path``.
+
+    Readers opening ``path`` see either the old or the new file in full, never
+    a partial write, so they do not need the table lock. With ``fsync`` the
+    data and the rename are on disk when this returns.
+    """
+    tmp = path.with_name(f'.{path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+    try:
+        with open(tmp, 'wb') as f:
+            f.write(data)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp, path)
+        if fsync:
+            _fsync_dir(path.parent)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+class TableLock:
+    """A table's cross-process ``FileLock`` behind an in-process lock.
+
+    Threads of one process queue on a ``threading.RLock``, and only the
+    thread holding it takes the ``FileLock``. Contention between threads is
+    therefore resolved in memory, and at most one thread per process polls
+    the lock file. Reentrant in the holding thread, like ``FileLock``. Each
+    outermost acquisition is reported to ``metrics.lock_acquired`` with the
+    time it waited.
+    """
+
+    def __init__(self, lock_file: str, name: str):
+        self.name = name
+        self._thread_lock = threading.RLock()
+        self._file_lock = FileLock(lock_file)
+        self._depth = 0
+
+    @property
+    def lock_file(self) -> str:
+        return self._file_lock.lock_file
+
+    def acquire(self) -> None:
+        start = time.perf_counter()
+        contended = not self._thread_lock.acquire(blocking=False)
+        if contended:
+            self._thread_lock.acquire()
+        if self._depth:
+            self._depth += 1
+            return
+        try:
+            try:
+                self._file_lock.acquire(timeout=0)
+            except Timeout:
+                contended = True
+                self._file_lock.acquire()
+        except BaseException:
+            self._thread_lock.release()
+            raise
+        self._depth = 1
+        metrics.lock_acquired(self.name, time.perf_counter() - start, contended)
+
+    def release(self) -> None:
+        self._depth -= 1
+        if not self._depth:
+            self._file_lock.release()
+        self._thread_lock.release()
+
+    def __enter__(self) -> 'TableLock':
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.release()
+
+
+class Version(NamedTuple):
+    """Change token of a table, obtained without reading its rows.
+
+    ``tag`` differs after every write; ``modified`` is the Unix time of the
+    last write (0 if unknown).
+    """
+    tag: str
+    modified: float
+
+
+def _file_version(sig: tuple | None) -> Version:
+    if sig is None:
+        return Version('0', 0.0)
+    ino, size, mtime_ns = sig
+    return Version(f'{ino:x}.{size:x}.{mtime_ns:x}', mtime_ns / 1e9)
+
+
+class FileEngine:
+    """Default on-disk layout: the whole table as one array, encoded in ``fmt``.
+
+    An engine only moves rows between memory and disk; ``JSONTable`` owns
+    locking, caching and indexes. Writes (``save``, ``record``) run with the
+    table lock held; every write replaces the file atomically, so ``load``
+    and ``signature`` are safe without it.
+    """
+
+    def __init__(self, path: Path, fmt: Format):
+        self.path = path
+        self.format = fmt
+        self.fsync = getattr(settings, 'STORAGE_FSYNC', False)
         if not self.path.exists():
-            self.path.write_text('[]', encoding='utf-8')
+            _replace_file(self.path, fmt.dumps([]))
+
+    def signature(self) -> tuple:
+        """Cheap token that changes whenever the stored table changes."""
+        return _stat_signature(self.path)
+
+    def version(self) -> Version:
+        return _file_version(self.signature())
+
+    def load(self) -> List[dict]:
+        start = time.perf_counter()
+        data = self.path.read_bytes()
+        read = time.perf_counter()
+        try:
+            rows = self.format.loads(data)
+        except ValueError:
+            rows = []
+        metrics.storage_read(len(data), read - start, time.perf_counter() - read)
+        return rows
+
+    def save(self, rows: List[dict]) -> None:
+        start = time.perf_counter()
+        data = self.format.dumps(rows)
+        encoded = time.perf_counter()
+        _replace_file(self.path, data, fsync=self.fsync)
+        metrics.storage_write(len(data), encoded - start, time.perf_counter() - encoded)
+
+    def record(self, ops: List[dict], rows: List[dict]) -> bool:
+        """Persist a committed batch of changes.
+
+        ``ops`` are ``{'op': 'upsert', 'row': ...}`` / ``{'op': 'delete', 'id': ...}``
+        entries and ``rows`` is the whole table after applying them. Returns
+        True when the engine would like to be compacted.
+        """
+        self.save(rows)
+        return False
+
+    def needs_compaction(self) -> bool:
+        return False
+
+    def size(self) -> int:
+        """Bytes on disk (a stat; nothing is read)."""
+        sig = _stat_signature(self.path)
+        return sig[1] if sig else 0
+
+
+def table_path(filename: str, fmt: Format) -> Path:
+    """Data file of table ``filename`` (e.g. ``'users.json'``) when stored in ``fmt``."""
+    return (DB_DIR / filename).with_suffix(fmt.suffix)
+
+
+def _engine_class(name: str):
+    if name == 'wal':
+        from .storage_wal import LogEngine
+        return LogEngine
+    return FileEngine
+
+
+class _Snapshot:
+    """Parsed rows of a table plus the lookup structures derived from them.
+
+    Snapshots are never modified once published; writers build a new one and
+    swap it in, so readers in other threads always see a consistent state.
+    """
+
+    __slots__ = ('sig', 'rows', 'pos', 'indexes', 'views')
+
+    def __init__(self, sig: tuple, rows: List[dict], pos: Dict[Any, int],
+                 indexes: Dict[str, Dict[Hashable, tuple]],
+                 views: Dict[str, List[tuple]] | None = None):
+        self.sig = sig
+        self.rows = rows
+        self.pos = pos
+        self.indexes = indexes
+        # index name -> sorted (key, id) pairs, built the first time ``scan`` needs them
+        self.views = {} if views is None else views
+
+    def get(self, _id) -> dict | None:
+        i = self.pos.get(_id)
+        return self.rows[i] if i is not None else None
+
+    def view(self, name: str, key_fn: Callable[[dict], Any]) -> List[tuple]:
+        view = self.views.get(name)
+        if view is None:
+            # Two threads may race to build it; both results are identical.
+            view = self.views[name] = _sorted_view(key_fn, self.rows)
+        return view
+
+
+class TableTransaction:
+    """
+    Reads and writes of one table under a single lock acquisition.
+
+    Obtained from ``Table.transaction()``. Reads see the transaction's own
+    pending changes. ``get`` returns a private copy; rows from ``find`` and
+    ``rows`` are read-only.
+    """
+
+    def get(self, _id: str) -> dict | None:
+        raise NotImplementedError
+
+    def find(self, index: str, key: Hashable) -> List[dict]:
+        raise NotImplementedError
+
+    def find_one(self, index: str, key: Hashable) -> dict | None:
+        rows = self.find(index, key)
+        return rows[0] if rows else None
+
+    def rows(self) -> List[dict]:
+        raise NotImplementedError
+
+    def upsert(self, row: dict) -> None:
+        raise NotImplementedError
+
+    def delete(self, _id: str) -> bool:
+        raise NotImplementedError
+
+
+class Table:
+    """
+    Interface shared by the storage backends behind ``open_table``.
+
+    ``name`` is the table's name for ``on_write`` listeners.
+
+    Rows are plain dicts keyed by ``'id'``. Rows returned by ``read`` and
+    ``find`` may be shared with a backend cache and must be treated as
+    read-only; ``get_by_id`` always returns a private copy.
+
+    Read-modify-write sequences belong in ``transaction()``, which holds the
+    table's write lock from the first read to the final write::
+
+        with BOARDS.transaction() as tx:
+            board = tx.get(board_id)
+            board['status'] = 'CLOSED'
+            tx.upsert(board)
+    """
+
+    name = ''
+    # True when ``get_by_id`` finds a row without reading the whole table.
+    indexed_lookups = True
 
     def read(self) -> List[dict]:
-        with self.lock:
-            txt = self.path.read_text(encoding='utf-8')
-            try:
-                return json.loads(txt)
-            except json.JSONDecodeError:
-                return []
+        raise NotImplementedError
+
+    def iter_rows(self) -> Iterator[dict]:
+        """Yield all rows (read-only) without necessarily loading them at once."""
+        return iter(self.read())
 
     def write(self, rows: List[dict]) -> None:
+        """Replace the whole table with ``rows``."""
+        raise NotImplementedError
+
+    def get_by_id(self, _id: str) -> dict | None:
+        raise NotImplementedError
+
+    def version(self) -> Version:
+        """Cheap token that changes whenever the table is written (for HTTP validators)."""
+        raise NotImplementedError
+
+    def find(self, index: str, key: Hashable) -> List[dict]:
+        """Return the rows stored under ``key`` in the secondary index ``index``."""
+        raise NotImplementedError
+
+    def find_one(self, index: str, key: Hashable) -> dict | None:
+        rows = self.find(index, key)
+        return rows[0] if rows else None
+
+    def scan(self, index: str, start: Hashable = None, stop: Hashable = None, *,
+             after: tuple | None = None, limit: int | None = None) -> List[tuple]:
+        """Return ``(key, row)`` pairs of ``index`` in ``(key, id)`` order.
+
+        Only keys with ``start <= key < stop`` are included (either bound may
+        be None), and only entries after ``after``, the ``(key, id)`` of the
+        last entry a previous page returned. Rows are read-only.
+        """
+        raise NotImplementedError
+
+    def transaction(self) -> ContextManager[TableTransaction]:
+        """Lock the table once; changes are written on a clean exit, if any."""
+        raise NotImplementedError
+
+    def submit(self, fn: Callable[[TableTransaction], T]) -> T:
+        """Run ``fn(tx)`` in a transaction and return its result.
+
+        Tables with group commit enabled may share that transaction, and its
+        single write, with concurrent callers; see ``_GroupCommit``.
+        """
+        with self.transaction() as tx:
+            return fn(tx)
+
+    def upsert(self, row: dict) -> None:
+        with self.transaction() as tx:
+            tx.upsert(row)
+
+    def delete(self, _id: str) -> bool:
+        """Remove the row with id ``_id``; return whether it existed."""
+        with self.transaction() as tx:
+            return tx.delete(_id)
+
+    def stats(self) -> dict:
+        """``{'rows': n, 'bytes': n}`` for ``metrics``, each None unless known without reading the table."""
+        return {'rows': None, 'bytes': None}
+
+
+class _JSONTransaction(TableTransaction):
+    def __init__(self, table: 'JSONTable', snap: _Snapshot):
+        self._table = table
+        self._snap = snap
+        # id -> new row, or None for a deleted row
+        self.changes: Dict[Any, dict | None] = {}
+
+    def get(self, _id: str) -> dict | None:
+        row = self.changes[_id] if _id in self.changes else self._snap.get(_id)
+        return _clone(row) if row is not None else None
+
+    def find(self, index: str, key: Hashable) -> List[dict]:
+        snap = self._snap
+        out = [snap.get(i) for i in snap.indexes[index].get(key, ()) if i not in self.changes]
+        key_fn = self._table.indexes[index]
+        out += [r for r in self.changes.values() if r is not None and key in _index_keys(key_fn, r)]
+        return out
+
+    def rows(self) -> List[dict]:
+        if not self.changes:
+            return list(self._snap.rows)
+        out = [r for r in self._snap.rows if r.get('id') not in self.changes]
+        return out + [r for r in self.changes.values() if r is not None]
+
+    def upsert(self, row: dict) -> None:
+        self.changes[row.get('id')] = _clone(row)
+
+    def delete(self, _id: str) -> bool:
+        existed = (self.changes[_id] if _id in self.changes else self._snap.get(_id)) is not None
+        self.changes[_id] = None
+        return existed
+
+
+class _Pending:
+    __slots__ = ('fn', 'arrived', 'result', 'error', 'done', 'lead', 'wake')
+
+    def __init__(self, fn: Callable):
+        self.fn = fn
+        self.arrived = time.monotonic()
+        self.result = None
+        self.error: BaseException | None = None
+        self.done = False
+        self.lead = False
+        # Set when the call is done or its caller is made the leader.
+        self.wake = threading.Event()
+
+
+class _GroupCommit:
+    """Coalesce concurrent ``JSONTable.submit`` calls into one durable write.
+
+    The first caller to find no batch in progress becomes the leader: it
+    waits until the oldest queued call is ``window`` seconds old or
+    ``max_ops`` calls are queued, runs every queued function inside one
+    transaction, commits (with fsync) and only then releases the callers.
+    A function that raises only rolls back its own changes. Once the batch
+    holding its own call is written, the leader hands over to the oldest
+    queued caller, if any, and returns, so no caller leads for longer than
+    one batch under a steady stream of writes.
+    """
+
+    def __init__(self, table: 'JSONTable', window: float, max_ops: int):
+        self.table = table
+        self.window = window
+        self.max_ops = max_ops
+        self._cond = threading.Condition()
+        self._queue: List[_Pending] = []
+        self._leading = False
+
+    def run(self, fn: Callable[[TableTransaction], T]) -> T:
+        item = _Pending(fn)
+        with self._cond:
+            self._queue.append(item)
+            if not self._leading:
+                self._leading = item.lead = True
+            elif len(self._queue) >= self.max_ops:
+                self._cond.notify_all()
+        if not item.lead:
+            item.wake.wait()
+        if not item.done:  # made the leader
+            self._lead(item)
+        if item.error is not None:
+            raise item.error
+        return item.result
+
+    def _lead(self, own: _Pending) -> None:
+        try:
+            while True:
+                with self._cond:
+                    if own.done:
+                        return
+                    deadline = self._queue[0].arrived + self.window
+                    while len(self._queue) < self.max_ops:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                    batch = self._queue[:self.max_ops]
+                    del self._queue[:self.max_ops]
+                self._flush(batch)
+        finally:
+            # Also when a BaseException (KeyboardInterrupt, SystemExit) ends
+            # this leader early: the queued callers would wait forever.
+            with self._cond:
+                if not own.done and own in self._queue:
+                    self._queue.remove(own)
+                if self._queue:
+                    successor = self._queue[0]
+                    successor.lead = True
+                    successor.wake.set()
+                else:
+                    self._leading = False
+
+    def _flush(self, batch: List[_Pending]) -> None:
+        try:
+            with self.table.transaction() as tx:
+                for item in batch:
+                    saved = dict(tx.changes)
+                    try:
+                        item.result = item.fn(tx)
+                    except Exception as e:
+                        tx.changes = saved
+                        item.error = e
+        except BaseException as e:
+            # Nothing of the batch was written.
+            for item in batch:
+                if item.error is None:
+                    item.error = e
+            if not isinstance(e, Exception):
+                raise
+        finally:
+            for item in batch:
+                item.done = True
+                item.wake.set()
+
+
+class JSONTable(Table):
+    """A list of JSON rows persisted in a single file under ``db/``.
+
+    With ``cache=True`` (default: ``settings.STORAGE_CACHE``) the parsed rows
+    are kept in memory together with the file's (inode, size, mtime)
+    signature. The file is only reparsed when that signature changes, i.e.
+    when another process or table object has written it, so unchanged tables
+    cost one ``stat`` per access.
+
+    ``indexes`` maps an index name to a key function, e.g.
+    ``{'name': lambda r: r['name'].lower()}``. In cached mode every index is a
+    hash map from key to row ids, rebuilt when the file is reparsed and
+    patched by each commit; ``find`` probes it in O(1). A key function
+    returning ``None`` leaves the row out of that index, and one returning a
+    list indexes the row under every key in it (e.g. all task ids of a board).
+    ``scan`` walks an index in key order (for paginated listings) over a
+    sorted copy of it that is built on first use and patched by commits.
+
+    ``engine`` picks the on-disk layout (default: ``settings.STORAGE_ENGINE``):
+    ``'file'`` rewrites the whole table per change, ``'wal'`` appends each
+    change to a log and compacts it in the background (see ``storage_wal``).
+    ``fmt`` picks the encoding of that file (default:
+    ``settings.STORAGE_FORMAT``, see ``storage_formats``).
+
+    ``group_commit_ms`` (0: off) lets ``submit`` calls from concurrent threads
+    that arrive within that window share one fsynced write, up to
+    ``settings.STORAGE_GROUP_COMMIT_MAX`` calls per write.
+    """
+
+    def __init__(self, filename: str, *, cache: bool | None = None,
+                 indexes: Dict[str, Callable[[dict], Any]] | None = None,
+                 engine: str | None = None, fmt: str | None = None,
+                 group_commit_ms: float = 0):
+        self.name = Path(filename).with_suffix('').as_posix()
+        self.format = get_format(fmt or getattr(settings, 'STORAGE_FORMAT', 'json'))
+        self.path = table_path(filename, self.format)
+        # Locked by table name, so processes that disagree on the format still exclude each other.
+        # Lock metrics are kept per top-level table ('boards' for all its shards).
+        self.lock = TableLock(str(DB_DIR / filename) + '.lock', self.name.partition('/')[0])
+        self.cache = getattr(settings, 'STORAGE_CACHE', False) if cache is None else cache
+        self.indexes = dict(indexes or {})
+        self._engine_name = engine or getattr(settings, 'STORAGE_ENGINE', 'file')
+        self._engine = None
+        self._snapshot: _Snapshot | None = None
+        self._reload_lock = threading.Lock()
+        self._compacting = False
+        self._row_count: int | None = None
+        self._group: _GroupCommit | None = None
+        if group_commit_ms:
+            self._group = _GroupCommit(
+                self, group_commit_ms / 1000, getattr(settings, 'STORAGE_GROUP_COMMIT_MAX', 64)
+            )
+
+    @property
+    def engine(self):
+        """The table's engine, opened (creating the file if needed) on first use."""
+        engine = self._engine
+        if engine is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # The table lock alone guards the creation: transaction() and
+            # write() get here already holding it, so taking a second lock
+            # around it would invert their order.
+            with self.lock:
+                engine = self._engine
+                if engine is None:
+                    engine = _engine_class(self._engine_name)(self.path, self.format)
+                    if self._group is not None:
+                        # Callers are acknowledged once their batch is durable.
+                        engine.fsync = True
+                    self._engine = engine
+        return engine
+
+    def _signature(self) -> tuple:
+        return self.engine.signature()
+
+    def _parse(self) -> List[dict]:
+        rows = self.engine.load()
+        self._row_count = len(rows)
+        metrics.table_read(self.lock.name)
+        return rows
+
+    def _build(self, sig: tuple, rows: List[dict]) -> _Snapshot:
+        pos = {r.get('id'): i for i, r in enumerate(rows)}
+        indexes = {}
+        for name, key_fn in self.indexes.items():
+            index: Dict[Hashable, tuple] = {}
+            for r in rows:
+                for key in _index_keys(key_fn, r):
+                    index[key] = index.get(key, ()) + (r.get('id'),)
+            indexes[name] = index
+        return _Snapshot(sig, rows, pos, indexes)
+
+    def _remember(self, sig: tuple, rows: List[dict]) -> _Snapshot:
+        self._snapshot = self._build(sig, rows)
+        return self._snapshot
+
+    def _cached(self) -> _Snapshot:
+        """Return the current snapshot, reparsing the file if it is stale.
+
+        Needs no file lock: the signature is taken before the file is read, so
+        if a writer replaces the file in between, the snapshot is remembered
+        under the older signature and simply reparsed on the next access.
+        """
+        # Taken before _reload_lock: the first call opens the engine, which
+        # takes the table lock, and transaction() holds that lock while it
+        # waits for _reload_lock.
+        sig = self._signature()
+        snap = self._snapshot
+        if snap is not None and snap.sig == sig:
+            return snap
+        # Only one thread per process reparses; the others wait and reuse it.
+        with self._reload_lock:
+            sig = self._signature()
+            snap = self._snapshot
+            if snap is not None and snap.sig == sig:
+                return snap
+            return self._remember(sig, self._parse())
+
+    def _apply(self, snap: _Snapshot, changes: Dict[Any, dict | None]) -> _Snapshot:
+        """Return ``snap`` with ``changes`` applied (signature left unset)."""
+        if any(row is None for row in changes.values()):
+            # Deletes shift row positions; rebuild everything.
+            rows = [r for r in snap.rows if r.get('id') not in changes]
+            rows += [r for r in changes.values() if r is not None]
+            return self._build(None, rows)
+        rows = list(snap.rows)
+        pos = snap.pos
+        old_rows = {}
+        for _id, row in changes.items():
+            i = pos.get(_id)
+            if i is None:
+                if pos is snap.pos:
+                    pos = dict(pos)
+                pos[_id] = len(rows)
+                rows.append(row)
+            else:
+                old_rows[_id] = rows[i]
+                rows[i] = row
+        # Patch only the index buckets the changed rows move between.
+        indexes = {}
+        for name, key_fn in self.indexes.items():
+            index = snap.indexes[name]
+            copied = False
+            for _id, row in changes.items():
+                old = old_rows.get(_id)
+                old_keys = set(_index_keys(key_fn, old)) if old is not None else set()
+                new_keys = set(_index_keys(key_fn, row))
+                if old_keys == new_keys:
+                    continue
+                if not copied:
+                    index, copied = dict(index), True
+                for key in old_keys - new_keys:
+                    ids = tuple(i for i in index.get(key, ()) if i != _id)
+                    if ids:
+                        index[key] = ids
+                    else:
+                        index.pop(key, None)
+                for key in new_keys - old_keys:
+                    # Keep buckets in table order, like a full rebuild would.
+                    index[key] = tuple(sorted(index.get(key, ()) + (_id,), key=pos.__getitem__))
+            indexes[name] = index
+        # Sorted views that readers already asked for are patched the same way.
+        views = {}
+        for name, view in snap.views.items():
+            key_fn = self.indexes[name]
+            view = list(view)
+            for _id, row in changes.items():
+                old = old_rows.get(_id)
+                old_keys = _index_keys(key_fn, old) if old is not None else ()
+                new_keys = _index_keys(key_fn, row)
+                if set(old_keys) == set(new_keys):
+                    continue
+                for key in old_keys:
+                    del view[bisect_left(view, (key, _id))]
+                for key in new_keys:
+                    insort(view, (key, _id))
+            views[name] = view
+        return _Snapshot(None, rows, pos, indexes, views)
+
+    def _record(self, ops: List[dict], rows: List[dict]) -> None:
+        compact = self.engine.record(ops, rows)
+        self._row_count = len(rows)
+        metrics.table_written(self.lock.name)
+        if compact and not self._compacting:
+            self._compacting = True
+            threading.Thread(
+                target=self._compact, name=f'compact-{self.path.name}', daemon=True
+            ).start()
+
+    def _compact(self) -> None:
+        try:
+            with self.lock:
+                if not self.engine.needs_compaction():
+                    return  # another worker got there first
+                rows = self._cached().rows if self.cache else self._parse()
+                self.engine.save(rows)
+                metrics.table_written(self.lock.name)
+                if self.cache:
+                    self._remember(self._signature(), list(rows))
+        finally:
+            self._compacting = False
+
+    @contextmanager
+    def transaction(self) -> Iterator[TableTransaction]:
         with self.lock:
-            self.path.write_text(
-                json.dumps(rows, ensure_ascii=False, indent=2), encoding='utf-8'
+            snap = self._cached() if self.cache else self._build(None, self._parse())
+            tx = _JSONTransaction(self, snap)
+            yield tx
+            if not tx.changes:
+                return
+            new = self._apply(snap, tx.changes)
+            self._record(
+                [{'op': 'upsert', 'row': row} if row is not None else {'op': 'delete', 'id': _id}
+                 for _id, row in tx.changes.items()],
+                new.rows,
             )
+            if self.cache:
+                new.sig = self._signature()
+                self._snapshot = new
+        _notify_write(self.name)
+
+    def submit(self, fn: Callable[[TableTransaction], T]) -> T:
+        if self._group is None:
+            return super().submit(fn)
+        return self._group.run(fn)
+
+    def scan(self, index: str, start: Hashable = None, stop: Hashable = None, *,
+             after: tuple | None = None, limit: int | None = None) -> List[tuple]:
+        key_fn = self.indexes[index]
+        if self.cache:
+            snap = self._cached()
+            entries = _slice_view(snap.view(index, key_fn), start, stop, after, limit)
+            return [(key, snap.get(_id)) for key, _id in entries]
+        rows = self.read()
+        by_id = {r.get('id'): r for r in rows}
+        entries = _slice_view(_sorted_view(key_fn, rows), start, stop, after, limit)
+        return [(key, by_id[_id]) for key, _id in entries]
+
+    def read(self) -> List[dict]:
+        """Return all rows.
+
+        In cached mode the row dicts are shared with the cache: treat them as
+        read-only and use ``get_by_id`` for a row you intend to modify.
+        """
+        if self.cache:
+            return list(self._cached().rows)
+        return self._parse()
+
+    def version(self) -> Version:
+        # A stat or two; the rows are not read.
+        return self.engine.version()
+
+    def iter_rows(self) -> Iterator[dict]:
+        # Snapshots are immutable, so iterating one needs no copy.
+        return iter(self._cached().rows if self.cache else self._parse())
+
+    def write(self, rows: List[dict]) -> None:
+        with self.lock:
+            self.engine.save(rows)
+            self._row_count = len(rows)
+            metrics.table_written(self.lock.name)
+            if self.cache:
+                self._remember(self._signature(), list(rows))
+        _notify_write(self.name)
+
+    @property
+    def indexed_lookups(self) -> bool:
+        return self.cache
 
     def get_by_id(self, _id: str, *, id_field: str = 'id') -> dict | None:
+        if self.cache and id_field == 'id':
+            row = self._cached().get(_id)
+            return _clone(row) if row is not None else None
         for r in self.read():
             if r.get(id_field) == _id:
-                return r
+                return _clone(r) if self.cache else r
         return None
 
-    def upsert(self, row: dict, *, id_field: str = 'id') -> None:
-        rows = self.read()
-        for i, r in enumerate(rows):
-            if r.get(id_field) == row.get(id_field):
-                rows[i] = row
-                self.write(rows)
-                return
-        rows.append(row)
-        self.write(rows)
+    def stats(self) -> dict:
+        # Row count as of this process's last load or write of the file, and
+        # a stat of the files; neither opens a table that is not in use yet.
+        engine = self._engine
+        return {'rows': self._row_count, 'bytes': engine.size() if engine is not None else None}
+
+    def find(self, index: str, key: Hashable) -> List[dict]:
+        """Return the rows whose ``index`` key equals ``key`` (read-only, like ``read``)."""
+        if self.cache:
+            snap = self._cached()
+            return [snap.get(_id) for _id in snap.indexes[index].get(key, ())]
+        key_fn = self.indexes[index]
+        return [r for r in self.read() if key in _index_keys(key_fn, r)]
+
+
+# Secondary indexes of the application tables. The SQLite backend answers
+# the same index names from SQL indexes (see storage_sqlite).
+INDEXES: Dict[str, Dict[str, Callable[[dict], Any]]] = {
+    'users': {
+        'name': lambda u: u['name'].lower(),
+    },
+    'teams': {
+        'name': lambda t: t['name'].lower(),
+        # user id -> teams the user administers or belongs to
+        'member': lambda t: list({t.get('admin'), *t.get('users', [])} - {None}),
+    },
+    'boards': {
+        'team': lambda b: b['team_id'],
+        'team_name': lambda b: (b['team_id'], b['name'].lower()),
+        'task': lambda b: [t['id'] for t in b.get('tasks', [])],
+        # (team id, lowercased name) of OPEN boards only, for paged list_boards
+        'open_name': lambda b: (b['team_id'], b['name'].lower()) if b.get('status') == 'OPEN' else None,
+        # team id of OPEN boards only, for list_boards in table order
+        'open_team': lambda b: b['team_id'] if b.get('status') == 'OPEN' else None,
+    },
+}
+
+
+# name -> the process-wide instance of that application table
+_tables: Dict[str, Table] = {}
+_tables_lock = threading.Lock()
+
+
+def open_table(name: str) -> Table:
+    """Return this process's instance of application table ``name``.
+
+    Every caller gets the same object, so its cached snapshot, indexes and
+    locks are shared rather than duplicated per module. Tables are created
+    on the first call and touch no files until they are first used.
+    """
+    with _tables_lock:
+        table = _tables.get(name)
+        if table is None:
+            table = _tables[name] = _open_table(name)
+        return table
+
+
+def table_stats() -> Dict[str, dict]:
+    """``stats()`` of each table this process has opened, by name (for ``metrics``)."""
+    with _tables_lock:
+        tables = list(_tables.values())
+    return {table.name: table.stats() for table in tables}
+
+
+def _open_table(name: str) -> Table:
+    """Open application table ``name`` on the backend chosen by ``settings.STORAGE_BACKEND``."""
+    if getattr(settings, 'STORAGE_BACKEND', 'json') == 'sqlite':
+        from .storage_sqlite import open_sqlite_table
+        return open_sqlite_table(name)
+    if name == 'boards' and getattr(settings, 'STORAGE_SHARD_BOARDS', False):
+        from .storage_sharded import ShardedBoardTable
+        return ShardedBoardTable('boards', indexes=INDEXES['boards'])
+    group_commit_ms = getattr(settings, 'STORAGE_GROUP_COMMIT_MS', 0) if name == 'boards' else 0
+    return JSONTable(f'{name}.json', indexes=INDEXES.get(name), group_commit_ms=group_commit_ms)
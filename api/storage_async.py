@@ -0,0 +1,92 @@
+"""Non-blocking access to the storage tables from async code.
+
+Table operations block on file reads and on the cross-process ``FileLock``,
+so async callers (``views_async``) run them on thread pools:
+
+``run_read(fn, ...)``
+    On up to ``STORAGE_ASYNC_READERS`` threads. Reads never take a lock.
+``run_write(fn, ...)``
+    On up to ``STORAGE_ASYNC_WRITERS`` threads. Writers may wait for a table
+    lock; the bounded pool keeps those waits to a few threads per process
+    while any number of further writers wait as suspended coroutines, and
+    keeps them from starving reads.
+
+``AsyncTable`` wraps a ``Table`` with awaitable versions of its methods.
+"""
+from __future__ import annotations
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, List
+
+from django.conf import settings
+
+from .storage import Table, Version
+
+_pools: Dict[str, ThreadPoolExecutor] = {}
+_pools_lock = threading.Lock()
+
+
+def _pool(kind: str) -> ThreadPoolExecutor:
+    with _pools_lock:
+        pool = _pools.get(kind)
+        if pool is None:
+            if kind == 'read':
+                workers = getattr(settings, 'STORAGE_ASYNC_READERS', 32)
+            else:
+                workers = getattr(settings, 'STORAGE_ASYNC_WRITERS', 4)
+            pool = _pools[kind] = ThreadPoolExecutor(workers, thread_name_prefix=f'storage-{kind}')
+        return pool
+
+
+async def _run(kind: str, fn: Callable, *args, **kwargs) -> Any:
+    # Like asyncio.to_thread, but on our own pool, with the caller's context.
+    call = functools.partial(contextvars.copy_context().run, fn, *args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(_pool(kind), call)
+
+
+async def run_read(fn: Callable, *args, **kwargs) -> Any:
+    """Await ``fn(*args, **kwargs)``, which only reads tables."""
+    return await _run('read', fn, *args, **kwargs)
+
+
+async def run_write(fn: Callable, *args, **kwargs) -> Any:
+    """Await ``fn(*args, **kwargs)``, which may write tables."""
+    return await _run('write', fn, *args, **kwargs)
+
+
+class AsyncTable:
+    """Awaitable view of ``table``; rows and errors are those of the wrapped table."""
+
+    def __init__(self, table: Table):
+        self.table = table
+        self.name = table.name
+
+    async def read(self) -> List[dict]:
+        return await run_read(self.table.read)
+
+    async def get_by_id(self, _id: str) -> dict | None:
+        return await run_read(self.table.get_by_id, _id)
+
+    async def find(self, index: str, key: Hashable) -> List[dict]:
+        return await run_read(self.table.find, index, key)
+
+    async def find_one(self, index: str, key: Hashable) -> dict | None:
+        return await run_read(self.table.find_one, index, key)
+
+    async def scan(self, index: str, start: Hashable = None, stop: Hashable = None, **kwargs) -> List[tuple]:
+        return await run_read(self.table.scan, index, start, stop, **kwargs)
+
+    async def version(self) -> Version:
+        return await run_read(self.table.version)
+
+    async def submit(self, fn: Callable) -> Any:
+        return await run_write(self.table.submit, fn)
+
+    async def upsert(self, row: dict) -> None:
+        await run_write(self.table.upsert, row)
+
+    async def delete(self, _id: str) -> bool:
+        return await run_write(self.table.delete, _id)
@@ -0,0 +1,93 @@
+"""On-disk encodings for ``JSONTable`` files (``settings.STORAGE_FORMAT``).
+
+``'json'``
+    Compact JSON (no indentation or spaces after separators), written with
+    ``orjson`` when it is installed and the standard library otherwise.
+``'json-pretty'``
+    The original ``indent=2`` layout: larger and slower, but easy to read and
+    diff by hand.
+``'msgpack'``
+    MessagePack (needs the ``msgpack`` package). Tables are stored as
+    ``<name>.msgpack`` instead of ``<name>.json``.
+
+Both JSON formats read either layout, so switching between them needs no
+migration; files are rewritten in the new layout on their next write, or at
+once with ``manage.py convert_storage``. Switching to or from MessagePack
+changes the file names and requires ``convert_storage``.
+"""
+from __future__ import annotations
+import json
+from typing import Any, Callable, Dict
+
+from django.core.exceptions import ImproperlyConfigured
+
+try:
+    import orjson
+except ImportError:  # optional speed-up
+    orjson = None
+
+
+def dumps_json(value: Any) -> bytes:
+    """Compact UTF-8 JSON."""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def loads_json(data: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class Format:
+    """How a table's rows are turned into bytes and back.
+
+    ``loads`` raises ``ValueError`` (or a subclass) for data it cannot decode.
+    """
+
+    def __init__(self, name: str, suffix: str, dumps: Callable[[Any], bytes],
+                 loads: Callable[[bytes], Any]):
+        self.name = name
+        self.suffix = suffix
+        self.dumps = dumps
+        self.loads = loads
+
+    def __repr__(self) -> str:
+        return f'<Format {self.name}>'
+
+
+def _msgpack() -> Format:
+    try:
+        import msgpack
+    except ImportError as exc:
+        raise ImproperlyConfigured(
+            "STORAGE_FORMAT = 'msgpack' requires the msgpack package (pip install msgpack)"
+        ) from exc
+    return Format(
+        'msgpack', '.msgpack',
+        lambda value: msgpack.packb(value, use_bin_type=True),
+        lambda data: msgpack.unpackb(data, raw=False),
+    )
+
+
+_FACTORIES: Dict[str, Callable[[], Format]] = {
+    'json': lambda: Format('json', '.json', dumps_json, loads_json),
+    'json-pretty': lambda: Format(
+        'json-pretty', '.json',
+        lambda value: json.dumps(value, ensure_ascii=False, indent=2).encode('utf-8'),
+        loads_json,
+    ),
+    'msgpack': _msgpack,
+}
+FORMATS = tuple(_FACTORIES)
+
+
+def get_format(name: str) -> Format:
+    try:
+        factory = _FACTORIES[name]
+    except KeyError:
+        raise ImproperlyConfigured(
+            f'Unknown STORAGE_FORMAT {name!r}; expected one of {", ".join(FORMATS)}'
+        ) from None
+    return factory()
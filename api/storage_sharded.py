@@ -0,0 +1,388 @@
+"""One file per board instead of a single ``boards.json`` (``STORAGE_SHARD_BOARDS``).
+
+Layout under ``db/boards/``::
+
+    manifest.json      one summary row per board: id, team_id, name, status
+    <board_id>.json    the full board with its tasks, with its own lock
+    tasks.idx          append-only "<task_id> <board_id>" lines
+    version            one byte appended per commit, for ``version()``
+
+Changing a board only locks and rewrites that board's shard, so writers of
+different boards no longer wait on each other. Locks are always taken
+manifest first, then shards: ``transaction()`` locks the manifest up front
+and shards as it touches them. ``submit()`` first runs its function holding
+only the one shard it touches, which is all that task changes need; if the
+function turns out to need the manifest or a second shard, that attempt is
+rolled back and the function runs again under ``transaction()``. The
+manifest is rewritten only when a board is created, renamed, closed or
+deleted, and answers the ``team`` and ``team_name`` indexes without opening
+any shard.
+
+A task never moves between boards, so the task index only ever grows: lookups
+that miss the in-memory map read whatever other workers appended since the
+last refresh. Entries are appended while the shard is still locked, before
+it is committed, so a committed task is always indexed; an entry whose
+commit never happened names a board without that task, which reads as not
+found. The first miss in a process, or one after an unreadable line (an
+append that landed on the torn tail of a crashed writer), scans the shards
+and appends whatever is missing. As with the log engine, an unfinished last
+line is left for the next refresh.
+"""
+from __future__ import annotations
+import os
+import threading
+from collections import OrderedDict
+from contextlib import ExitStack, contextmanager
+from typing import Callable, ContextManager, Dict, Hashable, Iterator, List
+
+from .storage import (
+    DB_DIR, JSONTable, T, Table, TableTransaction, Version, _file_version, _notify_write, _stat_signature,
+    table_path,
+)
+
+SUMMARY_FIELDS = ('id', 'team_id', 'name', 'status')
+OPEN_SHARDS = 1024
+# The version stamp is emptied once it grows past this many bytes.
+STAMP_MAX = 4096
+
+
+class TaskIndex:
+    """task id -> board id, persisted as an append-only file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.path.touch(exist_ok=True)
+        self._map: Dict[str, str] = {}
+        self._offset = 0
+        self._lock = threading.Lock()
+        # False until checked against the shards (see ShardedBoardTable._board_of).
+        self.complete = False
+
+    def _refresh(self) -> None:
+        with open(self.path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size < self._offset:
+                self._map, self._offset = {}, 0  # rewritten by write()
+            f.seek(self._offset)
+            data = f.read()
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].decode('utf-8', 'replace').splitlines():
+            task_id, _, board_id = line.partition(' ')
+            if board_id and ' ' not in board_id:
+                self._map[task_id] = board_id
+            elif line:
+                self.complete = False
+        self._offset += end
+
+    def get(self, task_id: str) -> str | None:
+        with self._lock:
+            if task_id not in self._map:
+                self._refresh()
+            return self._map.get(task_id)
+
+    def mapping(self) -> Dict[str, str]:
+        with self._lock:
+            self._refresh()
+            return dict(self._map)
+
+    def add(self, pairs: List[tuple]) -> None:
+        if not pairs:
+            return
+        data = ''.join(f'{t} {b}\n' for t, b in pairs).encode('utf-8')
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND)
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+        with self._lock:
+            self._map.update(pairs)
+
+    def reset(self, pairs: List[tuple]) -> None:
+        with self._lock:
+            self.path.write_text(''.join(f'{t} {b}\n' for t, b in pairs), encoding='utf-8')
+            self._map, self._offset = {}, 0
+            self.complete = True
+
+
+class _NeedsManifest(Exception):
+    """A ``submit`` attempt holding one shard lock needs more locks."""
+
+
+class ShardedBoardTable(Table):
+    """Boards stored one file per board; see the module docstring."""
+
+    def __init__(self, dirname: str = 'boards', *, indexes: Dict | None = None,
+                 legacy_file: str | None = 'boards.json'):
+        self.dirname = dirname
+        self.name = dirname
+        # The task index is kept separately; the others only need summary fields.
+        self._manifest = JSONTable(
+            f'{dirname}/manifest.json',
+            indexes={k: v for k, v in (indexes or {}).items() if k != 'task'},
+        )
+        self._tasks: TaskIndex | None = None
+        self.stamp = DB_DIR / dirname / 'version'
+        self._shards: OrderedDict[str, JSONTable] = OrderedDict()
+        self._shards_lock = threading.Lock()
+        self._legacy_file = legacy_file
+        self._ready = False
+        self._opening = False
+        self._open_lock = threading.RLock()
+        self._reindex_lock = threading.Lock()
+
+    def _open(self) -> None:
+        """Create the directory, stamp and task index and import the legacy file, on first use."""
+        with self._open_lock:
+            if self._ready or self._opening:  # the import below reads and writes the table
+                return
+            self._opening = True
+            try:
+                (DB_DIR / self.dirname).mkdir(parents=True, exist_ok=True)
+                self.stamp.touch(exist_ok=True)
+                self._tasks = TaskIndex(DB_DIR / self.dirname / 'tasks.idx')
+                if self._legacy_file:
+                    self._import(self._legacy_file)
+                self._ready = True
+            finally:
+                self._opening = False
+
+    @property
+    def manifest(self) -> JSONTable:
+        if not self._ready:
+            self._open()
+        return self._manifest
+
+    @property
+    def tasks(self) -> TaskIndex:
+        if not self._ready:
+            self._open()
+        return self._tasks
+
+    def _import(self, legacy_file: str) -> None:
+        """Move an existing single-file boards table into shards, once."""
+        legacy = table_path(legacy_file, self.manifest.format)
+        with self.manifest.lock:
+            if legacy.exists():
+                self.write(JSONTable(legacy_file, cache=False).read())
+                for path in (legacy, legacy.with_name(legacy.name + '.log')):
+                    if path.exists():
+                        path.rename(path.with_name(path.name + '.imported'))
+
+    def _shard(self, board_id: str) -> JSONTable:
+        with self._shards_lock:
+            shard = self._shards.get(board_id)
+            if shard is None:
+                shard = JSONTable(f'{self.dirname}/{board_id}.json')
+                self._shards[board_id] = shard
+                if len(self._shards) > OPEN_SHARDS:
+                    self._shards.popitem(last=False)
+            else:
+                self._shards.move_to_end(board_id)
+            return shard
+
+    def _boards(self, ids) -> List[dict]:
+        out = []
+        for board_id in ids:
+            rows = self._shard(board_id).read()
+            if rows:
+                out.append(rows[0])
+        return out
+
+    def read(self) -> List[dict]:
+        return self._boards(r['id'] for r in self.manifest.read())
+
+    def iter_rows(self) -> Iterator[dict]:
+        # One shard at a time.
+        for r in self.manifest.iter_rows():
+            rows = self._shard(r['id']).read()
+            if rows:
+                yield rows[0]
+
+    def get_by_id(self, _id: str) -> dict | None:
+        # Only ids known to the manifest map to files, which also keeps
+        # arbitrary ids from the URL away from the filesystem.
+        if self.manifest.get_by_id(_id) is None:
+            return None
+        return self._shard(_id).get_by_id(_id)
+
+    def _board_of(self, task_id: str) -> str | None:
+        board_id = self.tasks.get(task_id)
+        if board_id is None and not self.tasks.complete:
+            self._reindex()
+            board_id = self.tasks.get(task_id)
+        return board_id
+
+    def _reindex(self) -> None:
+        """Append index entries for tasks found in the shards but not in the index."""
+        with self._reindex_lock:
+            if self.tasks.complete:
+                return
+            self.tasks.complete = True
+            known, missing = self.tasks.mapping(), []
+            for r in self.manifest.iter_rows():
+                for b in self._shard(r['id']).read():
+                    missing += [(t['id'], b['id']) for t in b.get('tasks', [])
+                                if known.get(t['id']) != b['id']]
+            self.tasks.add(missing)
+
+    def find(self, index: str, key: Hashable) -> List[dict]:
+        if index == 'task':
+            board_id = self._board_of(key)
+            board = self.get_by_id(board_id) if board_id else None
+            return [board] if board else []
+        return self._boards(r['id'] for r in self.manifest.find(index, key))
+
+    def scan(self, index: str, start: Hashable = None, stop: Hashable = None, *,
+             after: tuple | None = None, limit: int | None = None) -> List[tuple]:
+        entries = self.manifest.scan(index, start, stop, after=after, limit=limit)
+        boards = {b['id']: b for b in self._boards(r['id'] for _, r in entries)}
+        return [(key, boards[r['id']]) for key, r in entries if r['id'] in boards]
+
+    def transaction(self) -> ContextManager[TableTransaction]:
+        return self._transaction(shard_only=False)
+
+    def submit(self, fn: Callable[[TableTransaction], T]) -> T:
+        try:
+            with self._transaction(shard_only=True) as tx:
+                return fn(tx)
+        except _NeedsManifest:
+            pass
+        with self.transaction() as tx:
+            return fn(tx)
+
+    @contextmanager
+    def _transaction(self, shard_only: bool) -> Iterator[TableTransaction]:
+        with ExitStack() as stack:
+            tx = _ShardedTransaction(self, stack, shard_only)
+            if not shard_only:
+                tx._manifest()
+            yield tx
+            if tx.needs_manifest:  # in case fn swallowed the exception
+                raise _NeedsManifest
+            # Indexed before the shards commit and unlock; see the module docstring.
+            self.tasks.add(tx.new_tasks)
+        for board_id in tx.dropped:
+            self._drop_shard(board_id)
+        if tx.changed:
+            self._bump_version()
+            _notify_write(self.name)
+
+    def _bump_version(self) -> None:
+        # Most commits only rewrite a shard, so the manifest alone cannot tell
+        # that the table changed. An O_APPEND write is atomic across workers
+        # and always changes the stamp's size. Truncating changes it too, so
+        # a commit whose byte is lost to another worker's truncation is still
+        # followed by a new version.
+        fd = os.open(self.stamp, os.O_WRONLY | os.O_APPEND)
+        try:
+            os.write(fd, b'.')
+            if os.fstat(fd).st_size > STAMP_MAX:
+                os.ftruncate(fd, 0)
+        finally:
+            os.close(fd)
+
+    def version(self) -> Version:
+        manifest = self.manifest.version()
+        stamp = _file_version(_stat_signature(self.stamp))
+        return Version(f'{manifest.tag}-{stamp.tag}', max(manifest.modified, stamp.modified))
+
+    def stats(self) -> dict:
+        # One manifest row per board; summing the shard sizes would stat every file.
+        return {'rows': self._manifest.stats()['rows'], 'bytes': None}
+
+    def _drop_shard(self, board_id: str) -> None:
+        with self._shards_lock:
+            self._shards.pop(board_id, None)
+        path = table_path(f'{self.dirname}/{board_id}.json', self.manifest.format)
+        for suffix in ('', '.log'):
+            path.with_name(path.name + suffix).unlink(missing_ok=True)
+
+    def write(self, rows: List[dict]) -> None:
+        with self.manifest.lock:
+            for r in self.manifest.read():
+                self._drop_shard(r['id'])
+            self.manifest.write([{f: r.get(f) for f in SUMMARY_FIELDS} for r in rows])
+            for r in rows:
+                self._shard(r['id']).write([r])
+            self.tasks.reset([(t['id'], r['id']) for r in rows for t in r.get('tasks', [])])
+            self._bump_version()
+        _notify_write(self.name)
+
+
+class _ShardedTransaction(TableTransaction):
+    def __init__(self, table: ShardedBoardTable, stack: ExitStack, shard_only: bool = False):
+        self._table = table
+        self._stack = stack
+        # Hold at most one shard lock and never the manifest's, so this
+        # attempt cannot wait on a lock while holding another.
+        self._shard_only = shard_only
+        self.needs_manifest = False
+        self._manifest_tx: TableTransaction | None = None
+        self._shard_txs: Dict[str, TableTransaction] = {}
+        self.new_tasks: List[tuple] = []
+        self.dropped: List[str] = []
+        self.changed = False
+
+    def _retry(self) -> None:
+        self.needs_manifest = True
+        raise _NeedsManifest
+
+    def _manifest(self) -> TableTransaction:
+        if self._manifest_tx is None:
+            if self._shard_only:
+                self._retry()
+            self._manifest_tx = self._stack.enter_context(self._table.manifest.transaction())
+        return self._manifest_tx
+
+    def _summary(self, board_id: str) -> dict | None:
+        if self._manifest_tx is not None:
+            return self._manifest_tx.get(board_id)
+        return self._table.manifest.get_by_id(board_id)
+
+    def _shard_tx(self, board_id: str) -> TableTransaction:
+        tx = self._shard_txs.get(board_id)
+        if tx is None:
+            if self._shard_only and self._shard_txs:
+                self._retry()
+            tx = self._stack.enter_context(self._table._shard(board_id).transaction())
+            self._shard_txs[board_id] = tx
+        return tx
+
+    def get(self, _id: str) -> dict | None:
+        if self._summary(_id) is None:
+            return None
+        return self._shard_tx(_id).get(_id)
+
+    def find(self, index: str, key: Hashable) -> List[dict]:
+        if index == 'task':
+            board_id = dict(self.new_tasks).get(key) or self._table._board_of(key)
+            board = self.get(board_id) if board_id else None
+            return [board] if board else []
+        return [self._shard_tx(r['id']).get(r['id']) for r in self._manifest().find(index, key)]
+
+    def rows(self) -> List[dict]:
+        ids = [r['id'] for r in self._manifest().rows()]
+        return [
+            self._shard_txs[i].get(i) if i in self._shard_txs else self._table.get_by_id(i)
+            for i in ids
+        ]
+
+    def upsert(self, row: dict) -> None:
+        self.changed = True
+        board_id = row['id']
+        summary = {f: row.get(f) for f in SUMMARY_FIELDS}
+        known = self._summary(board_id)
+        shard_tx = self._shard_tx(board_id)
+        old = shard_tx.get(board_id)
+        shard_tx.upsert(row)
+        old_tasks = {t['id'] for t in old.get('tasks', [])} if old else set()
+        self.new_tasks += [(t['id'], board_id) for t in row.get('tasks', []) if t['id'] not in old_tasks]
+        if known != summary:
+            self._manifest().upsert(summary)
+
+    def delete(self, _id: str) -> bool:
+        if self._summary(_id) is None:
+            return False
+        self._manifest().delete(_id)
+        self.dropped.append(_id)
+        self.changed = True
+        return True
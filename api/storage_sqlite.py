@@ -0,0 +1,556 @@
+"""SQLite backend for the application tables (``STORAGE_BACKEND = 'sqlite'``).
+
+Users, teams and boards get one SQL table each, with team memberships and
+board tasks normalized into ``team_members`` and ``tasks``. Rows are still
+exchanged as the same dicts the JSON backend stores, so controllers do not
+care which backend is active. Every secondary index of ``storage.INDEXES``
+is answered from a real SQL index.
+
+The first process to open the database copies in the JSON backend's
+tables found under ``db/`` (in ``STORAGE_FORMAT``, with any pending log
+entries, and the sharded boards directory if there is one), once per table
+and only into a table that has never been written. The copied files are
+renamed to ``*.imported``, as the sharded backend does with ``boards.json``.
+
+Each thread keeps its own connection in WAL journal mode, so readers never
+block the single writer. Statements are always issued with the same SQL text
+and bound parameters, which lets ``sqlite3`` reuse its prepared-statement
+cache instead of recompiling them per call.
+"""
+from __future__ import annotations
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from contextlib import contextmanager
+from typing import Callable, Dict, Hashable, Iterable, Iterator, List, Tuple
+from django.conf import settings
+
+from .storage import JSONTable, Table, TableTransaction, Version, _notify_write, table_path
+from .storage_formats import get_format
+
+SCHEMA = '''
+-- Bumped by every write transaction; read by Table.version().
+CREATE TABLE IF NOT EXISTS table_versions (
+    name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    modified REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS users (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    name_ci TEXT NOT NULL,
+    display_name TEXT NOT NULL DEFAULT '',
+    creation_time TEXT,
+    description TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS users_name_ci ON users (name_ci);
+
+CREATE TABLE IF NOT EXISTS teams (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    name_ci TEXT NOT NULL,
+    description TEXT NOT NULL DEFAULT '',
+    admin TEXT,
+    creation_time TEXT
+);
+CREATE INDEX IF NOT EXISTS teams_name_ci ON teams (name_ci);
+CREATE INDEX IF NOT EXISTS teams_admin ON teams (admin);
+
+CREATE TABLE IF NOT EXISTS team_members (
+    team_id TEXT NOT NULL REFERENCES teams (id) ON DELETE CASCADE,
+    user_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (team_id, user_id)
+);
+CREATE INDEX IF NOT EXISTS team_members_user ON team_members (user_id);
+
+CREATE TABLE IF NOT EXISTS boards (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    name_ci TEXT NOT NULL,
+    description TEXT NOT NULL DEFAULT '',
+    team_id TEXT NOT NULL,
+    status TEXT NOT NULL,
+    creation_time TEXT,
+    end_time TEXT
+);
+CREATE INDEX IF NOT EXISTS boards_team_name_ci ON boards (team_id, name_ci);
+
+CREATE TABLE IF NOT EXISTS tasks (
+    id TEXT PRIMARY KEY,
+    board_id TEXT NOT NULL REFERENCES boards (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    title TEXT NOT NULL,
+    description TEXT NOT NULL DEFAULT '',
+    user_id TEXT,
+    status TEXT NOT NULL,
+    creation_time TEXT
+);
+CREATE INDEX IF NOT EXISTS tasks_board ON tasks (board_id, position);
+'''
+
+
+class SQLiteDatabase:
+    """Per-thread connections to one SQLite file.
+
+    ``setup(db, conn)`` runs once per process, right after the first
+    connection has created the schema.
+    """
+
+    def __init__(self, path: Path, setup: Callable[['SQLiteDatabase', sqlite3.Connection], None] | None = None):
+        self.path = path
+        self.setup = setup
+        self._local = threading.local()
+        # The file and schema are created by the first connection.
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+
+    def connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        # A connection inherited through fork() must not be reused.
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA foreign_keys=ON')
+            if not self._schema_ready:
+                with self._schema_lock:
+                    if not self._schema_ready:
+                        conn.executescript(SCHEMA)
+                        if self.setup is not None:
+                            self.setup(self, conn)
+                        self._schema_ready = True
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def write(self) -> '_WriteTransaction':
+        return _WriteTransaction(self.connect())
+
+
+class _WriteTransaction:
+    """``BEGIN IMMEDIATE`` … ``COMMIT``/``ROLLBACK`` around a block of writes."""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.conn.execute('BEGIN IMMEDIATE')
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.conn.execute('ROLLBACK' if exc_type else 'COMMIT')
+
+
+def _placeholders(n: int) -> str:
+    return ','.join('?' * n)
+
+
+# Ids bound per ``IN (...)`` list, well under SQLite's variable limit.
+IN_CHUNK = 500
+
+
+def _select_in(conn: sqlite3.Connection, sql: str, ids: List[str]) -> List[sqlite3.Row]:
+    """Run ``sql`` (containing one ``IN ({})``) over ``ids`` in bounded chunks."""
+    out = []
+    for i in range(0, len(ids), IN_CHUNK):
+        chunk = ids[i:i + IN_CHUNK]
+        out.extend(conn.execute(sql.format(_placeholders(len(chunk))), chunk).fetchall())
+    return out
+
+
+def _delete_in(conn: sqlite3.Connection, sql: str, ids: List[str]) -> None:
+    """Like ``_select_in`` for a ``DELETE``."""
+    for i in range(0, len(ids), IN_CHUNK):
+        chunk = ids[i:i + IN_CHUNK]
+        conn.execute(sql.format(_placeholders(len(chunk))), chunk)
+
+
+class SQLiteTable(Table):
+    """Row-dict access to one SQL table; subclasses map rows to columns."""
+
+    table = ''
+    # index name -> SQL selecting matching row ids; the key is bound as-is
+    # (tuples are spread over several placeholders).
+    index_queries: Dict[str, str] = {}
+    # index name -> (key columns, extra condition or None) for ``scan``; the
+    # columns hold the same values as the JSON backend's index keys.
+    scan_columns: Dict[str, tuple] = {}
+
+    def __init__(self, db: SQLiteDatabase):
+        self.db = db
+        self.name = self.table
+
+    # -- subclass hooks -------------------------------------------------
+    def _rows(self, conn: sqlite3.Connection, records: List[sqlite3.Row]) -> List[dict]:
+        raise NotImplementedError
+
+    def _save(self, conn: sqlite3.Connection, row: dict) -> None:
+        raise NotImplementedError
+
+    def _read(self, conn: sqlite3.Connection) -> List[dict]:
+        return self._rows(conn, conn.execute(f'SELECT * FROM {self.table} ORDER BY rowid').fetchall())
+
+    def _get(self, conn: sqlite3.Connection, _id: str) -> dict | None:
+        rows = self._rows(conn, conn.execute(f'SELECT * FROM {self.table} WHERE id = ?', (_id,)).fetchall())
+        return rows[0] if rows else None
+
+    def _find(self, conn: sqlite3.Connection, index: str, key: Hashable) -> List[dict]:
+        params = key if isinstance(key, tuple) else (key,)
+        ids = [r[0] for r in conn.execute(self.index_queries[index], params)]
+        return self._by_ids(conn, ids)
+
+    def _delete(self, conn: sqlite3.Connection, _id: str) -> bool:
+        return conn.execute(f'DELETE FROM {self.table} WHERE id = ?', (_id,)).rowcount > 0
+
+    # -- Table interface -------------------------------------------------
+    def read(self) -> List[dict]:
+        return self._read(self.db.connect())
+
+    def _by_ids(self, conn: sqlite3.Connection, ids: Iterable[str]) -> List[dict]:
+        ids = list(dict.fromkeys(ids))
+        if not ids:
+            return []
+        records = _select_in(conn, f'SELECT rowid, * FROM {self.table} WHERE id IN ({{}})', ids)
+        records.sort(key=lambda r: r['rowid'])
+        return self._rows(conn, records)
+
+    def iter_rows(self, batch: int = 500) -> Iterator[dict]:
+        last = 0
+        while True:
+            # Streaming responses may be consumed from another thread, so
+            # look up that thread's connection for every batch.
+            conn = self.db.connect()
+            records = conn.execute(
+                f'SELECT rowid, * FROM {self.table} WHERE rowid > ? ORDER BY rowid LIMIT ?', (last, batch)
+            ).fetchall()
+            if not records:
+                return
+            last = records[-1]['rowid']
+            yield from self._rows(conn, records)
+
+    def get_by_id(self, _id: str) -> dict | None:
+        return self._get(self.db.connect(), _id)
+
+    def find(self, index: str, key: Hashable) -> List[dict]:
+        return self._find(self.db.connect(), index, key)
+
+    def scan(self, index: str, start: Hashable = None, stop: Hashable = None, *,
+             after: tuple | None = None, limit: int | None = None) -> List[tuple]:
+        cols, condition = self.scan_columns[index]
+        compound = len(cols) > 1
+        key_sql = f"({', '.join(cols)})" if compound else cols[0]
+
+        def values(key) -> tuple:
+            return tuple(key) if compound else (key,)
+
+        clauses = [condition] if condition else []
+        params: list = []
+        if start is not None:
+            clauses.append(f'{key_sql} >= ({_placeholders(len(cols))})')
+            params += values(start)
+        if stop is not None:
+            clauses.append(f'{key_sql} < ({_placeholders(len(cols))})')
+            params += values(stop)
+        if after is not None:
+            clauses.append(f"({', '.join(cols)}, id) > ({_placeholders(len(cols) + 1)})")
+            params += (*values(after[0]), after[1])
+        sql = f"SELECT id, {', '.join(cols)} FROM {self.table}"
+        if clauses:
+            sql += ' WHERE ' + ' AND '.join(clauses)
+        sql += f" ORDER BY {', '.join(cols)}, id"
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        conn = self.db.connect()
+        found = conn.execute(sql, params).fetchall()
+        rows = {r['id']: r for r in self._by_ids(conn, [f[0] for f in found])}
+        return [
+            (tuple(f[1:]) if compound else f[1], rows[f[0]])
+            for f in found if f[0] in rows  # skip rows deleted in between
+        ]
+
+    @contextmanager
+    def transaction(self) -> Iterator[TableTransaction]:
+        # BEGIN IMMEDIATE takes the write lock up front, so the reads inside
+        # the transaction cannot be invalidated by another writer.
+        with self.db.write() as conn:
+            tx = _SQLiteTransaction(self, conn)
+            yield tx
+            if tx.changed:
+                self._bump_version(conn)
+        if tx.changed:
+            _notify_write(self.name)
+
+    def write(self, rows: List[dict]) -> None:
+        with self.db.write() as conn:
+            conn.execute(f'DELETE FROM {self.table}')
+            for row in rows:
+                self._save(conn, row)
+            self._bump_version(conn)
+        _notify_write(self.name)
+
+    def _bump_version(self, conn: sqlite3.Connection) -> None:
+        conn.execute(
+            'INSERT INTO table_versions (name, version, modified) VALUES (?, 1, ?) '
+            'ON CONFLICT (name) DO UPDATE SET version = version + 1, modified = excluded.modified',
+            (self.table, time.time()),
+        )
+
+    def version(self) -> Version:
+        row = self.db.connect().execute(
+            'SELECT version, modified FROM table_versions WHERE name = ?', (self.table,)
+        ).fetchone()
+        return Version(str(row['version']), row['modified']) if row else Version('0', 0.0)
+
+
+class _SQLiteTransaction(TableTransaction):
+    def __init__(self, table: SQLiteTable, conn: sqlite3.Connection):
+        self._table = table
+        self._conn = conn
+        self.changed = False
+
+    def get(self, _id: str) -> dict | None:
+        return self._table._get(self._conn, _id)
+
+    def find(self, index: str, key: Hashable) -> List[dict]:
+        return self._table._find(self._conn, index, key)
+
+    def rows(self) -> List[dict]:
+        return self._table._read(self._conn)
+
+    def upsert(self, row: dict) -> None:
+        self._table._save(self._conn, row)
+        self.changed = True
+
+    def delete(self, _id: str) -> bool:
+        self.changed = True
+        return self._table._delete(self._conn, _id)
+
+
+class UsersTable(SQLiteTable):
+    table = 'users'
+    index_queries = {
+        'name': 'SELECT id FROM users WHERE name_ci = ?',
+    }
+    scan_columns = {
+        'name': (('name_ci',), None),
+    }
+
+    def _rows(self, conn, records):
+        return [
+            {
+                'id': r['id'],
+                'name': r['name'],
+                'display_name': r['display_name'],
+                'creation_time': r['creation_time'],
+                'description': r['description'],
+            }
+            for r in records
+        ]
+
+    def _save(self, conn, row):
+        conn.execute(
+            'INSERT INTO users (id, name, name_ci, display_name, creation_time, description) '
+            'VALUES (?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT (id) DO UPDATE SET name = excluded.name, name_ci = excluded.name_ci, '
+            'display_name = excluded.display_name, creation_time = excluded.creation_time, '
+            'description = excluded.description',
+            (row['id'], row['name'], row['name'].lower(), row.get('display_name', ''),
+             row.get('creation_time'), row.get('description', '')),
+        )
+
+
+class TeamsTable(SQLiteTable):
+    table = 'teams'
+    index_queries = {
+        'name': 'SELECT id FROM teams WHERE name_ci = ?',
+        'member': 'SELECT id FROM teams WHERE admin = ?1 '
+                  'UNION SELECT team_id FROM team_members WHERE user_id = ?1',
+    }
+    scan_columns = {
+        'name': (('name_ci',), None),
+    }
+
+    def _rows(self, conn, records):
+        if not records:
+            return []
+        ids = [r['id'] for r in records]
+        members: Dict[str, List[str]] = {i: [] for i in ids}
+        for m in _select_in(
+            conn, 'SELECT team_id, user_id FROM team_members WHERE team_id IN ({}) '
+            'ORDER BY team_id, position', ids
+        ):
+            members[m['team_id']].append(m['user_id'])
+        return [
+            {
+                'id': r['id'],
+                'name': r['name'],
+                'description': r['description'],
+                'admin': r['admin'],
+                'users': members[r['id']],
+                'creation_time': r['creation_time'],
+            }
+            for r in records
+        ]
+
+    def _save(self, conn, row):
+        conn.execute(
+            'INSERT INTO teams (id, name, name_ci, description, admin, creation_time) '
+            'VALUES (?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT (id) DO UPDATE SET name = excluded.name, name_ci = excluded.name_ci, '
+            'description = excluded.description, admin = excluded.admin, '
+            'creation_time = excluded.creation_time',
+            (row['id'], row['name'], row['name'].lower(), row.get('description', ''),
+             row.get('admin'), row.get('creation_time')),
+        )
+        conn.execute('DELETE FROM team_members WHERE team_id = ?', (row['id'],))
+        conn.executemany(
+            'INSERT INTO team_members (team_id, user_id, position) VALUES (?, ?, ?)',
+            [(row['id'], uid, i) for i, uid in enumerate(dict.fromkeys(row.get('users', [])))],
+        )
+
+
+class BoardsTable(SQLiteTable):
+    table = 'boards'
+    index_queries = {
+        'team': 'SELECT id FROM boards WHERE team_id = ?',
+        'team_name': 'SELECT id FROM boards WHERE team_id = ? AND name_ci = ?',
+        'task': 'SELECT board_id FROM tasks WHERE id = ?',
+        'open_name': "SELECT id FROM boards WHERE team_id = ? AND name_ci = ? AND status = 'OPEN'",
+        'open_team': "SELECT id FROM boards WHERE team_id = ? AND status = 'OPEN'",
+    }
+    scan_columns = {
+        'team_name': (('team_id', 'name_ci'), None),
+        'open_name': (('team_id', 'name_ci'), "status = 'OPEN'"),
+    }
+
+    def _rows(self, conn, records):
+        if not records:
+            return []
+        ids = [r['id'] for r in records]
+        tasks: Dict[str, List[dict]] = {i: [] for i in ids}
+        for t in _select_in(
+            conn, 'SELECT * FROM tasks WHERE board_id IN ({}) ORDER BY board_id, position', ids
+        ):
+            tasks[t['board_id']].append({
+                'id': t['id'],
+                'title': t['title'],
+                'description': t['description'],
+                'user_id': t['user_id'],
+                'status': t['status'],
+                'creation_time': t['creation_time'],
+            })
+        return [
+            {
+                'id': r['id'],
+                'name': r['name'],
+                'description': r['description'],
+                'team_id': r['team_id'],
+                'status': r['status'],
+                'creation_time': r['creation_time'],
+                'end_time': r['end_time'],
+                'tasks': tasks[r['id']],
+            }
+            for r in records
+        ]
+
+    def _save(self, conn, row):
+        conn.execute(
+            'INSERT INTO boards (id, name, name_ci, description, team_id, status, creation_time, end_time) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT (id) DO UPDATE SET name = excluded.name, name_ci = excluded.name_ci, '
+            'description = excluded.description, team_id = excluded.team_id, '
+            'status = excluded.status, creation_time = excluded.creation_time, '
+            'end_time = excluded.end_time',
+            (row['id'], row['name'], row['name'].lower(), row.get('description', ''),
+             row['team_id'], row.get('status', 'OPEN'), row.get('creation_time'), row.get('end_time')),
+        )
+        # Only the task rows that differ from the stored ones are written, so
+        # changing one task of a large board does not rewrite all of them.
+        stored = {
+            t[0]: tuple(t)
+            for t in conn.execute(
+                'SELECT id, board_id, position, title, description, user_id, status, creation_time '
+                'FROM tasks WHERE board_id = ?', (row['id'],)
+            )
+        }
+        tasks = [
+            (t['id'], row['id'], i, t['title'], t.get('description', ''), t.get('user_id'),
+             t.get('status', 'OPEN'), t.get('creation_time'))
+            for i, t in enumerate(row.get('tasks', []))
+        ]
+        keep = {t[0] for t in tasks}
+        _delete_in(conn, 'DELETE FROM tasks WHERE id IN ({})', [i for i in stored if i not in keep])
+        conn.executemany(
+            'INSERT INTO tasks (id, board_id, position, title, description, user_id, status, creation_time) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT (id) DO UPDATE SET board_id = excluded.board_id, position = excluded.position, '
+            'title = excluded.title, description = excluded.description, user_id = excluded.user_id, '
+            'status = excluded.status, creation_time = excluded.creation_time',
+            [t for t in tasks if stored.get(t[0]) != t],
+        )
+
+
+TABLES = {
+    'users': UsersTable,
+    'teams': TeamsTable,
+    'boards': BoardsTable,
+}
+
+_db: SQLiteDatabase | None = None
+_db_lock = threading.Lock()
+
+
+def _json_source(name: str) -> Tuple[Table, List[Path]] | None:
+    """The JSON backend's table ``name`` and the paths holding it, if it has any data."""
+    fmt = get_format(getattr(settings, 'STORAGE_FORMAT', 'json'))
+    manifest = table_path(f'{name}/manifest.json', fmt)
+    if name == 'boards' and manifest.exists():
+        from .storage_sharded import ShardedBoardTable
+        return ShardedBoardTable(name, legacy_file=None), [manifest.parent]
+    path = table_path(f'{name}.json', fmt)
+    if not path.exists():
+        return None
+    log = path.with_name(path.name + '.log')
+    engine = 'wal' if log.exists() else 'file'
+    return JSONTable(f'{name}.json', cache=False, engine=engine), [path, log]
+
+
+def _import_json_tables(db: SQLiteDatabase, conn: sqlite3.Connection) -> None:
+    """Copy the JSON backend's tables into tables never written here; see the module docstring."""
+    for name, cls in TABLES.items():
+        source = _json_source(name)
+        if source is None:
+            continue
+        json_table, paths = source
+        table = cls(db)
+        # BEGIN IMMEDIATE: a second process starting up waits here, then
+        # finds the table versioned and leaves it alone.
+        with _WriteTransaction(conn):
+            fresh = conn.execute('SELECT 1 FROM table_versions WHERE name = ?', (table.table,)).fetchone() is None
+            if fresh:
+                for row in json_table.iter_rows():
+                    table._save(conn, row)
+                table._bump_version(conn)
+        if fresh:
+            for path in paths:
+                if path.exists():
+                    path.rename(path.with_name(path.name + '.imported'))
+
+
+def _database() -> SQLiteDatabase:
+    global _db
+    with _db_lock:
+        if _db is None:
+            path = getattr(settings, 'STORAGE_SQLITE_PATH', None) or settings.DATABASES['default']['NAME']
+            _db = SQLiteDatabase(Path(path), setup=_import_json_tables)
+        return _db
+
+
+def open_sqlite_table(name: str) -> SQLiteTable:
+    return TABLES[name](_database())
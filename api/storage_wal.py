@@ -0,0 +1,134 @@
+"""Append-only log engine for ``JSONTable``.
+
+The table lives in two files: the last snapshot (``users.json``, the same
+file the file engine writes, in ``STORAGE_FORMAT``) and a log next to it
+(``users.json.log``) with one compact JSON object per line::
+
+    {"op": "upsert", "row": {...}}
+    {"op": "delete", "id": "usr_..."}
+    {"op": "batch", "ops": [...]}
+
+A transaction that changes several rows is written as one ``batch`` line, so
+it is replayed entirely or not at all.
+A write appends one line, so it costs O(record) instead of O(table). Loading
+replays the log over the snapshot. Once the log grows past
+``settings.STORAGE_WAL_COMPACT_BYTES`` the owning table folds it into a new
+snapshot on a background thread and starts an empty log.
+
+A process that dies mid-append leaves a torn final line without a trailing
+newline. Replay ignores it and the next append cuts it off first, so the log
+never contains a torn line in the middle.
+
+Readers take no lock. Compaction renames a fresh empty log into place after
+the new snapshot, so a reader opens the log before reading the snapshot and
+retries if the log was swapped meanwhile: the pair it replays is then either
+(old snapshot, old log) or (new snapshot, old log), and replaying upserts and
+deletes that the snapshot already contains is harmless.
+"""
+from __future__ import annotations
+import logging
+import os
+import time
+from pathlib import Path
+from typing import List
+from django.conf import settings
+
+from . import metrics
+from .storage import FileEngine, Version, _file_version, _replace_file, _stat_signature
+from .storage_formats import Format, dumps_json, loads_json
+
+logger = logging.getLogger(__name__)
+
+
+def _complete_length(fd: int, size: int) -> int:
+    """Length of the log up to and including its last newline."""
+    end = size
+    while end > 0:
+        start = max(0, end - 64 * 1024)
+        cut = os.pread(fd, end - start, start).rfind(b'\n')
+        if cut >= 0:
+            return start + cut + 1
+        end = start
+    return 0
+
+
+class LogEngine(FileEngine):
+    def __init__(self, path: Path, fmt: Format):
+        super().__init__(path, fmt)
+        self.log_path = path.with_name(path.name + '.log')
+        self.compact_bytes = getattr(settings, 'STORAGE_WAL_COMPACT_BYTES', 4 * 1024 * 1024)
+
+    def signature(self) -> tuple:
+        return (_stat_signature(self.path), _stat_signature(self.log_path))
+
+    def version(self) -> Version:
+        snapshot, log = (_file_version(sig) for sig in self.signature())
+        return Version(f'{snapshot.tag}-{log.tag}', max(snapshot.modified, log.modified))
+
+    def load(self) -> List[dict]:
+        while True:
+            try:
+                with open(self.log_path, 'rb') as log:
+                    start = time.perf_counter()
+                    data = log.read()
+                    read = time.perf_counter() - start
+                    snapshot = super().load()
+                    ino = os.fstat(log.fileno()).st_ino
+            except FileNotFoundError:
+                data, read, snapshot, ino = b'', 0.0, super().load(), None
+            current = _stat_signature(self.log_path)
+            if (current[0] if current else None) == ino:
+                break
+        start = time.perf_counter()
+        state = {r.get('id'): r for r in snapshot}
+        # Everything after the last newline is an unfinished append.
+        lines = data.split(b'\n')[:-1]
+        for n, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                entry = loads_json(line)
+            except ValueError:
+                logger.warning('%s:%d: skipping unreadable log entry', self.log_path, n)
+                continue
+            for op in entry['ops'] if entry.get('op') == 'batch' else (entry,):
+                if op.get('op') == 'upsert':
+                    row = op['row']
+                    state[row.get('id')] = row
+                elif op.get('op') == 'delete':
+                    state.pop(op.get('id'), None)
+        metrics.storage_read(len(data), read, time.perf_counter() - start)
+        return list(state.values())
+
+    def save(self, rows: List[dict]) -> None:
+        """Write a full snapshot and start a fresh log (i.e. compact)."""
+        super().save(rows)
+        _replace_file(self.log_path, b'', fsync=self.fsync)
+
+    def record(self, ops: List[dict], rows: List[dict]) -> bool:
+        start = time.perf_counter()
+        entry = ops[0] if len(ops) == 1 else {'op': 'batch', 'ops': ops}
+        data = dumps_json(entry) + b'\n'
+        encoded = time.perf_counter()
+        fd = os.open(self.log_path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            size = os.fstat(fd).st_size
+            if size and os.pread(fd, 1, size - 1) != b'\n':
+                # Drop a torn tail left by a writer that crashed mid-append.
+                size = _complete_length(fd, size)
+                os.ftruncate(fd, size)
+            os.write(fd, data)
+            if self.fsync:
+                os.fsync(fd)
+            metrics.storage_write(len(data), encoded - start, time.perf_counter() - encoded)
+            return size + len(data) > self.compact_bytes
+        finally:
+            os.close(fd)
+
+    def needs_compaction(self) -> bool:
+        sig = _stat_signature(self.log_path)
+        return sig is not None and sig[1] > self.compact_bytes
+
+    def size(self) -> int:
+        sig = _stat_signature(self.log_path)
+        return super().size() + (sig[1] if sig else 0)
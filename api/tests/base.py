@@ -0,0 +1,84 @@
+import json
+import tempfile
+import threading
+from pathlib import Path
+from unittest import mock
+
+from django.test import Client, SimpleTestCase, override_settings
+
+# Absolute imports: the views use these modules, whatever package path
+# the test runner imports this file under.
+from api import storage, storage_sharded, storage_sqlite, views
+from api.controllers import board_controller, team_controller, user_controller
+
+# Generous bound for joins in the concurrency tests; a deadlock never ends.
+JOIN_TIMEOUT = 10
+
+
+class StorageTestCase(SimpleTestCase):
+    """Each test gets an empty temporary ``db/`` (and ``out/``) directory.
+
+    The application tables the controllers use are replaced with fresh ones
+    opened there, so API tests never touch the project's data. Subclasses
+    can pick the backend of those tables with ``storage_settings``; the
+    SQLite backend gets a fresh database in the same directory.
+    """
+
+    storage_settings = {}
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.base_dir = Path(tmp.name)
+        self.db_dir = self.base_dir / 'db'
+        for module in (storage, storage_sharded):
+            self._patch(mock.patch.object(module, 'DB_DIR', self.db_dir))
+        self._patch(override_settings(BASE_DIR=self.base_dir, RESPONSE_CACHE=None,
+                                      STORAGE_SQLITE_PATH=self.base_dir / 'db.sqlite3',
+                                      **self.storage_settings))
+        self._patch(mock.patch.object(storage_sqlite, '_db', None))
+        self._patch(mock.patch.dict(storage._tables, clear=True))
+        for module in (user_controller, team_controller, board_controller):
+            for name in ('USERS', 'TEAMS', 'BOARDS'):
+                if hasattr(module, name):
+                    self._patch(mock.patch.object(module, name, storage.open_table(name.lower())))
+
+    def _patch(self, patcher):
+        if isinstance(patcher, override_settings):
+            patcher.enable()
+            self.addCleanup(patcher.disable)
+        else:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def run_threads(self, *targets):
+        threads = [threading.Thread(target=t, daemon=True) for t in targets]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(JOIN_TIMEOUT)
+        self.assertFalse(any(t.is_alive() for t in threads), 'threads did not finish (deadlock?)')
+
+
+class APITestCase(StorageTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = Client()
+        # The views' conditional-GET validators hold the tables opened at
+        # import time; have them report the versions of the test tables.
+        for module, name in ((user_controller, 'USERS'), (team_controller, 'TEAMS'),
+                             (board_controller, 'BOARDS')):
+            self._patch(mock.patch.object(getattr(views, name), 'version', getattr(module, name).version))
+
+    def call(self, method, url, body=None, **extra):
+        data = json.dumps(body) if body is not None else None
+        return getattr(self.client, method)('/api/' + url, data=data, content_type='application/json', **extra)
+
+    def create_user(self, name):
+        return self.call('post', 'users/', {'name': name, 'display_name': name.title()}).json()['id']
+
+    def create_team(self, name, admin):
+        return self.call('post', 'teams/', {'name': name, 'admin': admin}).json()['id']
+
+    def create_board(self, name, team_id):
+        return self.call('post', 'boards/', {'name': name, 'team_id': team_id}).json()['id']
@@ -0,0 +1,256 @@
+import base64
+import json
+from unittest import mock
+
+from django.conf import settings
+from django.test import Client, override_settings
+
+from api import storage, views
+from api.controllers import team_controller
+
+from .base import APITestCase
+
+
+class ResponseCacheTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        caches = {**settings.CACHES, 'test-responses': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': str(self.base_dir),
+        }}
+        self._patch(override_settings(CACHES=caches, RESPONSE_CACHE='test-responses'))
+
+    def stats(self):
+        return self.call('get', 'cache/stats/').json()
+
+    def delta(self, before):
+        after = self.stats()
+        return {k: after[k] - before[k] for k in ('hits', 'misses', 'invalidations')}
+
+    def test_hits_and_misses_are_counted(self):
+        user = self.create_user('alice')
+        self.assertEqual(self.stats()['cache'], 'test-responses')
+        before = self.stats()
+        for _ in range(3):
+            self.assertEqual(self.call('get', f'users/{user}/').json()['name'], 'alice')
+        self.assertEqual(self.delta(before), {'hits': 2, 'misses': 1, 'invalidations': 0})
+
+        before = self.stats()
+        self.call('patch', f'users/{user}/', {'display_name': 'Al'})
+        self.call('get', f'users/{user}/')
+        self.assertEqual(self.delta(before), {'hits': 0, 'misses': 1, 'invalidations': 1})
+
+    def test_write_through_another_table_object_invalidates(self):
+        alice = self.create_user('alice')
+        team = self.create_team('core', alice)
+        self.call('post', f'teams/{team}/users/add/', {'users': [alice]})
+        urls = [f'users/{alice}/', 'users/', f'teams/{team}/users/']
+        first = [self.call('get', url).json() for url in urls]
+        self.assertEqual([self.call('get', url).json() for url in urls], first)  # served from the cache
+
+        # Not the instance the controllers use; its writes are announced by table name.
+        users = storage._open_table('users')
+        self.assertIsNot(users, storage.open_table('users'))
+        row = users.get_by_id(alice)
+        row.update(display_name='Al', description='lead')
+        users.upsert(row)
+        users.upsert({'id': 'usr_other', 'name': 'bob', 'display_name': 'Bob', 'creation_time': None,
+                      'description': ''})
+
+        self.assertEqual(self.call('get', f'users/{alice}/').json()['description'], 'lead')
+        self.assertEqual(sorted(u['name'] for u in self.call('get', 'users/').json()), ['alice', 'bob'])
+        self.assertEqual([u['display_name'] for u in self.call('get', f'teams/{team}/users/').json()], ['Al'])
+
+
+class BulkEndpointTests(APITestCase):
+    def test_bulk_users_and_tasks(self):
+        r = self.call('post', 'users/bulk/', {'users': [{'name': f'u{i}', 'display_name': f'U{i}'} for i in range(3)]})
+        self.assertEqual(r.status_code, 200)
+        users = [u['id'] for u in r.json()['results']]
+        self.assertEqual(len(users), 3)
+        team = self.create_team('core', users[0])
+        board = self.create_board('b', team)
+        r = self.call('post', f'boards/{board}/tasks/bulk/', {'tasks': [
+            {'title': f't{i}', 'user_id': users[i % 3]} for i in range(5)
+        ]})
+        self.assertEqual(r.status_code, 200)
+        tasks = [t['id'] for t in r.json()['results']]
+        self.assertEqual(len(tasks), 5)
+        self.assertEqual(self.call('patch', f'tasks/{tasks[4]}/status/', {'status': 'COMPLETE'}).status_code, 200)
+
+    def test_bulk_rejects_bad_payloads(self):
+        self.assertEqual(self.call('post', 'users/bulk/', {'users': 'nope'}).status_code, 400)
+        self.create_user('taken')
+        r = self.call('post', 'users/bulk/', {'users': [
+            {'name': 'new', 'display_name': 'N'}, {'name': 'TAKEN', 'display_name': 'T'}, 'nope',
+        ]})
+        self.assertEqual(r.status_code, 200)
+        results = r.json()['results']
+        self.assertIn('id', results[0])
+        self.assertEqual([sorted(x) for x in results[1:]], [['error'], ['error']])
+        self.assertEqual(sorted(u['name'] for u in self.call('get', 'users/').json()), ['new', 'taken'])
+
+
+class UserTeamsTests(APITestCase):
+    """``users/<id>/teams/`` is answered from the teams ``member`` index."""
+
+    def teams_of(self, user):
+        return sorted(t['name'] for t in self.call('get', f'users/{user}/teams/').json())
+
+    def test_membership_and_admin_changes_move_teams_between_users(self):
+        alice, bob, carol = (self.create_user(n) for n in ('alice', 'bob', 'carol'))
+        core = self.create_team('core', alice)
+        web = self.create_team('web', bob)
+        self.call('post', f'teams/{web}/users/add/', {'users': [alice, carol]})
+        self.assertEqual(self.teams_of(alice), ['core', 'web'])
+        self.assertEqual(self.teams_of(carol), ['web'])
+
+        self.call('post', f'teams/{web}/users/remove/', {'users': [alice]})
+        self.call('patch', f'teams/{core}/', {'admin': bob})
+        self.assertEqual(self.teams_of(alice), [])
+        self.assertEqual(self.teams_of(bob), ['core', 'web'])
+        self.assertEqual(self.teams_of(carol), ['web'])
+
+
+class TeamUsersTests(APITestCase):
+    def test_members_are_looked_up_without_reading_every_user(self):
+        alice, bob = self.create_user('alice'), self.create_user('bob')
+        self.create_user('carol')
+        team = self.create_team('core', alice)
+        self.call('post', f'teams/{team}/users/add/', {'users': [bob, alice]})
+        users = team_controller.USERS
+        with mock.patch.object(users, 'read', side_effect=AssertionError('full read')), \
+                mock.patch.object(users, 'iter_rows', side_effect=AssertionError('full read')):
+            members = self.call('get', f'teams/{team}/users/').json()
+        self.assertEqual(sorted(u['name'] for u in members), ['alice', 'bob'])
+
+
+class CursorPagingTests(APITestCase):
+    def test_pages_follow_name_order(self):
+        for name in ('dave', 'alice', 'carol', 'bob', 'erin'):
+            self.create_user(name)
+        names, cursor = [], None
+        while True:
+            url = 'users/?limit=2' + (f'&cursor={cursor}' if cursor else '')
+            page = self.call('get', url).json()
+            names += [u['name'] for u in page['items']]
+            cursor = page['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual(names, ['alice', 'bob', 'carol', 'dave', 'erin'])
+
+    def test_invalid_cursors_are_rejected(self):
+        admin = self.create_user('alice')
+        team = self.create_team('core', admin)
+        self.create_board('b', team)
+
+        def encode(value):
+            return base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip('=')
+
+        bad = ['%%%', encode('x'), encode(['alice', None]), encode(['alice', 5]),
+               encode([['x'], 'y']), encode([1, 'a']), encode([[], 'a'])]
+        for cursor in bad:
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.call('get', f'users/?limit=1&cursor={cursor}').status_code, 400)
+                self.assertEqual(self.call('get', f'teams/{team}/boards/?limit=1&cursor={cursor}').status_code, 400)
+        # A user-list cursor does not fit the board listing, and vice versa.
+        self.assertEqual(self.call('get', f"teams/{team}/boards/?limit=1&cursor={encode(['b', 'x'])}").status_code, 400)
+        self.assertEqual(self.call('get', f"users/?limit=1&cursor={encode([[team, 'b'], 'x'])}").status_code, 400)
+
+
+class StreamedListTests(APITestCase):
+    def get(self, url):
+        r = self.call('get', url)
+        self.assertTrue(r.streaming, url)
+        return r, b''.join(r.streaming_content)
+
+    def test_json_and_ndjson_hold_the_listed_items(self):
+        self.assertEqual(self.get('users/?stream=json')[1], b'[]')
+        self.assertEqual(self.get('users/?stream=ndjson')[1], b'')
+        for name in ('carol', 'alice', 'bob'):
+            self.create_user(name)
+        listed = self.call('get', 'users/').json()
+
+        with mock.patch.object(views, 'STREAM_CHUNK', 16):  # several chunks
+            r, body = self.get('users/?stream=json')
+            self.assertEqual(r['Content-Type'], 'application/json')
+            self.assertEqual(json.loads(body), listed)
+            r, body = self.get('users/?stream=ndjson')
+            self.assertEqual(r['Content-Type'], 'application/x-ndjson')
+            self.assertTrue(body.endswith(b'\n'))
+            self.assertEqual([json.loads(line) for line in body.splitlines()], listed)
+
+    def test_prefix_and_fields_apply_to_the_stream(self):
+        for name in ('alice', 'alan', 'bob'):
+            self.create_user(name)
+        self.create_team('core', self.create_user('carl'))
+        _, body = self.get('users/?stream=ndjson&prefix=al&fields=name')
+        self.assertEqual([json.loads(line) for line in body.splitlines()], [{'name': 'alan'}, {'name': 'alice'}])
+        _, body = self.get('teams/?stream=json&fields=name,admin')
+        self.assertEqual([sorted(t) for t in json.loads(body)], [['admin', 'name']])
+
+    def test_paging_and_bad_modes_are_rejected(self):
+        self.create_user('alice')
+        cursor = self.call('get', 'users/?limit=1').json()['next_cursor'] or 'x'
+        for query in ('stream=json&limit=1', f'stream=ndjson&cursor={cursor}', 'stream=xml'):
+            with self.subTest(query=query):
+                r = self.call('get', f'users/?{query}')
+                self.assertEqual(r.status_code, 400)
+                self.assertIn('error', r.json())
+
+
+class ConditionalGetTests(APITestCase):
+    def test_etag_and_not_modified(self):
+        user = self.create_user('alice')
+        first = self.call('get', f'users/{user}/')
+        etag = first['ETag']
+        self.assertTrue(etag)
+        # Written this very second: Last-Modified could not tell a later write apart.
+        self.assertFalse(first.has_header('Last-Modified'))
+        self.assertEqual(self.call('get', f'users/{user}/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.call('patch', f'users/{user}/', {'display_name': 'Al'})
+        changed = self.call('get', f'users/{user}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], etag)
+
+
+class MetricsTests(APITestCase):
+    def test_metrics_exposition(self):
+        user = self.create_user('alice')
+        self.call('get', f'users/{user}/')
+        r = self.client.get('/metrics', HTTP_ACCEPT='text/plain')
+        self.assertEqual(r.status_code, 200)
+        text = r.content.decode()
+        self.assertIn('factwise_http_requests_total{method="GET",route="api/users/<str:user_id>/",status="200"}', text)
+        self.assertIn('factwise_table_rows{table="users"} 1', text)
+
+
+class ProfilingTests(APITestCase):
+    def enable(self, **settings):
+        # The middleware reads its settings when a handler loads it.
+        self._patch(override_settings(PROFILE_REQUESTS=True, **settings))
+        self.client = Client()
+
+    def timings(self, response):
+        parts = dict(p.split(';', 1) for p in response['Server-Timing'].split(', '))
+        self.assertEqual(list(parts), ['total', 'app', 'render', 'lock', 'read', 'parse', 'serialize', 'write'])
+        return parts
+
+    def test_server_timing_header_and_log(self):
+        r = self.call('post', 'users/', {'name': 'alice', 'display_name': 'Alice'})
+        self.assertFalse(r.has_header('Server-Timing'))
+
+        self.enable()
+        with self.assertLogs('api.profiling', 'INFO') as logs:
+            r = self.call('post', 'users/', {'name': 'bob', 'display_name': 'Bob'})
+            self.timings(self.call('get', 'users/'))
+        self.assertRegex(self.timings(r)['write'], r'^dur=[0-9.]+;desc="[1-9][0-9]* B"$')
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual((record['method'], record['path'], record['status']), ('POST', '/api/users/', 200))
+        self.assertGreater(record['write_bytes'], 0)
+
+    def test_slow_requests_are_profiled(self):
+        self.enable(PROFILE_SLOW_MS=0, PROFILE_DIR=self.base_dir / 'profiles')
+        with self.assertLogs('api.profiling', 'INFO'):
+            self.call('get', 'users/')
+        self.assertEqual([p.suffix for p in (self.base_dir / 'profiles').iterdir()], ['.prof'])
@@ -0,0 +1,108 @@
+import asyncio
+import importlib.util
+import json
+import time
+from unittest import mock
+
+from django.test import override_settings
+from django.urls import include, path
+
+import api.urls
+from api import views
+
+from .base import JOIN_TIMEOUT, APITestCase
+
+
+def _async_api_urls():
+    # api.urls picks its views when imported; load a second copy with
+    # API_ASYNC_VIEWS on, next to it in the api package.
+    spec = importlib.util.spec_from_file_location('api._async_urls', api.urls.__file__)
+    module = importlib.util.module_from_spec(spec)
+    with override_settings(API_ASYNC_VIEWS=True):
+        spec.loader.exec_module(module)
+    return module.urlpatterns
+
+
+urlpatterns = [path('api/', include(_async_api_urls()))]
+
+
+class AsyncViewTests(APITestCase):
+    """The API served by views_async, through AsyncClient."""
+
+    def setUp(self):
+        super().setUp()
+        self._patch(override_settings(ROOT_URLCONF=__name__))
+
+    async def acall(self, method, url, body=None, **extra):
+        data = json.dumps(body) if body is not None else None
+        return await getattr(self.async_client, method)('/api/' + url, data=data,
+                                                        content_type='application/json', **extra)
+
+    async def acreate(self, url, **body):
+        r = await self.acall('post', url, body)
+        self.assertEqual(r.status_code, 200, r.content)
+        return r.json()['id']
+
+    async def read_stream(self, r):
+        self.assertTrue(r.streaming)
+        return b''.join([chunk async for chunk in r.streaming_content])
+
+    async def test_errors_map_to_status_codes(self):
+        r = await self.async_client.post('/api/users/', data=b'{', content_type='application/json')
+        self.assertEqual((r.status_code, r.json()), (400, {'error': 'request body must be JSON'}))
+        self.assertEqual((await self.acall('post', 'users/', [])).status_code, 400)
+        self.assertEqual((await self.acall('post', 'users/', {'name': ''})).status_code, 400)
+        self.assertEqual((await self.acall('get', 'users/nope/')).status_code, 404)
+        await self.acreate('users/', name='alice', display_name='Alice')
+        r = await self.acall('post', 'users/', {'name': 'alice', 'display_name': 'Alice'})
+        self.assertEqual(r.status_code, 409)
+        self.assertIn('error', r.json())
+
+    async def test_streamed_lists(self):
+        for name in ('carol', 'alice', 'bob'):
+            await self.acreate('users/', name=name, display_name=name.title())
+        listed = (await self.acall('get', 'users/')).json()
+
+        with mock.patch.object(views, 'STREAM_CHUNK', 16):  # several chunks
+            r = await self.acall('get', 'users/?stream=json')
+            self.assertEqual(r['Content-Type'], 'application/json')
+            self.assertEqual(json.loads(await self.read_stream(r)), listed)
+            r = await self.acall('get', 'users/?stream=ndjson')
+            self.assertEqual(r['Content-Type'], 'application/x-ndjson')
+            self.assertEqual([json.loads(line) for line in (await self.read_stream(r)).splitlines()], listed)
+        for query in ('stream=xml', 'stream=json&limit=1'):
+            with self.subTest(query=query):
+                self.assertEqual((await self.acall('get', f'users/?{query}')).status_code, 400)
+
+    async def test_not_modified(self):
+        user = await self.acreate('users/', name='alice', display_name='Alice')
+        etag = (await self.acall('get', f'users/{user}/'))['ETag']
+        self.assertTrue(etag)
+        r = await self.acall('get', f'users/{user}/', headers={'If-None-Match': etag})
+        self.assertEqual(r.status_code, 304)
+
+        await self.acall('patch', f'users/{user}/', {'display_name': 'Al'})
+        r = await self.acall('get', f'users/{user}/', headers={'If-None-Match': etag})
+        self.assertEqual(r.status_code, 200)
+        self.assertNotEqual(r['ETag'], etag)
+
+    async def test_export_job_and_stream(self):
+        user = await self.acreate('users/', name='alice', display_name='Alice')
+        team = await self.acreate('teams/', name='core', admin=user)
+        board = await self.acreate('boards/', name='sprint 1', team_id=team)
+        await self.acreate(f'boards/{board}/tasks/', title='x', user_id=user)
+
+        r = await self.acall('post', f'boards/{board}/export/')
+        self.assertEqual(r.status_code, 202)
+        deadline = time.monotonic() + JOIN_TIMEOUT
+        while (job := (await self.acall('get', f"exports/{r.json()['id']}/")).json())['status'] != 'done':
+            self.assertNotEqual(job['status'], 'failed', job)
+            self.assertLess(time.monotonic(), deadline)
+            await asyncio.sleep(0.01)
+        report = (self.base_dir / 'out' / job['out_file']).read_text(encoding='utf-8')
+        self.assertIn('x [OPEN] — Alice', report)
+
+        r = await self.acall('post', f'boards/{board}/export/?stream=1')
+        self.assertEqual(r.status_code, 200)
+        self.assertTrue(r['Content-Disposition'].startswith('attachment; filename="'))
+        self.assertEqual((await self.read_stream(r)).decode(), report)
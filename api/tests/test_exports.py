@@ -0,0 +1,118 @@
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from django.test import override_settings
+
+from api import export_jobs
+from api.controllers import board_controller
+
+from .base import JOIN_TIMEOUT, APITestCase, StorageTestCase
+
+
+class ExportTestCase(APITestCase):
+    """A user, their team and one board with a task."""
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user('alice')
+        self.team = self.create_team('core', self.user)
+        self.board = self.create_board('sprint 1', self.team)
+        self.call('post', f'boards/{self.board}/tasks/', {'title': 'x', 'user_id': self.user})
+
+    def wait_for(self, job_id):
+        deadline = time.monotonic() + JOIN_TIMEOUT
+        while True:
+            job = self.call('get', f'exports/{job_id}/').json()
+            if job['status'] in ('done', 'failed'):
+                return job
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+
+
+class ExportJobTests(ExportTestCase):
+    def test_board_export_job(self):
+        r = self.call('post', f'boards/{self.board}/export/')
+        self.assertEqual(r.status_code, 202)
+        job = self.wait_for(r.json()['id'])
+        self.assertEqual(job['status'], 'done')
+        report = (self.base_dir / 'out' / job['out_file']).read_text(encoding='utf-8')
+        self.assertIn('Team: core', report)
+        self.assertIn('x [OPEN]', report)
+        self.assertEqual(self.call('get', 'exports/nope/').status_code, 404)
+
+
+class ExportPoolTests(StorageTestCase):
+    def setUp(self):
+        super().setUp()
+        self._patch(override_settings(EXPORT_WORKERS=2))
+        self._patch(mock.patch.object(export_jobs, '_executor', None))
+        self.addCleanup(lambda: export_jobs._executor and export_jobs._executor.shutdown())
+
+    def test_concurrent_first_submits_share_one_bounded_pool(self):
+        created = []
+
+        def slow_executor(*args, **kwargs):
+            time.sleep(0.01)  # widen the window between the check and the assignment
+            created.append(ThreadPoolExecutor(*args, **kwargs))
+            return created[-1]
+
+        running, peak, lock = [0], [0], threading.Lock()
+        release = threading.Event()
+
+        def job(progress):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            release.wait(JOIN_TIMEOUT)
+            with lock:
+                running[0] -= 1
+            return {}
+
+        with mock.patch.object(export_jobs, 'ThreadPoolExecutor', slow_executor):
+            ids = []
+            self.run_threads(*(lambda i=i: ids.append(export_jobs.submit(f'test:{i}', job)['id'])
+                               for i in range(6)))
+        self.assertEqual(len(created), 1)
+        time.sleep(0.05)
+        self.assertEqual(peak[0], 2)
+        release.set()
+        deadline = time.monotonic() + JOIN_TIMEOUT
+        while any(export_jobs.get(i)['status'] != 'done' for i in ids):
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+
+
+class StreamExportTests(ExportTestCase):
+    def test_stream_export_header_is_safe(self):
+        board = self.create_board('a"b\nc', self.team)
+        r = self.call('post', f'boards/{board}/export/?stream=1')
+        self.assertEqual(r.status_code, 200)
+        self.assertRegex(r['Content-Disposition'], r'^attachment; filename="[A-Za-z0-9_-]+\.txt"$')
+
+
+class TeamExportTests(ExportTestCase):
+    def test_team_export_zip_with_unsafe_names(self):
+        team = self.create_team('../evil"\nname', self.user)
+        for i in range(3):
+            self.create_board(f'b/{i}', team)
+        r = self.call('post', f'teams/{team}/export/?zip=1&wait=1')
+        self.assertEqual(r.status_code, 200)
+        fname = r.json()['out_file']
+        self.assertRegex(fname, r'^[A-Za-z0-9_-]+\.zip$')
+        with zipfile.ZipFile(self.base_dir / 'out' / fname) as zf:
+            self.assertEqual(len(zf.namelist()), 3)
+            self.assertTrue(all('/' not in n for n in zf.namelist()))
+
+    def test_many_assignees_are_looked_up_by_id(self):
+        users = self.call('post', 'users/bulk/', {'users': [
+            {'name': f'u{i}', 'display_name': f'U{i}'} for i in range(150)]}).json()['results']
+        self.call('post', f'boards/{self.board}/tasks/bulk/', {'tasks': [
+            {'title': f't{i}', 'user_id': u['id']} for i in range(150) for u in [users[i]]]})
+        with mock.patch.object(board_controller.USERS, 'iter_rows', side_effect=AssertionError('full read')):
+            r = self.call('post', f'teams/{self.team}/export/?wait=1')
+        self.assertEqual(r.status_code, 200, r.content)
+        report = (self.base_dir / 'out' / r.json()['out_files'][0]).read_text(encoding='utf-8')
+        self.assertIn('t149 [OPEN] — U149', report)
@@ -0,0 +1,344 @@
+import importlib.util
+import io
+import threading
+import time
+from unittest import mock, skipUnless
+
+from django.core.management import call_command
+from filelock import FileLock, Timeout
+from django.test import override_settings
+
+from api import metrics, storage
+from api.management.commands import convert_storage
+from api.controllers import board_controller, user_controller
+from api.storage import INDEXES, JSONTable
+from api.storage_formats import dumps_json
+
+from .base import JOIN_TIMEOUT, StorageTestCase
+
+
+class SnapshotCacheTests(StorageTestCase):
+    def test_unchanged_file_is_not_reparsed(self):
+        table = JSONTable('t.json', cache=True)
+        table.upsert({'id': 'a'})
+        with mock.patch.object(table, '_parse', wraps=table._parse) as parse:
+            for _ in range(3):
+                self.assertEqual(table.read(), [{'id': 'a'}])
+                self.assertEqual(table.get_by_id('a'), {'id': 'a'})
+        parse.assert_not_called()
+
+    def test_write_through_another_table_object_is_reparsed(self):
+        table = JSONTable('t.json', cache=True)
+        table.upsert({'id': 'a', 'v': 1})
+        self.assertEqual(table.read(), [{'id': 'a', 'v': 1}])
+        other = JSONTable('t.json', cache=True)
+        other.upsert({'id': 'a', 'v': 2})
+        other.upsert({'id': 'b'})
+        self.assertEqual(table.read(), [{'id': 'a', 'v': 2}, {'id': 'b'}])
+        self.assertEqual(table.get_by_id('b'), {'id': 'b'})
+
+
+class IndexTests(StorageTestCase):
+    """Indexes and sorted views patched by commits match ones built from the file."""
+
+    def open(self):
+        return JSONTable('t.json', cache=True, indexes=INDEXES['boards'])
+
+    def board(self, _id, team, name, status='OPEN', tasks=()):
+        return {'id': _id, 'team_id': team, 'name': name, 'status': status,
+                'tasks': [{'id': t} for t in tasks]}
+
+    def assertMatchesRebuild(self, table):
+        fresh = self.open()
+        self.assertEqual(table.read(), fresh.read())
+        for name in INDEXES['boards']:
+            with self.subTest(index=name):
+                entries = [(key, row['id']) for key, row in table.scan(name)]
+                self.assertEqual(entries, [(key, row['id']) for key, row in fresh.scan(name)])
+                for key in {key for key, _ in entries} | {'missing'}:
+                    self.assertEqual([r['id'] for r in table.find(name, key)],
+                                     [r['id'] for r in fresh.find(name, key)])
+
+    def test_commits_patch_indexes_and_views(self):
+        table = self.open()
+        for name in INDEXES['boards']:
+            table.scan(name)  # build the sorted views, so commits patch them too
+        table.upsert(self.board('b1', 't1', 'One', tasks=['k1', 'k2']))
+        table.upsert(self.board('b2', 't1', 'Two', tasks=['k3']))
+        table.upsert(self.board('b3', 't2', 'one'))
+        self.assertMatchesRebuild(table)
+
+        steps = [
+            [self.board('b1', 't1', 'Renamed', tasks=['k1', 'k2'])],          # key moves
+            [self.board('b2', 't1', 'Two', status='CLOSED', tasks=['k3'])],  # leaves open_name
+            [self.board('b3', 't2', 'one', tasks=['k4']),                    # list key grows
+             self.board('b1', 't1', 'Renamed', tasks=['k2'])],              # and shrinks
+            [self.board('b4', 't1', 'two')],                                 # shares a bucket
+            [self.board('b2', 't1', 'Two', tasks=['k3'])],                   # reopened
+            [self.board('b1', 't1', 'Renamed', tasks=['k2'])],               # no key changes
+        ]
+        for rows in steps:
+            with table.transaction() as tx:
+                for row in rows:
+                    tx.upsert(row)
+            self.assertMatchesRebuild(table)
+
+        self.assertTrue(table.delete('b2'))
+        self.assertMatchesRebuild(table)
+        self.assertEqual([r['id'] for r in table.find('team', 't1')], ['b1', 'b4'])
+        self.assertEqual([r['id'] for r in table.find('task', 'k2')], ['b1'])
+        self.assertEqual(table.find('task', 'k1'), [])
+
+
+class WALEngineTests(StorageTestCase):
+    def open(self, **kwargs):
+        return JSONTable('t.json', engine='wal', cache=False, **kwargs)
+
+    def test_changes_are_replayed_from_the_log(self):
+        table = self.open()
+        table.upsert({'id': 'a', 'v': 1})
+        table.upsert({'id': 'b', 'v': 2})
+        table.upsert({'id': 'a', 'v': 3})
+        table.delete('b')
+        self.assertEqual(table.engine.path.read_bytes(), b'[]')  # nothing compacted yet
+        self.assertEqual(self.open().read(), [{'id': 'a', 'v': 3}])
+
+    def test_torn_tail_is_ignored_and_dropped_by_the_next_append(self):
+        table = self.open()
+        table.upsert({'id': 'a'})
+        with open(table.engine.log_path, 'ab') as log:
+            log.write(b'{"op": "upsert", "row": {"id": "torn"')
+        self.assertEqual(self.open().read(), [{'id': 'a'}])
+        table.upsert({'id': 'b'})
+        self.assertEqual(sorted(r['id'] for r in self.open().read()), ['a', 'b'])
+        self.assertNotIn(b'torn', table.engine.log_path.read_bytes())
+
+    @override_settings(STORAGE_WAL_COMPACT_BYTES=200)
+    def test_log_is_compacted_into_the_snapshot(self):
+        table = self.open()
+        for i in range(20):
+            table.upsert({'id': str(i), 'pad': 'x' * 20})
+        deadline = time.monotonic() + JOIN_TIMEOUT
+        while table._compacting or table.engine.needs_compaction():
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+        self.assertEqual(len(self.open().read()), 20)
+        self.assertLess(table.engine.log_path.stat().st_size, 200)
+
+
+class TransactionTests(StorageTestCase):
+    def test_exception_rolls_back_the_transaction(self):
+        table = JSONTable('t.json', cache=True)
+        table.upsert({'id': 'a', 'v': 1})
+        with self.assertRaises(RuntimeError):
+            with table.transaction() as tx:
+                tx.upsert({'id': 'a', 'v': 2})
+                tx.upsert({'id': 'b'})
+                raise RuntimeError
+        self.assertEqual(table.read(), [{'id': 'a', 'v': 1}])
+        self.assertEqual(JSONTable('t.json', cache=False).read(), [{'id': 'a', 'v': 1}])
+
+
+class GroupCommitTests(StorageTestCase):
+    def test_group_commit_isolates_failing_calls(self):
+        table = JSONTable('t.json', cache=True, group_commit_ms=50)
+        results, errors = {}, {}
+
+        def call(i):
+            def fn(tx):
+                tx.upsert({'id': str(i)})
+                if i % 3 == 0:
+                    raise ValueError(i)
+                return i
+            try:
+                results[i] = table.submit(fn)
+            except ValueError as e:
+                errors[i] = e.args[0]
+
+        self.run_threads(*(lambda i=i: call(i) for i in range(12)))
+        self.assertEqual(sorted(errors), [0, 3, 6, 9])
+        self.assertEqual(results, {i: i for i in range(12) if i % 3})
+        stored = sorted(int(r['id']) for r in JSONTable('t.json', cache=False).read())
+        self.assertEqual(stored, [i for i in range(12) if i % 3])
+
+    def test_leader_ended_by_a_base_exception_hands_over(self):
+        table = JSONTable('t.json', cache=True, group_commit_ms=50)
+        follower = {}
+
+        def follow():
+            try:
+                table.submit(lambda tx: tx.upsert({'id': 'b'}))
+            except BaseException as e:
+                follower['error'] = e
+
+        def interrupt(tx):
+            tx.upsert({'id': 'a'})
+            raise KeyboardInterrupt
+
+        thread = threading.Timer(0.005, follow)  # joins the leader's batch
+        thread.start()
+        with self.assertRaises(KeyboardInterrupt):
+            table.submit(interrupt)
+        thread.join(JOIN_TIMEOUT)
+        # The batch was not written, so the follower must not report success.
+        self.assertIsInstance(follower.get('error'), KeyboardInterrupt)
+        self.assertEqual(table.read(), [])
+
+        self.run_threads(lambda: table.submit(lambda tx: tx.upsert({'id': 'c'})))
+        self.assertEqual(table.read(), [{'id': 'c'}])
+
+    def test_group_commit_leader_returns_after_its_own_batch(self):
+        table = JSONTable('t.json', cache=True, group_commit_ms=20)
+        table.read()
+        stop = threading.Event()
+        submitters = []
+
+        def slow_upsert(i):
+            def fn(tx):
+                time.sleep(0.003)
+                tx.upsert({'id': str(i)})
+            return fn
+
+        def feed():
+            # Open loop: callers arrive faster than their batches run, so the
+            # queue is never empty when a flush completes.
+            deadline = time.monotonic() + 3
+            i = 0
+            while not stop.is_set() and time.monotonic() < deadline:
+                t = threading.Thread(target=table.submit, args=(slow_upsert(i),), daemon=True)
+                t.start()
+                submitters.append(t)
+                i += 1
+                time.sleep(0.002)
+
+        feeder = threading.Timer(0.005, feed)
+        feeder.daemon = True
+        feeder.start()
+        try:
+            started = time.monotonic()
+            table.submit(lambda tx: tx.upsert({'id': 'leader'}))
+            self.assertLess(time.monotonic() - started, 1)
+        finally:
+            stop.set()
+            feeder.join(JOIN_TIMEOUT)
+            for t in submitters:
+                t.join(JOIN_TIMEOUT)
+        self.assertFalse(any(t.is_alive() for t in submitters))
+
+
+@skipUnless(importlib.util.find_spec('msgpack'), 'msgpack is not installed')
+class ConvertStorageTests(StorageTestCase):
+    def setUp(self):
+        super().setUp()
+        self._patch(mock.patch.object(convert_storage, 'DB_DIR', self.db_dir))
+
+    def convert(self, to):
+        call_command('convert_storage', to=to, stdout=io.StringIO(), stderr=io.StringIO())
+
+    def test_round_trip_folds_in_the_pending_log(self):
+        users = JSONTable('users.json', engine='wal', cache=False)
+        users.upsert({'id': 'u1', 'name': 'Zoë', 'tags': ['a', None], 'n': 1, 'x': 0.5, 'ok': True})
+        users.upsert({'id': 'u2', 'name': 'bob', 'nested': {'k': [1, {'v': 'w'}]}})
+        users.upsert({'id': 'u1', 'name': 'Zoë', 'tags': [], 'n': 2, 'x': 0.5, 'ok': False})
+        users.delete('u2')
+        users.upsert({'id': 'u3', 'name': 'carol'})
+        JSONTable('boards/b1.json', cache=False).upsert({'id': 'b1', 'tasks': [{'id': 'k1'}]})
+        log = self.db_dir / 'users.json.log'
+        self.assertGreater(log.stat().st_size, 0)
+        expected = users.read()
+
+        self.convert('msgpack')
+        self.assertFalse(log.exists())
+        self.assertEqual(sorted(p.name for p in self.db_dir.glob('users.*') if not p.name.endswith('.lock')),
+                         ['users.msgpack'])
+        self.assertEqual(JSONTable('users.json', fmt='msgpack', cache=False).read(), expected)
+        self.assertEqual(JSONTable('boards/b1.json', fmt='msgpack', cache=False).read(),
+                         [{'id': 'b1', 'tasks': [{'id': 'k1'}]}])
+
+        self.convert('json')
+        self.assertFalse((self.db_dir / 'users.msgpack').exists())
+        self.assertEqual((self.db_dir / 'users.json').read_bytes(), dumps_json(expected))
+        self.assertEqual(JSONTable('boards/b1.json', cache=False).read(), [{'id': 'b1', 'tasks': [{'id': 'k1'}]}])
+
+
+class SharedTableTests(StorageTestCase):
+    def test_open_table_shares_one_instance_and_opens_lazily(self):
+        self.assertIs(storage.open_table('users'), user_controller.USERS)
+        self.assertIs(board_controller.USERS, user_controller.USERS)
+        self.assertFalse(self.db_dir.exists())  # nothing used yet
+        user_controller.USERS.read()
+        self.assertEqual([p.name for p in self.db_dir.iterdir() if p.suffix == '.json'], ['users.json'])
+
+    def test_first_transaction_and_first_read_do_not_deadlock(self):
+        for i in range(50):
+            table = JSONTable(f't{i}.json', cache=True)
+            self.run_threads(lambda: table.upsert({'id': 'a'}), table.read, table.version)
+
+
+class TableLockTests(StorageTestCase):
+    def setUp(self):
+        super().setUp()
+        self.name = self.id()  # lock metrics are per process; keep this test's apart
+        self.lock = storage.TableLock(str(self.base_dir / 't.lock'), self.name)
+
+    def stats(self):
+        return metrics.snapshot()['locks'][self.name]
+
+    def file_locked(self):
+        """Whether another process would find the lock file taken."""
+        probe = FileLock(self.lock.lock_file)
+        try:
+            probe.acquire(timeout=0)
+        except Timeout:
+            return True
+        probe.release()
+        return False
+
+    def test_reentrant_in_the_holding_thread(self):
+        with self.lock:
+            with self.lock:
+                self.assertTrue(self.file_locked())
+            self.assertTrue(self.file_locked())
+        self.assertFalse(self.file_locked())
+        # Only the outermost acquisition is reported.
+        self.assertEqual((self.stats()['acquisitions'], self.stats()['contended']), (1, 0))
+
+    def test_threads_queue_and_report_their_wait(self):
+        held, order, totals = threading.Event(), [], {}
+
+        def holder():
+            with self.lock:
+                held.set()
+                time.sleep(0.05)
+                order.append('holder')
+
+        def waiter():
+            held.wait(JOIN_TIMEOUT)
+            token = metrics.begin_request()
+            with self.lock:
+                order.append('waiter')
+            totals.update(metrics.end_request(token))
+
+        self.run_threads(holder, waiter)
+        self.assertEqual(order, ['holder', 'waiter'])
+        stats = self.stats()
+        self.assertEqual((stats['acquisitions'], stats['contended']), (2, 1))
+        self.assertGreaterEqual(stats['max_wait_seconds'], 0.04)
+        self.assertGreaterEqual(totals['lock_wait'], 0.04)
+
+    def test_waits_for_another_process(self):
+        other = FileLock(self.lock.lock_file)
+        other.acquire()
+        acquired = threading.Event()
+
+        def take():
+            with self.lock:
+                acquired.set()
+
+        thread = threading.Thread(target=take)
+        thread.start()
+        self.assertFalse(acquired.wait(0.05))
+        other.release()
+        thread.join(JOIN_TIMEOUT)
+        self.assertTrue(acquired.is_set())
+        self.assertEqual(self.stats()['contended'], 1)
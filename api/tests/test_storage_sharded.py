@@ -0,0 +1,102 @@
+import threading
+from unittest import mock
+
+from api import storage_sharded
+from api.storage import INDEXES
+from api.storage_sharded import ShardedBoardTable
+
+from .base import JOIN_TIMEOUT, StorageTestCase
+
+
+class ShardedBoardTableTests(StorageTestCase):
+    def open(self):
+        return ShardedBoardTable('boards', indexes=INDEXES['boards'])
+
+    def board(self, _id, name='b', team='t', status='OPEN', tasks=()):
+        return {'id': _id, 'team_id': team, 'name': name, 'status': status,
+                'tasks': [{'id': t} for t in tasks]}
+
+    def test_create_close_and_task_lookup(self):
+        table = self.open()
+        table.upsert(self.board('b1', 'One', tasks=['k1']))
+        table.upsert(self.board('b2', 'Two', tasks=['k2', 'k3']))
+        self.assertEqual(table.find_one('task', 'k3')['id'], 'b2')
+        self.assertEqual([b['id'] for b in table.find('team', 't')], ['b1', 'b2'])
+
+        with table.transaction() as tx:
+            b = tx.get('b1')
+            b['status'] = 'CLOSED'
+            tx.upsert(b)
+        self.assertEqual(table.manifest.get_by_id('b1')['status'], 'CLOSED')
+        self.assertEqual([b['id'] for b in table.find('open_name', ('t', 'two'))], ['b2'])
+
+        # Another process's view of the same files
+        other = self.open()
+        self.assertEqual(other.get_by_id('b1')['status'], 'CLOSED')
+        self.assertEqual(other.find_one('task', 'k1')['id'], 'b1')
+
+    def test_open_boards_of_a_team_open_only_their_shards(self):
+        table = self.open()
+        table.upsert(self.board('b1', 'One'))
+        table.upsert(self.board('b2', 'Two', status='CLOSED'))
+        table.upsert(self.board('b3', 'Three'))
+        table.upsert(self.board('b4', 'Four', team='other'))
+        other = self.open()
+        self.assertEqual([b['id'] for b in other.find('open_team', 't')], ['b1', 'b3'])
+        self.assertEqual(sorted(other._shards), ['b1', 'b3'])
+
+    def test_task_writes_through_submit_lock_only_their_shard(self):
+        table = self.open()
+        table.upsert(self.board('b1', tasks=['k1']))
+
+        def add_task(tx):
+            b = tx.find_one('task', 'k1')
+            b['tasks'].append({'id': 'k2'})
+            tx.upsert(b)
+
+        with table.manifest.lock:  # held by "another writer"
+            done = threading.Event()
+            threading.Thread(target=lambda: (table.submit(add_task), done.set()), daemon=True).start()
+            self.assertTrue(done.wait(JOIN_TIMEOUT))
+        self.assertEqual(table.find_one('task', 'k2')['id'], 'b1')
+
+    def test_close_and_create_with_the_same_name_do_not_deadlock(self):
+        table = self.open()
+        for i in range(30):
+            table.upsert(self.board(f'b{i}', f'n{i}'))
+
+            def close(i=i):
+                with table.transaction() as tx:
+                    b = tx.get(f'b{i}')
+                    b['status'] = 'CLOSED'
+                    tx.upsert(b)
+
+            def create(i=i):
+                with table.transaction() as tx:
+                    if not tx.find_one('team_name', ('t', f'n{i}')):
+                        tx.upsert(self.board(f'c{i}', f'n{i}'))
+
+            self.run_threads(close, create)
+
+    def test_lost_index_entries_are_rebuilt_from_the_shards(self):
+        table = self.open()
+        table.upsert(self.board('b1', tasks=['k1', 'k2']))
+        table.tasks.path.write_text('')
+        other = self.open()
+        self.assertEqual(other.find_one('task', 'k2')['id'], 'b1')
+        self.assertIn('k1 b1', other.tasks.path.read_text())
+        self.assertIsNone(other.find_one('task', 'missing'))
+
+    @mock.patch.object(storage_sharded, 'STAMP_MAX', 3)
+    def test_version_changes_on_every_commit_and_the_stamp_stays_small(self):
+        table = self.open()
+        table.upsert(self.board('b1', tasks=['k0']))
+        versions = [table.version()]
+        for i in range(1, 10):
+            with table.transaction() as tx:
+                b = tx.get('b1')
+                b['tasks'].append({'id': f'k{i}'})
+                tx.upsert(b)
+            versions.append(table.version())
+            self.assertNotEqual(versions[-1], versions[-2])
+            self.assertLessEqual(table.stamp.stat().st_size, 3)
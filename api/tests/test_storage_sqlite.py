@@ -0,0 +1,196 @@
+import sqlite3
+
+from api import storage_sqlite
+from api.storage import INDEXES, JSONTable
+from api.storage_sharded import ShardedBoardTable
+from api.storage_sqlite import BoardsTable, SQLiteDatabase, TeamsTable, UsersTable
+
+from . import test_api, test_exports
+from .base import StorageTestCase
+
+SQLITE = {'STORAGE_BACKEND': 'sqlite'}
+
+
+class SQLiteTableTests(StorageTestCase):
+    def setUp(self):
+        super().setUp()
+        db = SQLiteDatabase(self.base_dir / 't.sqlite3')
+        self.users, self.teams, self.boards = UsersTable(db), TeamsTable(db), BoardsTable(db)
+
+    def user(self, _id, name):
+        return {'id': _id, 'name': name, 'display_name': name.title(), 'creation_time': None,
+                'description': ''}
+
+    def board(self, _id, team, name, status='OPEN', tasks=()):
+        return {'id': _id, 'name': name, 'description': '', 'team_id': team, 'status': status,
+                'creation_time': None, 'end_time': None,
+                'tasks': [{'id': t, 'title': t, 'description': '', 'user_id': 'u1', 'status': 'OPEN',
+                           'creation_time': None} for t in tasks]}
+
+    def test_crud(self):
+        a, b = self.user('u1', 'Alice'), self.user('u2', 'bob')
+        self.users.upsert(a)
+        self.users.upsert(b)
+        self.assertEqual(self.users.read(), [a, b])
+        self.assertEqual(self.users.get_by_id('u2'), b)
+        self.assertIsNone(self.users.get_by_id('nope'))
+
+        with self.users.transaction() as tx:
+            row = tx.get('u1')
+            row['display_name'] = 'Al'
+            tx.upsert(row)
+        self.assertEqual(self.users.get_by_id('u1')['display_name'], 'Al')
+        with self.assertRaises(RuntimeError):
+            with self.users.transaction() as tx:
+                tx.delete('u1')
+                raise RuntimeError
+        self.assertIsNotNone(self.users.get_by_id('u1'))
+
+        self.assertTrue(self.users.delete('u1'))
+        self.assertFalse(self.users.delete('u1'))
+        self.assertEqual(self.users.read(), [b])
+        self.assertEqual(self.users.find('name', 'bob'), [b])
+
+    def test_member_index(self):
+        self.teams.upsert({'id': 't1', 'name': 'One', 'admin': 'u1', 'users': ['u2', 'u3']})
+        self.teams.upsert({'id': 't2', 'name': 'Two', 'admin': 'u2', 'users': []})
+        self.assertEqual([t['id'] for t in self.teams.find('member', 'u1')], ['t1'])
+        self.assertEqual([t['id'] for t in self.teams.find('member', 'u2')], ['t1', 't2'])
+        self.assertEqual(self.teams.get_by_id('t1')['users'], ['u2', 'u3'])
+
+        with self.teams.transaction() as tx:
+            t = tx.get('t1')
+            t['users'] = ['u3']
+            tx.upsert(t)
+        self.assertEqual([t['id'] for t in self.teams.find('member', 'u2')], ['t2'])
+        self.assertEqual([t['id'] for t in self.teams.find('member', 'u3')], ['t1'])
+
+    def test_task_and_open_name_indexes(self):
+        self.boards.upsert(self.board('b1', 't1', 'One', tasks=['k1', 'k2']))
+        self.boards.upsert(self.board('b2', 't1', 'Two', status='CLOSED', tasks=['k3']))
+        self.assertEqual(self.boards.find_one('task', 'k2')['id'], 'b1')
+        self.assertEqual(self.boards.find_one('task', 'k3')['id'], 'b2')
+        self.assertIsNone(self.boards.find_one('task', 'missing'))
+        self.assertEqual([b['id'] for b in self.boards.find('open_name', ('t1', 'one'))], ['b1'])
+        self.assertEqual(self.boards.find('open_name', ('t1', 'two')), [])
+        self.assertEqual([b['id'] for b in self.boards.find('team_name', ('t1', 'two'))], ['b2'])
+        self.assertEqual([b['id'] for b in self.boards.find('open_team', 't1')], ['b1'])
+
+        board = self.boards.get_by_id('b1')
+        board['tasks'] = board['tasks'][1:]
+        self.boards.upsert(board)
+        self.assertIsNone(self.boards.find_one('task', 'k1'))
+        self.assertEqual([t['id'] for t in self.boards.get_by_id('b1')['tasks']], ['k2'])
+
+    def test_task_changes_write_only_the_changed_rows(self):
+        conn = self.boards.db.connect()
+        # Fewer variables than the board has tasks: ids must be bound in chunks.
+        conn.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, 999)
+        self.boards.upsert(self.board('b1', 't1', 'One', tasks=[f'k{i}' for i in range(1500)]))
+
+        board = self.boards.get_by_id('b1')
+        board['tasks'][700]['status'] = 'COMPLETE'
+        before = conn.total_changes
+        self.boards.upsert(board)
+        # The board row, one task row and the version counter.
+        self.assertEqual(conn.total_changes - before, 3)
+        self.assertEqual(self.boards.get_by_id('b1')['tasks'][700]['status'], 'COMPLETE')
+
+        board['tasks'] = board['tasks'][1200:]
+        self.boards.upsert(board)
+        self.assertEqual([t['id'] for t in self.boards.get_by_id('b1')['tasks']],
+                         [f'k{i}' for i in range(1200, 1500)])
+        self.assertEqual([t['position'] for t in conn.execute('SELECT position FROM tasks ORDER BY position')],
+                         list(range(300)))
+
+    def test_scan_pages_like_the_json_backend(self):
+        json_boards = JSONTable('boards.json', cache=True, indexes=INDEXES['boards'])
+        rows = [self.board(f'b{i}', f't{i % 2}', f'n{(7 * i) % 10}', status='CLOSED' if i % 3 == 0 else 'OPEN')
+                for i in range(10)]
+        self.boards.write(rows)
+        json_boards.write(rows)
+        for index, start, stop in (('open_name', ('t1', ''), ('t1', '\uffff')), ('team_name', None, None)):
+            with self.subTest(index=index):
+                expected = [(k, r['id']) for k, r in json_boards.scan(index, start, stop)]
+                self.assertEqual([(k, r['id']) for k, r in self.boards.scan(index, start, stop)], expected)
+                pages, after = [], None
+                while True:
+                    page = self.boards.scan(index, start, stop, after=after, limit=2)
+                    if not page:
+                        break
+                    pages += [(k, r['id']) for k, r in page]
+                    after = (page[-1][0], page[-1][1]['id'])
+                self.assertEqual(pages, expected)
+
+    def test_version_changes_on_write_only(self):
+        first = self.users.version()
+        self.users.upsert(self.user('u1', 'alice'))
+        second = self.users.version()
+        self.assertNotEqual(second, first)
+        self.users.read()
+        with self.users.transaction() as tx:
+            tx.get('u1')  # no changes
+        self.assertEqual(self.users.version(), second)
+        self.users.delete('u1')
+        self.assertNotEqual(self.users.version(), second)
+        self.assertEqual(self.teams.version().tag, '0')  # other tables are versioned apart
+
+
+class JSONImportTests(StorageTestCase):
+    storage_settings = SQLITE
+
+    def test_json_tables_are_imported_once(self):
+        JSONTable('users.json').upsert({'id': 'u1', 'name': 'alice'})
+        teams = JSONTable('teams.json', engine='wal')
+        teams.upsert({'id': 't1', 'name': 'core', 'admin': 'u1', 'users': []})
+        teams.upsert({'id': 't1', 'name': 'core', 'admin': 'u1', 'users': ['u1']})  # still in the log
+        ShardedBoardTable('boards').upsert({'id': 'b1', 'team_id': 't1', 'name': 'b', 'status': 'OPEN',
+                                            'tasks': [{'id': 'k1', 'title': 'x', 'user_id': 'u1'}]})
+
+        users, teams, boards = (storage_sqlite.open_sqlite_table(n) for n in ('users', 'teams', 'boards'))
+        self.assertEqual(users.get_by_id('u1')['name'], 'alice')
+        self.assertEqual(teams.get_by_id('t1')['users'], ['u1'])
+        self.assertEqual(boards.find_one('task', 'k1')['id'], 'b1')
+        self.assertEqual(sorted(p.name for p in self.db_dir.iterdir() if 'imported' in p.name),
+                         ['boards.imported', 'teams.json.imported', 'teams.json.log.imported',
+                          'users.json.imported'])
+
+        # Another process finds the tables written and leaves them alone.
+        JSONTable('users.json').upsert({'id': 'u2', 'name': 'bob'})
+        other = SQLiteDatabase(users.db.path, setup=storage_sqlite._import_json_tables)
+        self.assertEqual([u['id'] for u in UsersTable(other).read()], ['u1'])
+        self.assertTrue((self.db_dir / 'users.json').exists())
+
+
+# The API tests again, on the SQLite backend.
+
+class SQLiteBulkEndpointTests(test_api.BulkEndpointTests):
+    storage_settings = SQLITE
+
+
+class SQLiteUserTeamsTests(test_api.UserTeamsTests):
+    storage_settings = SQLITE
+
+
+class SQLiteCursorPagingTests(test_api.CursorPagingTests):
+    storage_settings = SQLITE
+
+
+class SQLiteStreamedListTests(test_api.StreamedListTests):
+    storage_settings = SQLITE
+
+
+class SQLiteResponseCacheTests(test_api.ResponseCacheTests):
+    storage_settings = SQLITE
+
+
+class SQLiteConditionalGetTests(test_api.ConditionalGetTests):
+    storage_settings = SQLITE
+
+
+class SQLiteExportJobTests(test_exports.ExportJobTests):
+    storage_settings = SQLITE
+
+
+class SQLiteTeamExportTests(test_exports.TeamExportTests):
+    storage_settings = SQLITE
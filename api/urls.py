@@ -1,13 +1,28 @@
+from django.conf import settings
 from django.urls import path
-from .views import (
-    UsersView, UserDetailView, UserTeamsView,
-    TeamsView, TeamDetailView, TeamUsersView, TeamUsersAddView, TeamUsersRemoveView,
-    BoardsCreateView, TeamOpenBoardsView, BoardCloseView, BoardAddTaskView, TaskStatusView, BoardExportView,
-)
+
+# API_ASYNC_VIEWS serves the same routes from the async-native views, for
+# ASGI servers (see views_async).
+if getattr(settings, 'API_ASYNC_VIEWS', False):
+    from .views_async import (
+        UsersView, UsersBulkView, UserDetailView, UserTeamsView,
+        TeamsView, TeamDetailView, TeamUsersView, TeamUsersAddView, TeamUsersRemoveView,
+        BoardsCreateView, TeamOpenBoardsView, BoardCloseView, BoardAddTaskView, BoardAddTasksView, TaskStatusView,
+        BoardExportView, TeamExportView, ExportJobView, CacheStatsView, StorageStatsView,
+    )
+else:
+    from .views import (
+        UsersView, UsersBulkView, UserDetailView, UserTeamsView,
+        TeamsView, TeamDetailView, TeamUsersView, TeamUsersAddView, TeamUsersRemoveView,
+        BoardsCreateView, TeamOpenBoardsView, BoardCloseView, BoardAddTaskView, BoardAddTasksView, TaskStatusView,
+        BoardExportView, TeamExportView, ExportJobView, CacheStatsView, StorageStatsView,
+    )
 
 urlpatterns = [
     # Users
+    # List endpoints accept ?limit=&cursor=&prefix=&fields= (see controllers.utils.ListQuery)
     path('users/', UsersView.as_view()),  # GET list, POST create
+    path('users/bulk/', UsersBulkView.as_view()),  # POST {"users": [...]}
     path('users/<str:user_id>/', UserDetailView.as_view()),
     path('users/<str:user_id>/teams/', UserTeamsView.as_view()),
 
@@ -23,6 +38,14 @@ urlpatterns = [
     path('teams/<str:team_id>/boards/', TeamOpenBoardsView.as_view()),
     path('boards/<str:board_id>/close/', BoardCloseView.as_view()),
     path('boards/<str:board_id>/tasks/', BoardAddTaskView.as_view()),
+    path('boards/<str:board_id>/tasks/bulk/', BoardAddTasksView.as_view()),  # POST {"tasks": [...]}
     path('tasks/<str:task_id>/status/', TaskStatusView.as_view()),
     path('boards/<str:board_id>/export/', BoardExportView.as_view()),
+    path('teams/<str:team_id>/export/', TeamExportView.as_view()),  # ?zip=1 for one archive
+    path('exports/<str:job_id>/', ExportJobView.as_view()),
+
+    # Response cache hit/miss counters of this worker
+    path('cache/stats/', CacheStatsView.as_view()),
+    # Table lock acquisitions and waits, and lock wait per request, of this worker
+    path('storage/stats/', StorageStatsView.as_view()),
 ]
@@ -1,20 +1,29 @@
 # Create your views here.
-import json
+import hashlib
+import time
+from datetime import datetime, timezone
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.http import condition
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from .controllers.user_controller import UserController
-from .controllers.team_controller import TeamController
-from .controllers.board_controller import BoardController
+from .controllers.user_controller import UserController, USERS
+from .controllers.team_controller import TeamController, TEAMS
+from .controllers.board_controller import BoardController, BOARDS
 from .exceptions import BadRequest, NotFound, Conflict
+from .storage_formats import dumps_json
+from . import metrics, response_cache
 
 U = UserController()
 T = TeamController()
 B = BoardController()
 
+# Controllers' *_dict methods take and return plain Python data, so a payload
+# is decoded and encoded once, by DRF, rather than round-tripped through JSON
+# strings at each layer.
 def _ok(payload):
-    if isinstance(payload, str):
-        payload = json.loads(payload)
     return Response(payload)
 
 # Handle Response
@@ -28,76 +37,218 @@ def _handle(fn, *args, **kwargs):
     except NotFound as e:
         return Response({'error': str(e)}, status=status.HTTP_404_NOT_FOUND)
 
+# Conditional GET: ETag / Last-Modified come from the versions of the tables a
+# view reads, which cost a stat (or one small query) each. A matching
+# If-None-Match / If-Modified-Since is answered with 304 before the view runs.
+def _etag(versions):
+    tags = '/'.join(v.tag for v in versions)
+    return hashlib.blake2b(tags.encode(), digest_size=12).hexdigest()
+
+def _last_modified(versions):
+    modified = max(v.modified for v in versions)
+    # HTTP dates have one-second resolution: a write later in the same
+    # second would not move Last-Modified, so leave validation to the ETag.
+    if not modified or time.time() - modified < 1:
+        return None
+    return datetime.fromtimestamp(modified, tz=timezone.utc)
+
+def _conditional(*tables):
+    def etag(request, *args, **kwargs):
+        return _etag([t.version() for t in tables])
+
+    def last_modified(request, *args, **kwargs):
+        return _last_modified([t.version() for t in tables])
+
+    return method_decorator(condition(etag_func=etag, last_modified_func=last_modified))
+
+STREAM_CONTENT_TYPES = {'json': 'application/json', 'ndjson': 'application/x-ndjson'}
+STREAM_CHUNK = 64 * 1024
+
+def _encode_stream(items, mode):
+    """Encode ``items`` as a JSON array or as NDJSON, in chunks of about STREAM_CHUNK bytes."""
+    ndjson = mode == 'ndjson'
+    buf = bytearray() if ndjson else bytearray(b'[')
+    for n, item in enumerate(items):
+        if ndjson:
+            buf += dumps_json(item) + b'\n'
+        else:
+            buf += (b',' if n else b'') + dumps_json(item)
+        if len(buf) >= STREAM_CHUNK:
+            yield bytes(buf)
+            buf.clear()
+    if not ndjson:
+        buf += b']'
+    if buf:
+        yield bytes(buf)
+
+# Handle a ?stream=json|ndjson list request: the controller validates the
+# request up front and returns an iterator, which is encoded as it is sent.
+def _handle_stream(fn, request):
+    params = request.query_params.dict()
+    mode = params.pop('stream')
+    if mode not in STREAM_CONTENT_TYPES:
+        return Response({'error': 'stream must be json or ndjson'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        items = fn(params)
+    except BadRequest as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return StreamingHttpResponse(_encode_stream(items, mode), content_type=STREAM_CONTENT_TYPES[mode])
+
 # Users View
 class UsersView(APIView):
+    @_conditional(USERS)
     def get(self, request):
-        return _handle(U.list_users)
+        if 'stream' in request.query_params:
+            return _handle_stream(U.stream_users, request)
+        return _handle(U.list_users_dict, request.query_params.dict())
     def post(self, request):
-        return _handle(U.create_user, json.dumps(request.data))
+        return _handle(U.create_user_dict, request.data)
+
+class UsersBulkView(APIView):
+    def post(self, request):
+        # Accept a bare array as well as {"users": [...]}
+        items = request.data if isinstance(request.data, list) else request.data.get('users')
+        body = {'users': items}
+        return _handle(U.create_users_dict, body)
 
 class UserDetailView(APIView):
+    @_conditional(USERS)
     def get(self, request, user_id):
-        return _handle(U.describe_user, json.dumps({'id': user_id}))
+        return _handle(U.describe_user_dict, {'id': user_id})
     def patch(self, request, user_id):
         body = {'id': user_id, 'user': request.data}
-        return _handle(U.update_user, json.dumps(body))
+        return _handle(U.update_user_dict, body)
 
 class UserTeamsView(APIView):
+    @_conditional(TEAMS)
     def get(self, request, user_id):
-        return _handle(U.get_user_teams, json.dumps({'id': user_id}))
+        return _handle(U.get_user_teams_dict, {'id': user_id})
 
 # Teams View
 class TeamsView(APIView):
+    @_conditional(TEAMS)
     def get(self, request):
-        return _handle(T.list_teams)
+        if 'stream' in request.query_params:
+            return _handle_stream(T.stream_teams, request)
+        return _handle(T.list_teams_dict, request.query_params.dict())
     def post(self, request):
-        return _handle(T.create_team, json.dumps(request.data))
+        return _handle(T.create_team_dict, request.data)
 
 class TeamDetailView(APIView):
+    @_conditional(TEAMS)
     def get(self, request, team_id):
-        return _handle(T.describe_team, json.dumps({'id': team_id}))
+        return _handle(T.describe_team_dict, {'id': team_id})
     def patch(self, request, team_id):
         body = {'id': team_id, 'team': request.data}
-        return _handle(T.update_team, json.dumps(body))
+        return _handle(T.update_team_dict, body)
 
 class TeamUsersView(APIView):
+    @_conditional(TEAMS, USERS)
     def get(self, request, team_id):
-        return _handle(T.list_team_users, json.dumps({'id': team_id}))
+        return _handle(T.list_team_users_dict, {'id': team_id})
 
 class TeamUsersAddView(APIView):
     def post(self, request, team_id):
         body = {'id': team_id, 'users': request.data.get('users', [])}
-        return _handle(T.add_users_to_team, json.dumps(body))
+        return _handle(T.add_users_to_team_dict, body)
 
 class TeamUsersRemoveView(APIView):
     def post(self, request, team_id):
         body = {'id': team_id, 'users': request.data.get('users', [])}
-        return _handle(T.remove_users_from_team, json.dumps(body))
+        return _handle(T.remove_users_from_team_dict, body)
 
 # Boards View
 class BoardsCreateView(APIView):
     def post(self, request):
-        return _handle(B.create_board, json.dumps(request.data))
+        return _handle(B.create_board_dict, request.data)
 
 class TeamOpenBoardsView(APIView):
+    @_conditional(BOARDS)
     def get(self, request, team_id):
-        return _handle(B.list_boards, json.dumps({'id': team_id}))
+        body = dict(request.query_params.dict(), id=team_id)
+        return _handle(B.list_boards_dict, body)
 
 class BoardCloseView(APIView):
     def post(self, request, board_id):
-        return _handle(B.close_board, json.dumps({'id': board_id}))
+        return _handle(B.close_board_dict, {'id': board_id})
 
 class BoardAddTaskView(APIView):
     def post(self, request, board_id):
         body = dict(request.data)
         body['board_id'] = board_id
-        return _handle(B.add_task, json.dumps(body))
+        return _handle(B.add_task_dict, body)
+
+class BoardAddTasksView(APIView):
+    def post(self, request, board_id):
+        items = request.data if isinstance(request.data, list) else request.data.get('tasks')
+        body = {'board_id': board_id, 'tasks': items}
+        return _handle(B.add_tasks_dict, body)
 
 class TaskStatusView(APIView):
     def patch(self, request, task_id):
         body = {'id': task_id, 'status': request.data.get('status')}
-        return _handle(B.update_task_status, json.dumps(body))
+        return _handle(B.update_task_status_dict, body)
+
+def _encode_text(lines):
+    """Join ``lines`` with newlines and encode them in chunks of about STREAM_CHUNK bytes."""
+    buf = []
+    size = 0
+    for n, line in enumerate(lines):
+        buf.append(('\n' if n else '') + line)
+        size += len(line) + 1
+        if size >= STREAM_CHUNK:
+            yield ''.join(buf).encode('utf-8')
+            buf.clear()
+            size = 0
+    if buf:
+        yield ''.join(buf).encode('utf-8')
 
 class BoardExportView(APIView):
+    # Returns the queued job at once (202); ?wait=1 exports synchronously
+    # and returns {"out_file": ...} as before; ?stream=1 sends the report as
+    # the response body instead of writing it to out/.
     def post(self, request, board_id):
-        return _handle(B.export_board, json.dumps({'id': board_id}))
+        if request.query_params.get('stream') in ('1', 'true'):
+            try:
+                fname, lines = B.stream_export({'id': board_id})
+            except NotFound as e:
+                return Response({'error': str(e)}, status=status.HTTP_404_NOT_FOUND)
+            response = StreamingHttpResponse(_encode_text(lines), content_type='text/plain; charset=utf-8')
+            response['Content-Disposition'] = f'attachment; filename="{fname}"'
+            return response
+        if request.query_params.get('wait') in ('1', 'true'):
+            return _handle(B.export_board_dict, {'id': board_id})
+        response = _handle(B.start_export_dict, {'id': board_id})
+        if response.status_code == status.HTTP_200_OK:
+            response.status_code = status.HTTP_202_ACCEPTED
+        return response
+
+class TeamExportView(APIView):
+    # All boards of the team, as a job like BoardExportView; ?zip=1 writes one
+    # archive instead of a file per board, ?wait=1 exports synchronously.
+    def post(self, request, team_id):
+        body = {'id': team_id, 'zip': request.query_params.get('zip') in ('1', 'true')}
+        if request.query_params.get('wait') in ('1', 'true'):
+            return _handle(B.export_team_dict, body)
+        response = _handle(B.start_team_export_dict, body)
+        if response.status_code == status.HTTP_200_OK:
+            response.status_code = status.HTTP_202_ACCEPTED
+        return response
+
+class ExportJobView(APIView):
+    def get(self, request, job_id):
+        return _handle(B.export_status_dict, {'id': job_id})
+
+class CacheStatsView(APIView):
+    def get(self, request):
+        return Response(response_cache.stats())
+
+class StorageStatsView(APIView):
+    def get(self, request):
+        return Response(metrics.snapshot())
+
+class MetricsView(View):
+    # A plain Django view: Prometheus text is not one of DRF's renderers, so
+    # content negotiation would refuse scrapers that only accept text/plain.
+    def get(self, request):
+        return HttpResponse(metrics.render(), content_type=metrics.CONTENT_TYPE)
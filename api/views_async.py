@@ -0,0 +1,237 @@
+"""Async-native versions of the views in ``views`` (``settings.API_ASYNC_VIEWS``).
+
+Same URLs, request bodies and responses. Request bodies are JSON. Controller
+calls run on the storage_async thread pools, so under an ASGI server a
+request waiting for a file or a table lock holds no thread of its own and
+one worker can keep thousands of requests in flight. Under WSGI every async
+view is run through an event loop per request; keep the DRF views there.
+"""
+import asyncio
+import functools
+
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+
+from .exceptions import BadRequest, NotFound, Conflict
+from .storage_async import AsyncTable, run_read, run_write
+from .storage_formats import dumps_json, loads_json
+from .views import (
+    U, T, B, USERS, TEAMS, BOARDS, STREAM_CONTENT_TYPES,
+    _encode_stream, _encode_text, _etag, _last_modified,
+)
+from . import metrics, response_cache
+
+ERROR_STATUS = {BadRequest: 400, NotFound: 404, Conflict: 409}
+
+
+def _json(payload, status: int = 200) -> HttpResponse:
+    return HttpResponse(dumps_json(payload), status=status, content_type='application/json')
+
+
+def _body(request):
+    if not request.body:
+        return {}
+    try:
+        return loads_json(request.body)
+    except ValueError:
+        raise BadRequest('request body must be JSON') from None
+
+
+def _object(request) -> dict:
+    data = _body(request)
+    if not isinstance(data, dict):
+        raise BadRequest('request body must be a JSON object')
+    return data
+
+
+def _flag(request, name: str) -> bool:
+    return request.GET.get(name) in ('1', 'true')
+
+
+async def _read(fn, data, status: int = 200) -> HttpResponse:
+    return _json(await run_read(fn, data), status)
+
+
+async def _write(fn, data, status: int = 200) -> HttpResponse:
+    return _json(await run_write(fn, data), status)
+
+
+async def _aiter(chunks):
+    """Pull ``chunks`` from a blocking iterator on the read pool."""
+    it = iter(chunks)
+    while (chunk := await run_read(next, it, None)) is not None:
+        yield chunk
+
+
+async def _stream(fn, request) -> HttpResponse:
+    params = request.GET.dict()
+    mode = params.pop('stream')
+    if mode not in STREAM_CONTENT_TYPES:
+        raise BadRequest('stream must be json or ndjson')
+    items = await run_read(fn, params)
+    return StreamingHttpResponse(_aiter(_encode_stream(items, mode)), content_type=STREAM_CONTENT_TYPES[mode])
+
+
+# Conditional GET as in views._conditional; the table versions are read on
+# the read pool.
+def _conditional(*tables):
+    tables = [AsyncTable(t) for t in tables]
+
+    def decorate(method):
+        @functools.wraps(method)
+        async def wrapper(self, request, *args, **kwargs):
+            versions = await asyncio.gather(*(t.version() for t in tables))
+            etag = quote_etag(_etag(versions))
+            modified = _last_modified(versions)
+            modified = int(modified.timestamp()) if modified else None
+            response = get_conditional_response(request, etag=etag, last_modified=modified)
+            if response is None:
+                response = await method(self, request, *args, **kwargs)
+            if modified and not response.has_header('Last-Modified'):
+                response.headers['Last-Modified'] = http_date(modified)
+            response.headers.setdefault('ETag', etag)
+            return response
+        return wrapper
+    return decorate
+
+
+class AsyncAPIView(View):
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # Exempt from CSRF like DRF's APIView; the API has no session auth.
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            return await super().dispatch(request, *args, **kwargs)
+        except (BadRequest, NotFound, Conflict) as e:
+            return _json({'error': str(e)}, ERROR_STATUS[type(e)])
+
+
+# Users View
+class UsersView(AsyncAPIView):
+    @_conditional(USERS)
+    async def get(self, request):
+        if 'stream' in request.GET:
+            return await _stream(U.stream_users, request)
+        return await _read(U.list_users_dict, request.GET.dict())
+    async def post(self, request):
+        return await _write(U.create_user_dict, _object(request))
+
+class UsersBulkView(AsyncAPIView):
+    async def post(self, request):
+        data = _body(request)
+        items = data if isinstance(data, list) else data.get('users') if isinstance(data, dict) else None
+        return await _write(U.create_users_dict, {'users': items})
+
+class UserDetailView(AsyncAPIView):
+    @_conditional(USERS)
+    async def get(self, request, user_id):
+        return await _read(U.describe_user_dict, {'id': user_id})
+    async def patch(self, request, user_id):
+        return await _write(U.update_user_dict, {'id': user_id, 'user': _object(request)})
+
+class UserTeamsView(AsyncAPIView):
+    @_conditional(TEAMS)
+    async def get(self, request, user_id):
+        return await _read(U.get_user_teams_dict, {'id': user_id})
+
+# Teams View
+class TeamsView(AsyncAPIView):
+    @_conditional(TEAMS)
+    async def get(self, request):
+        if 'stream' in request.GET:
+            return await _stream(T.stream_teams, request)
+        return await _read(T.list_teams_dict, request.GET.dict())
+    async def post(self, request):
+        return await _write(T.create_team_dict, _object(request))
+
+class TeamDetailView(AsyncAPIView):
+    @_conditional(TEAMS)
+    async def get(self, request, team_id):
+        return await _read(T.describe_team_dict, {'id': team_id})
+    async def patch(self, request, team_id):
+        return await _write(T.update_team_dict, {'id': team_id, 'team': _object(request)})
+
+class TeamUsersView(AsyncAPIView):
+    @_conditional(TEAMS, USERS)
+    async def get(self, request, team_id):
+        return await _read(T.list_team_users_dict, {'id': team_id})
+
+class TeamUsersAddView(AsyncAPIView):
+    async def post(self, request, team_id):
+        body = {'id': team_id, 'users': _object(request).get('users', [])}
+        return await _write(T.add_users_to_team_dict, body)
+
+class TeamUsersRemoveView(AsyncAPIView):
+    async def post(self, request, team_id):
+        body = {'id': team_id, 'users': _object(request).get('users', [])}
+        return await _write(T.remove_users_from_team_dict, body)
+
+# Boards View
+class BoardsCreateView(AsyncAPIView):
+    async def post(self, request):
+        return await _write(B.create_board_dict, _object(request))
+
+class TeamOpenBoardsView(AsyncAPIView):
+    @_conditional(BOARDS)
+    async def get(self, request, team_id):
+        return await _read(B.list_boards_dict, dict(request.GET.dict(), id=team_id))
+
+class BoardCloseView(AsyncAPIView):
+    async def post(self, request, board_id):
+        return await _write(B.close_board_dict, {'id': board_id})
+
+class BoardAddTaskView(AsyncAPIView):
+    async def post(self, request, board_id):
+        return await _write(B.add_task_dict, dict(_object(request), board_id=board_id))
+
+class BoardAddTasksView(AsyncAPIView):
+    async def post(self, request, board_id):
+        data = _body(request)
+        items = data if isinstance(data, list) else data.get('tasks') if isinstance(data, dict) else None
+        return await _write(B.add_tasks_dict, {'board_id': board_id, 'tasks': items})
+
+class TaskStatusView(AsyncAPIView):
+    async def patch(self, request, task_id):
+        body = {'id': task_id, 'status': _object(request).get('status')}
+        return await _write(B.update_task_status_dict, body)
+
+class BoardExportView(AsyncAPIView):
+    # See views.BoardExportView for ?stream=1 and ?wait=1.
+    async def post(self, request, board_id):
+        if _flag(request, 'stream'):
+            fname, lines = await run_read(B.stream_export, {'id': board_id})
+            response = StreamingHttpResponse(_aiter(_encode_text(lines)), content_type='text/plain; charset=utf-8')
+            response['Content-Disposition'] = f'attachment; filename="{fname}"'
+            return response
+        if _flag(request, 'wait'):
+            return await _write(B.export_board_dict, {'id': board_id})
+        return await _read(B.start_export_dict, {'id': board_id}, status=202)
+
+class TeamExportView(AsyncAPIView):
+    async def post(self, request, team_id):
+        body = {'id': team_id, 'zip': _flag(request, 'zip')}
+        if _flag(request, 'wait'):
+            return await _write(B.export_team_dict, body)
+        return await _read(B.start_team_export_dict, body, status=202)
+
+class ExportJobView(AsyncAPIView):
+    async def get(self, request, job_id):
+        return await _read(B.export_status_dict, {'id': job_id})
+
+class CacheStatsView(AsyncAPIView):
+    async def get(self, request):
+        return _json(response_cache.stats())
+
+class StorageStatsView(AsyncAPIView):
+    async def get(self, request):
+        return _json(metrics.snapshot())
+
+class MetricsView(AsyncAPIView):
+    async def get(self, request):
+        # Counters and stats only; nothing here blocks on files or locks.
+        return HttpResponse(metrics.render(), content_type=metrics.CONTENT_TYPE)
@@ -43,6 +43,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'api.metrics.RequestMetricsMiddleware',
+    'api.profiling.ProfilingMiddleware',  # off unless PROFILE_REQUESTS
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -81,6 +83,85 @@ DATABASES = {
     }
 }
 
+# Application data storage (api/storage.py)
+# 'json' keeps each table in a file under db/; 'sqlite' stores them in
+# normalized SQL tables inside STORAGE_SQLITE_PATH (default: the
+# DATABASES['default'] file). The tables under db/ are copied into a new
+# SQLite database on first use and renamed to *.imported.
+STORAGE_BACKEND = 'json'
+STORAGE_SQLITE_PATH = None
+# Keep parsed tables in memory and only reparse a file when its stat
+# signature shows that another process has written it.
+STORAGE_CACHE = True
+# 'file' rewrites a table's JSON file on every change; 'wal' appends each
+# change to '<table>.log' and folds it into the JSON file once the log grows
+# past STORAGE_WAL_COMPACT_BYTES.
+STORAGE_ENGINE = 'file'
+# Store each board in its own file under db/boards/ (json backend only).
+STORAGE_SHARD_BOARDS = False
+STORAGE_WAL_COMPACT_BYTES = 4 * 1024 * 1024
+# Encoding of table files: 'json' (compact; uses orjson when installed),
+# 'json-pretty' (indent=2) or 'msgpack' (needs msgpack). Run
+# `manage.py convert_storage` after switching to or from msgpack.
+STORAGE_FORMAT = 'json'
+# fsync table files (and log appends) before a write is acknowledged.
+STORAGE_FSYNC = False
+# Group commit for boards.json: task writes from concurrent threads of one
+# worker arriving within this many milliseconds share one fsynced write of at
+# most STORAGE_GROUP_COMMIT_MAX changes. 0 disables it.
+STORAGE_GROUP_COMMIT_MS = 0
+STORAGE_GROUP_COMMIT_MAX = 64
+
+# Response cache for describe/list endpoints (api/response_cache.py): the
+# CACHES alias to store results in, or None to disable it. Entries are keyed
+# by per-table generations that every write bumps; with several worker
+# processes use a cache they share, such as 'responses' below or Redis.
+RESPONSE_CACHE = None
+RESPONSE_CACHE_TTL = 300
+
+# Board exports run as background jobs on a pool of EXPORT_WORKERS threads per
+# worker process, and team exports render their boards on a second pool of
+# that size; the last EXPORT_JOBS_KEEP job records are kept for polling.
+EXPORT_WORKERS = 2
+EXPORT_JOBS_KEEP = 1000
+
+# Serve the API from the async-native views (api/views_async.py); use with an
+# ASGI server such as `uvicorn factwise_python_project.asgi:application`.
+# Their storage calls run on STORAGE_ASYNC_READERS / STORAGE_ASYNC_WRITERS threads.
+API_ASYNC_VIEWS = False
+STORAGE_ASYNC_READERS = 32
+STORAGE_ASYNC_WRITERS = 4
+
+# Per-request Server-Timing header and structured log (api/profiling.py). With
+# PROFILE_SLOW_MS set, every request is profiled (PROFILER: 'cprofile' or
+# 'pyinstrument') and those slower than that are saved under PROFILE_DIR.
+PROFILE_REQUESTS = False
+PROFILE_SLOW_MS = None
+PROFILER = 'cprofile'
+PROFILE_DIR = BASE_DIR / 'profiles'
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'api.profiling': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'responses': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache' / 'responses',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -14,11 +14,20 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path,include
 
+# The same view flavour as the routes in api.urls.
+if getattr(settings, 'API_ASYNC_VIEWS', False):
+    from api.views_async import MetricsView
+else:
+    from api.views import MetricsView
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('api.urls')),
+    # Prometheus scrape target: this worker's request, table and export metrics
+    path('metrics', MetricsView.as_view()),
 
 ]